@@ -14,7 +14,8 @@ try:
     )
     from data_manager import (
         inicializar_inventario, inicializar_movimientos, 
-        inicializar_promociones, inicializar_ventas
+        inicializar_promociones, inicializar_ventas,
+        inicializar_venta_items, inicializar_devoluciones
     )
     from ui_components import mostrar_header, mostrar_user_info, mostrar_logo, mostrar_footer
 except ImportError as e:
@@ -56,7 +57,9 @@ inicializar_sesion()
 inicializar_inventario()
 inicializar_movimientos()
 inicializar_promociones()
-inicializar_ventas()  
+inicializar_ventas()
+inicializar_venta_items()
+inicializar_devoluciones()
 
 # Inicializar menú principal si no existe
 if "menu_principal" not in st.session_state:
@@ -2,6 +2,7 @@
 Archivo de configuración para Q'Bodega
 Contiene constantes y configuraciones globales
 """
+import os
 
 # Configuración de la aplicación
 APP_CONFIG = {
@@ -56,6 +57,13 @@ CATEGORIAS = [
 # Tipos de movimientos
 TIPOS_MOVIMIENTO = ["Entrada", "Salida", "Ajuste", "Devolución"]
 
+# Tipos y estados de promociones
+TIPOS_PROMOCION = ["2x1", "porcentaje", "monto fijo"]
+ESTADOS_PROMOCION = ["activa", "inactiva"]
+
+# Métodos de pago
+METODOS_PAGO = ["efectivo", "tarjeta", "yape", "plin"]
+
 # Umbrales de stock
 STOCK_BAJO = 5
 STOCK_MEDIO = 15
@@ -65,3 +73,27 @@ LOGO_URL = "https://raw.githubusercontent.com/JairAmado08/Q-Bodega/main/images/Q
 
 # Logo de SoftSolutions
 SOFTSOLUTIONS_LOGO_URL = "https://raw.githubusercontent.com/JairAmado08/Q-Bodega/main/images/SoftSolutions.png"
+
+# Persistencia (SQLite en modo WAL)
+DB_PATH = os.environ.get("QBODEGA_DB_PATH", "qbodega.db")
+
+# Journal de mutaciones (append-only) e instantáneas periódicas a SQLite
+JOURNAL_PATH = os.environ.get("QBODEGA_JOURNAL_PATH", "qbodega.journal")
+JOURNAL_FSYNC = True
+SNAPSHOT_INTERVALO = 60  # segundos entre instantáneas
+SNAPSHOT_MAX_REGISTROS = 500  # fuerza una instantánea al acumular este número de registros
+
+# Buffer de inserciones: filas acumuladas antes de consolidar con pd.concat
+BUFFER_INSERCIONES = 256
+
+# Dígitos mínimos de los IDs generados (P001); crecen solos al pasar de 999
+ANCHO_ID = 3
+
+# Carritos con al menos estas líneas se calculan con arreglos NumPy (ventas mayoristas)
+UMBRAL_CARRITO_VECTORIZADO = 64
+
+# Tokens de idempotencia recordados (LRU) para rechazar envíos repetidos de una venta
+MAX_TOKENS_IDEMPOTENCIA = 1024
+
+# Máximo de escrituras que el hilo escritor aplica por lote (una sola escritura al journal)
+LOTE_ESCRITURAS = 32
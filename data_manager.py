@@ -1,149 +1,1111 @@
 """
 Módulo de gestión de datos e inicialización
+Las tablas se mantienen en memoria en un store compartido por todas las
+sesiones del proceso. Cada escritura se agrega al journal (journal.py) y se
+vuelca periódicamente a SQLite (database.py) como instantánea.
 """
+import ast
+import functools
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import pandas as pd
+import database
+import journal
+from config import BUFFER_INSERCIONES, ANCHO_ID, MAX_TOKENS_IDEMPOTENCIA, LOTE_ESCRITURAS
+from database import TABLAS
+from schema import (
+    ESQUEMAS, columnas as columnas_de, aplicar_esquema, tabla_vacia, unir_categorias,
+    convertir_valor
+)
+
+# Las instantáneas de lectura son copias superficiales que dependen de
+# Copy-on-Write (siempre activo desde pandas 3; en pandas 2 hay que pedirlo)
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.options.mode.copy_on_write = True
+
+# Datos de ejemplo (se cargan solo la primera vez que se crea la base de datos)
+EJEMPLOS = {
+    "inventario": [
+        ["P001", "Inca Kola 1.5L", "Bebidas", 15, 6.50, "2024-01-15"],
+        ["P002", "Arroz Costeño 1kg", "Abarrotes secos", 25, 5.00, "2024-01-16"],
+        ["P003", "Leche Gloria tarro", "Lácteos y derivados", 18, 4.80, "2024-01-17"],
+        ["P004", "Pan francés (unidad)", "Panadería y repostería", 50, 0.40, "2024-01-18"],
+        ["P005", "Atún Florida 170g", "Enlatados y conservas", 2, 6.00, "2024-01-19"]
+    ],
+    "movimientos": [
+        ["M001", "Entrada", "P001", "Inca Kola 1.5L", 20, "2024-01-15", "admin", "Compra inicial"],
+        ["M002", "Salida", "P001", "Inca Kola 1.5L", 5, "2024-01-16", "carlos.rodriguez", "Venta"],
+        ["M003", "Entrada", "P002", "Arroz Costeño 1kg", 30, "2024-01-16", "maria.gonzalez", "Reposición"],
+        ["M004", "Salida", "P002", "Arroz Costeño 1kg", 5, "2024-01-17", "jose.martinez", "Venta"],
+        ["M005", "Ajuste", "P005", "Atún Florida 170g", -3, "2024-01-19", "admin", "Producto vencido"]
+    ],
+    "promociones": [
+        ["PR001", "2x1 en Gaseosas", "2x1", 0, "P001", "Inca Kola 1.5L",
+         "2025-11-01", "2025-11-30", "activa"],
+        ["PR002", "20% OFF en Lácteos", "porcentaje", 20, "P003", "Leche Gloria tarro",
+         "2025-11-10", "2025-11-25", "activa"],
+        ["PR003", "Descuento S/2 en Pan", "monto fijo", 0.20, "P004", "Pan francés (unidad)",
+         "2025-11-15", "2025-11-20", "activa"],
+        ["PR004", "Combo Arroz", "porcentaje", 15, "P002", "Arroz Costeño 1kg",
+         "2025-10-01", "2025-10-31", "inactiva"]
+    ],
+    "ventas": [
+        ["V001", "2025-11-16 10:30", 13.00, 6.50, 6.50, "efectivo", "PR001"],
+        ["V002", "2025-11-16 14:15", 4.80, 0.96, 3.84, "tarjeta", "PR002"],
+    ],
+    "venta_items": [
+        ["V001-1", "V001", "P001", 2, 6.50, 6.50, 0],
+        ["V002-1", "V002", "P003", 1, 4.80, 0.96, 0]
+    ],
+    "devoluciones": []
+}
+
+# Prefijo de los IDs secuenciales de cada tabla
+PREFIJOS_ID = {
+    "inventario": "P",
+    "movimientos": "M",
+    "promociones": "PR",
+    "ventas": "V",
+    "devoluciones": "DEV"
+}
+
+@st.cache_resource
+def _obtener_store():
+    """
+    Store único del proceso: todas las sesiones leen las mismas tablas.
+    Al crearse recupera la última instantánea más la cola del journal.
+
+    Returns:
+        dict: {"lock": RLock de escritura (excluye a otros escritores),
+               "lectura": RLock de los datos en memoria (lo toman quienes
+                   modifican y quienes leen estados derivados),
+               "tablas": {nombre: DataFrame},
+               "pendientes": {nombre: list de tuplas aún no consolidadas},
+               "indices": {nombre: dict clave primaria -> posición de fila},
+               "secuencias": {nombre: último número de ID asignado},
+               "transaccion": transacción en curso o None,
+               "derivados": {nombre: estado derivado ya construido},
+               "tokens": OrderedDict LRU token de idempotencia -> resultado,
+               "cola": Queue de escrituras para el hilo escritor,
+               "escritor": hilo escritor (se inicia con la primera escritura),
+               "grupo": operaciones del lote en curso del escritor (group commit),
+                   cada una {"cambios", "deshacer"},
+               "publicadas": {nombre: instantánea inmutable para lecturas},
+               "sucias": tablas modificadas desde su última publicación}
+    """
+    journal.recuperar()
+    journal.iniciar_instantaneas()
+
+    return {
+        "lock": threading.RLock(),
+        "lectura": threading.RLock(),
+        "tablas": {},
+        "pendientes": {},
+        "indices": {},
+        "secuencias": {},
+        "transaccion": None,
+        "derivados": {},
+        "tokens": OrderedDict(),
+        "cola": queue.Queue(),
+        "escritor": None,
+        "grupo": None,
+        "publicadas": {},
+        "sucias": set()
+    }
+
+# Estados derivados (agregados, índices secundarios) mantenidos con cada escritura:
+# {nombre: (tabla, construir, aplicar)}
+_DERIVADOS = {}
+
+# Tabla vacía tipada de cada tabla, para notificar inserciones y eliminaciones
+_VACIAS = {}
+
+def _vacia(tabla):
+    """Tabla vacía con los tipos del esquema (se construye una sola vez por tabla)"""
+    if tabla not in _VACIAS:
+        _VACIAS[tabla] = tabla_vacia(tabla)
+    return _VACIAS[tabla]
+
+def _tablas():
+    """Retorna el diccionario de tablas del store compartido"""
+    return _obtener_store()["tablas"]
+
+def _unir(tabla, actual, pendientes):
+    """
+    DataFrame con las tuplas pendientes agregadas al final (un único pd.concat)
+
+    Args:
+        tabla: Nombre de la tabla
+        actual: DataFrame tipado de la tabla
+        pendientes: list de tuplas ya convertidas
+
+    Returns:
+        DataFrame: Tabla completa (el mismo objeto si no hay pendientes)
+    """
+    if not pendientes:
+        return actual
+
+    nuevo = aplicar_esquema(
+        pd.DataFrame(pendientes, columns=columnas_de(tabla)), tabla, referencia=actual
+    )
+    if actual.empty:
+        return nuevo
+
+    actual, nuevo = unir_categorias(actual, nuevo, tabla)
+    return pd.concat([actual, nuevo], ignore_index=True)
+
+def _consolidar(tabla):
+    """
+    Vuelca el buffer de inserciones pendientes de una tabla en su DataFrame
+    con un único pd.concat
+
+    Args:
+        tabla: Nombre de la tabla
+    """
+    store = _obtener_store()
+    pendientes = store["pendientes"].get(tabla)
+    if not pendientes:
+        return
+
+    with bloqueo_lectura():
+        pendientes = store["pendientes"][tabla]
+        if not pendientes:
+            return
+
+        store["tablas"][tabla] = _unir(tabla, store["tablas"][tabla], pendientes)
+        store["pendientes"][tabla] = []
+
+def _tabla(tabla):
+    """
+    Retorna la vista consolidada de una tabla (DataFrame + buffer pendiente)
+
+    Args:
+        tabla: Nombre de la tabla
+
+    Returns:
+        DataFrame: Tabla completa
+    """
+    _consolidar(tabla)
+    return _tablas()[tabla]
+
+def _indice(tabla):
+    """
+    Índice hash de clave primaria -> posición de la fila en la tabla
+    consolidada. Se construye en O(n) solo cuando fue invalidado; las
+    inserciones y actualizaciones lo mantienen al día.
+
+    Args:
+        tabla: Nombre de la tabla
+
+    Returns:
+        dict: {clave primaria: posición}
+    """
+    indices = _obtener_store()["indices"]
+    indice = indices.get(tabla)
+    if indice is None:
+        with bloqueo_lectura():
+            indice = indices.get(tabla)
+            if indice is None:
+                claves = _tabla(tabla)[TABLAS[tabla]["clave"]]
+                indice = dict(zip(claves.tolist(), range(len(claves))))
+                indices[tabla] = indice
+    return indice
+
+def _invalidar_indice(tabla):
+    """Descarta el índice de clave primaria de una tabla (se reconstruye al usarse)"""
+    _obtener_store()["indices"][tabla] = None
+
+def registrar_derivado(nombre, tabla, construir, aplicar):
+    """
+    Registra un estado derivado de una tabla que se mantiene de forma
+    incremental con cada escritura (también al deshacer una transacción)
+
+    Args:
+        nombre: Nombre único del estado derivado
+        tabla: Tabla de la que se deriva
+        construir: Función (df) -> estado, para construirlo desde la tabla completa
+        aplicar: Función (estado, quitadas, agregadas) que lo actualiza en el
+            lugar; quitadas y agregadas son DataFrames con las filas que salen
+            y entran (una actualización es quitar la fila vieja y agregar la nueva)
+    """
+    _DERIVADOS[nombre] = (tabla, construir, aplicar)
+
+def obtener_derivado(nombre):
+    """
+    Retorna un estado derivado, construyéndolo la primera vez (O(n) una vez)
+
+    Args:
+        nombre: Nombre del estado derivado
+
+    Returns:
+        Estado devuelto por la función construir y mantenido desde entonces
+    """
+    derivados = _obtener_store()["derivados"]
+    if nombre not in derivados:
+        with bloqueo_lectura():
+            if nombre not in derivados:
+                tabla, construir, _ = _DERIVADOS[nombre]
+                derivados[nombre] = construir(_tabla(tabla))
+    return derivados[nombre]
+
+def reconstruir_derivado(nombre):
+    """
+    Vuelve a construir un estado derivado desde su tabla completa
+
+    Args:
+        nombre: Nombre del estado derivado
+
+    Returns:
+        Estado reconstruido
+    """
+    with bloqueo_lectura():
+        _obtener_store()["derivados"].pop(nombre, None)
+        return obtener_derivado(nombre)
+
+def _derivados_activos(tabla):
+    """Estados derivados de una tabla que ya fueron construidos: [(estado, aplicar)]"""
+    derivados = _obtener_store()["derivados"]
+    return [
+        (derivados[nombre], aplicar)
+        for nombre, (tabla_derivado, _, aplicar) in _DERIVADOS.items()
+        if tabla_derivado == tabla and nombre in derivados
+    ]
+
+def _notificar(tabla, quitadas, agregadas):
+    """Aplica a los estados derivados de una tabla las filas que salen y entran"""
+    for estado, aplicar in _derivados_activos(tabla):
+        aplicar(estado, quitadas, agregadas)
+
+def _descartar_derivados(tabla):
+    """Descarta los estados derivados de una tabla (se reconstruyen al usarse)"""
+    derivados = _obtener_store()["derivados"]
+    for nombre, (tabla_derivado, _, _) in _DERIVADOS.items():
+        if tabla_derivado == tabla:
+            derivados.pop(nombre, None)
+
+# Cuántas veces tiene tomado cada lock del store el hilo actual
+_hilo = threading.local()
+
+def _profundidad(nombre):
+    """Veces que el hilo actual tomó el lock `nombre` ("escritura" o "lectura")"""
+    return getattr(_hilo, nombre, 0)
+
+@contextmanager
+def _tomar(nombre, *locks):
+    """Toma los locks en orden y anota en el hilo actual que los tiene"""
+    for lock in locks:
+        lock.acquire()
+    setattr(_hilo, nombre, _profundidad(nombre) + 1)
+    try:
+        yield
+    finally:
+        setattr(_hilo, nombre, _profundidad(nombre) - 1)
+        for lock in reversed(locks):
+            lock.release()
+
+def bloqueo_escritura():
+    """
+    Lock de escritura del store compartido. Las operaciones que leen y luego
+    modifican (p. ej. validar stock y descontarlo) deben ejecutarse dentro de
+    `with bloqueo_escritura():` para que sean atómicas entre sesiones.
+    Incluye el lock de lectura.
+
+    Returns:
+        Context manager reentrante
+    """
+    store = _obtener_store()
+    return _tomar("escritura", store["lock"], store["lectura"])
+
+def bloqueo_lectura():
+    """
+    Lock de lectura de los datos en memoria: para leer de forma consistente
+    un estado derivado que las escrituras modifican en el lugar. El escritor
+    lo conserva hasta que su lote quedó en el journal, así que nunca se ven
+    cambios que aún se pueden deshacer. Dentro de él no se debe escribir ni
+    tomar bloqueo_escritura().
+
+    Returns:
+        Context manager reentrante
+    """
+    return _tomar("lectura", _obtener_store()["lectura"])
+
+def _lee_en_vivo(store):
+    """True si el hilo actual debe leer las tablas vivas (escritor o con un lock tomado)"""
+    return _en_escritor(store) or _profundidad("escritura") > 0 or _profundidad("lectura") > 0
+
+@contextmanager
+def transaccion():
+    """
+    Agrupa varias escrituras en una transacción todo o nada. Dentro del
+    bloque las escrituras se aplican en memoria y se acumulan; al salir se
+    registran en el journal como un único registro. Si ocurre una excepción
+    se deshacen en memoria y no se escribe nada. Las transacciones anidadas
+    se unen a la externa.
+
+    Uso:
+        with transaccion():
+            actualizar_filas(...)
+            insertar_filas(...)
+    """
+    store = _obtener_store()
+
+    with bloqueo_escritura():
+        if store["transaccion"] is not None:
+            yield
+            return
+
+        actual = {"cambios": [], "deshacer": [], "secuencias": dict(store["secuencias"])}
+        store["transaccion"] = actual
+        try:
+            yield
+            if _en_escritor(store):
+                # Se escribe al journal con el resto del lote; si esa escritura
+                # falla el escritor usa "deshacer" para revertirla
+                store["grupo"].append(actual)
+            else:
+                journal.registrar_transaccion(actual["cambios"])
+        except BaseException:
+            for accion in reversed(actual["deshacer"]):
+                accion()
+            store["secuencias"].clear()
+            store["secuencias"].update(actual["secuencias"])
+            raise
+        finally:
+            store["transaccion"] = None
+            if not _en_escritor(store):
+                _publicar_sucias()
+
+def _registrar(cambios, deshacer=None):
+    """
+    Registra cambios en el journal, o en la transacción en curso si la hay
+
+    Args:
+        cambios: list de tuplas (operacion, tabla, dato)
+        deshacer: Función que revierte el cambio en memoria (se usa si la
+            transacción o el lote del escritor no llegan al journal)
+    """
+    store = _obtener_store()
+    actual = store["transaccion"]
+    if actual is None:
+        if _en_escritor(store):
+            # Se escribe al journal junto con el resto del lote
+            store["grupo"].append({
+                "cambios": list(cambios),
+                "deshacer": [deshacer] if deshacer is not None else []
+            })
+        else:
+            journal.registrar_lote(cambios)
+            _publicar_sucias()
+        return
+
+    actual["cambios"].extend(cambios)
+    if deshacer is not None:
+        actual["deshacer"].append(deshacer)
+
+# ----------------------------
+# Escritor único e instantáneas de lectura
+# ----------------------------
+
+def _en_escritor(store):
+    """True si el hilo actual es el hilo escritor"""
+    return threading.current_thread() is store["escritor"]
+
+def escritura(funcion):
+    """
+    Decorador de las operaciones de escritura de los módulos CRUD: la
+    llamada se encola y la aplica el hilo escritor único, en lotes; el
+    llamador espera su resultado (y sus excepciones). Las llamadas anidadas
+    (desde el propio escritor o con el lock ya tomado) se ejecutan directo.
+    """
+    @functools.wraps(funcion)
+    def encolar(*args, **kwargs):
+        store = _obtener_store()
+        if _en_escritor(store) or _profundidad("escritura") > 0:
+            return funcion(*args, **kwargs)
+
+        futuro = Future()
+        store["cola"].put((funcion, args, kwargs, get_script_run_ctx(), futuro))
+        _iniciar_escritor(store)
+        return futuro.result()
+
+    return encolar
+
+def _iniciar_escritor(store):
+    """Inicia (una sola vez) el hilo escritor"""
+    if store["escritor"] is not None:
+        return
+
+    with store["lock"]:
+        if store["escritor"] is None:
+            hilo = threading.Thread(
+                target=_bucle_escritor, args=(store,), name="escritor", daemon=True
+            )
+            store["escritor"] = hilo
+            hilo.start()
+
+def _bucle_escritor(store):
+    """
+    Toma hasta LOTE_ESCRITURAS escrituras de la cola, las aplica una a una,
+    registra todos sus cambios en el journal con una sola escritura (group
+    commit), publica las instantáneas y recién entonces responde a cada
+    llamador. Cada operación se aplica como una transacción: si lanza una
+    excepción se deshace solo ella y su llamador recibe el error. Si el
+    journal falla se deshace el lote completo en memoria: nunca se publica
+    un estado que no quedó en el journal.
+
+    Mientras escribe a disco conserva ambos locks: los estados derivados
+    (KPIs, rankings, motor de promociones) se modifican en el lugar, así que
+    quien los lee espera al lote. Las lecturas de tablas (get_*, obtener_fila)
+    van a las instantáneas publicadas y no esperan.
+    """
+    cola = store["cola"]
+    while True:
+        lote = [cola.get()]
+        while len(lote) < LOTE_ESCRITURAS:
+            try:
+                lote.append(cola.get_nowait())
+            except queue.Empty:
+                break
+
+        resultados = []
+        fallo = None
+        # Los estados derivados se leen en vivo bajo el lock de lectura: se
+        # conserva hasta que el lote quedó en el journal (o se deshizo)
+        with store["lock"], store["lectura"]:
+            store["grupo"] = []
+            secuencias = dict(store["secuencias"])
+            tokens = OrderedDict(store["tokens"])
+            for funcion, args, kwargs, contexto, futuro in lote:
+                # Los mensajes (st.error, ...) y session_state son los de la sesión que llamó
+                add_script_run_ctx(ctx=contexto)
+                try:
+                    # Cada operación es una transacción: si falla a medias
+                    # se deshace lo que alcanzó a hacer y no llega al journal
+                    with transaccion():
+                        valor = funcion(*args, **kwargs)
+                    resultados.append((futuro, valor, None))
+                except BaseException as error:
+                    resultados.append((futuro, None, error))
+
+            try:
+                journal.registrar_grupo([operacion["cambios"] for operacion in store["grupo"]])
+            except BaseException as error:
+                fallo = error
+
+            if fallo is not None:
+                for operacion in reversed(store["grupo"]):
+                    for accion in reversed(operacion["deshacer"]):
+                        accion()
+                store["secuencias"].clear()
+                store["secuencias"].update(secuencias)
+                store["tokens"].clear()
+                store["tokens"].update(tokens)
+                resultados = [(futuro, None, fallo) for futuro, _, _ in resultados]
+            store["grupo"] = None
+            _publicar_sucias()
+
+        for futuro, valor, error in resultados:
+            if error is None:
+                futuro.set_result(valor)
+            else:
+                futuro.set_exception(error)
+
+def _marcar_sucia(tabla):
+    """Anota que la instantánea publicada de una tabla quedó atrasada"""
+    _obtener_store()["sucias"].add(tabla)
+
+def _publicar_sucias():
+    """
+    Publica instantáneas nuevas de las tablas modificadas: la tabla tal
+    cual más una copia de su buffer de inserciones (O(buffer), sin
+    consolidar). Con Copy-on-Write la copia superficial es inmutable para
+    quien la lee: las escrituras posteriores copian los datos que tocan en
+    lugar de modificarla.
+    """
+    store = _obtener_store()
+    with bloqueo_lectura():
+        for tabla in list(store["sucias"]):
+            if tabla in store["tablas"]:
+                pendientes = list(store["pendientes"][tabla])
+                store["publicadas"][tabla] = {
+                    "tabla": store["tablas"][tabla].copy(deep=False),
+                    "pendientes": pendientes,
+                    "consolidada": None,
+                    # Índice vivo del momento: solo se le agregan claves nuevas
+                    # con posiciones >= "filas", que esta instantánea ignora
+                    "indice": store["indices"].get(tabla),
+                    "filas": len(store["tablas"][tabla]) + len(pendientes)
+                }
+        store["sucias"].clear()
+
+def _consolidada(tabla, publicada):
+    """
+    Tabla completa de una instantánea publicada. El buffer se consolida en
+    la propia instantánea la primera vez que alguien la lee, una sola vez
+    por publicación (si dos lectores lo hacen a la vez, el resultado es el mismo).
+    """
+    consolidada = publicada["consolidada"]
+    if consolidada is None:
+        consolidada = _unir(tabla, publicada["tabla"], publicada["pendientes"])
+        publicada["consolidada"] = consolidada
+    return consolidada
+
+def _publicada(tabla):
+    """Instantánea publicada de una tabla (se publica en ese momento si aún no hay)"""
+    store = _obtener_store()
+    publicada = store["publicadas"].get(tabla)
+    if publicada is None:
+        with bloqueo_lectura():
+            _marcar_sucia(tabla)
+            _publicar_sucias()
+            publicada = store["publicadas"][tabla]
+    return publicada
+
+def _posiciones_publicadas(tabla, publicada, claves):
+    """
+    Posiciones de las claves en una instantánea publicada. Usa el índice
+    vivo que había al publicarla (descartando posiciones agregadas después)
+    o, si estaba invalidado, uno propio construido una vez.
+    """
+    indice = publicada["indice"]
+    if indice is None:
+        llaves = _consolidada(tabla, publicada)[TABLAS[tabla]["clave"]]
+        indice = dict(zip(llaves.tolist(), range(len(llaves))))
+        publicada["indice"] = indice
+
+    filas = publicada["filas"]
+    posiciones = (indice.get(clave) for clave in claves)
+    return [posicion for posicion in posiciones if posicion is not None and posicion < filas]
+
+def _instantanea(tabla):
+    """
+    Última instantánea publicada de una tabla (sin lock). Se publica una
+    después de cada lote del escritor y de cada escritura hecha fuera de él.
+    El escritor (o quien tenga un lock del store) lee la tabla viva, con
+    sus propios cambios del lote en curso.
+
+    Args:
+        tabla: Nombre de la tabla
+
+    Returns:
+        DataFrame: Tabla completa, que no cambia mientras se lee
+    """
+    if _lee_en_vivo(_obtener_store()):
+        return _tabla(tabla)
+    return _consolidada(tabla, _publicada(tabla))
+
+def _inicializar_tabla(tabla):
+    """
+    Carga una tabla desde SQLite al store compartido, sembrando los datos
+    de ejemplo solo la primera vez
+
+    Args:
+        tabla: Nombre de la tabla
+    """
+    if tabla in _tablas():
+        return
+
+    with bloqueo_escritura():
+        if tabla in _tablas():
+            return
+
+        columnas = columnas_de(tabla)
+        df = database.cargar_tabla(tabla)
+
+        if database.obtener_meta(f"sembrado_{tabla}") is None:
+            if df.empty:
+                filas = _migrar_items_ventas() if tabla == "venta_items" else []
+                filas = filas or [dict(zip(columnas, fila)) for fila in EJEMPLOS[tabla]]
+                if filas:
+                    database.guardar_filas(tabla, filas)
+                    df = database.cargar_tabla(tabla)
+            database.guardar_meta(f"sembrado_{tabla}", 1)
+
+        _tablas()[tabla] = aplicar_esquema(df, tabla)
+        _obtener_store()["pendientes"][tabla] = []
+        _invalidar_indice(tabla)
+        _descartar_derivados(tabla)
+
+def _migrar_items_ventas():
+    """
+    Convierte la antigua columna de texto ventas.Items (str de una lista de
+    dicts) en filas de venta_items. Solo aplica a bases de datos creadas
+    antes de existir la tabla venta_items.
+
+    Returns:
+        list: dicts de filas de venta_items (vacía si no hay nada que migrar)
+    """
+    heredados = database.leer_columna_heredada("ventas", "Items")
+    if not heredados:
+        return []
+
+    precios = database.cargar_tabla("inventario").set_index("ID")["Precio"].to_dict()
+    filas = []
+    for venta_id, texto in heredados:
+        try:
+            items = ast.literal_eval(texto)
+        except (ValueError, SyntaxError):
+            continue
+
+        for numero, item in enumerate(items, start=1):
+            filas.append({
+                "ID_Item": f"{venta_id}-{numero}",
+                "ID_Venta": venta_id,
+                "Producto_ID": item["producto_id"],
+                "Cantidad": item["cantidad"],
+                "Precio_Unitario": item.get("precio_unitario", precios.get(item["producto_id"])),
+                "Descuento": 0.0,
+                "Devuelto": 0
+            })
+    return filas
 
 def inicializar_inventario():
     """Inicializa el DataFrame de inventario con datos de ejemplo"""
-    if "inventario" not in st.session_state:
-        st.session_state.inventario = pd.DataFrame(
-            columns=["ID", "Nombre", "Categoría", "Cantidad", "Precio", "Fecha_Agregado"]
-        )
-        
-        # Datos de ejemplo
-        ejemplos = [
-            ["P001", "Inca Kola 1.5L", "Bebidas", 15, 6.50, "2024-01-15"],
-            ["P002", "Arroz Costeño 1kg", "Abarrotes secos", 25, 5.00, "2024-01-16"],
-            ["P003", "Leche Gloria tarro", "Lácteos y derivados", 18, 4.80, "2024-01-17"],
-            ["P004", "Pan francés (unidad)", "Panadería y repostería", 50, 0.40, "2024-01-18"],
-            ["P005", "Atún Florida 170g", "Enlatados y conservas", 2, 6.00, "2024-01-19"]
-        ]
-        
-        for ejemplo in ejemplos:
-            nuevo = pd.DataFrame(
-                [ejemplo], 
-                columns=["ID", "Nombre", "Categoría", "Cantidad", "Precio", "Fecha_Agregado"]
-            )
-            st.session_state.inventario = pd.concat(
-                [st.session_state.inventario, nuevo], 
-                ignore_index=True
-            )
+    _inicializar_tabla("inventario")
 
 def inicializar_movimientos():
     """Inicializa el DataFrame de movimientos con datos de ejemplo"""
-    if "movimientos" not in st.session_state:
-        st.session_state.movimientos = pd.DataFrame(
-            columns=["ID_Movimiento", "Tipo", "Producto_ID", "Producto_Nombre", 
-                    "Cantidad", "Fecha", "Usuario", "Observaciones"]
-        )
-        
-        # Datos de ejemplo de movimientos
-        movimientos_ejemplo = [
-            ["M001", "Entrada", "P001", "Inca Kola 1.5L", 20, "2024-01-15", "admin", "Compra inicial"],
-            ["M002", "Salida", "P001", "Inca Kola 1.5L", 5, "2024-01-16", "carlos.rodriguez", "Venta"],
-            ["M003", "Entrada", "P002", "Arroz Costeño 1kg", 30, "2024-01-16", "maria.gonzalez", "Reposición"],
-            ["M004", "Salida", "P002", "Arroz Costeño 1kg", 5, "2024-01-17", "jose.martinez", "Venta"],
-            ["M005", "Ajuste", "P005", "Atún Florida 170g", -3, "2024-01-19", "admin", "Producto vencido"]
-        ]
-        
-        for movimiento in movimientos_ejemplo:
-            nuevo_mov = pd.DataFrame(
-                [movimiento], 
-                columns=["ID_Movimiento", "Tipo", "Producto_ID", "Producto_Nombre", 
-                        "Cantidad", "Fecha", "Usuario", "Observaciones"]
-            )
-            st.session_state.movimientos = pd.concat(
-                [st.session_state.movimientos, nuevo_mov], 
-                ignore_index=True
-            )
+    _inicializar_tabla("movimientos")
 
 def inicializar_promociones():
     """Inicializa el DataFrame de promociones con datos de ejemplo"""
-    if "promociones" not in st.session_state:
-        st.session_state.promociones = pd.DataFrame(
-            columns=["ID", "Nombre", "Tipo", "Valor", "Producto_ID", "Producto_Nombre",
-                    "Fecha_Inicio", "Fecha_Fin", "Estado"]
-        )
-        
-        # Datos de ejemplo de promociones
-        promociones_ejemplo = [
-            ["PR001", "2x1 en Gaseosas", "2x1", 0, "P001", "Inca Kola 1.5L", 
-             "2025-11-01", "2025-11-30", "activa"],
-            ["PR002", "20% OFF en Lácteos", "porcentaje", 20, "P003", "Leche Gloria tarro", 
-             "2025-11-10", "2025-11-25", "activa"],
-            ["PR003", "Descuento S/2 en Pan", "monto fijo", 0.20, "P004", "Pan francés (unidad)", 
-             "2025-11-15", "2025-11-20", "activa"],
-            ["PR004", "Combo Arroz", "porcentaje", 15, "P002", "Arroz Costeño 1kg", 
-             "2025-10-01", "2025-10-31", "inactiva"]
-        ]
-        
-        for promocion in promociones_ejemplo:
-            nueva_promo = pd.DataFrame(
-                [promocion], 
-                columns=["ID", "Nombre", "Tipo", "Valor", "Producto_ID", "Producto_Nombre",
-                        "Fecha_Inicio", "Fecha_Fin", "Estado"]
-            )
-            st.session_state.promociones = pd.concat(
-                [st.session_state.promociones, nueva_promo], 
-                ignore_index=True
-            )
+    _inicializar_tabla("promociones")
 
 def inicializar_ventas():
     """Inicializa el DataFrame de ventas con datos de ejemplo"""
-    if "ventas" not in st.session_state:
-        st.session_state.ventas = pd.DataFrame(
-            columns=["ID", "Fecha", "Items", "Total_Bruto", "Total_Descuento",
-                    "Total_Final", "Metodo_Pago", "Promociones"]
-        )
-        
-        # Datos de ejemplo de ventas
-        ventas_ejemplo = [
-            ["V001", "2025-11-16 10:30", "[{'producto_id':'P001','cantidad':2}]", 
-             13.00, 6.50, 6.50, "efectivo", "PR001"],
-            ["V002", "2025-11-16 14:15", "[{'producto_id':'P003','cantidad':1}]", 
-             4.80, 0.96, 3.84, "tarjeta", "PR002"],
-        ]
-        
-        for venta in ventas_ejemplo:
-            nueva_venta = pd.DataFrame(
-                [venta],
-                columns=["ID", "Fecha", "Items", "Total_Bruto", "Total_Descuento",
-                        "Total_Final", "Metodo_Pago", "Promociones"]
-            )
-            st.session_state.ventas = pd.concat(
-                [st.session_state.ventas, nueva_venta],
-                ignore_index=True
-            )
+    _inicializar_tabla("ventas")
+
+def inicializar_venta_items():
+    """Inicializa el DataFrame de líneas de venta con datos de ejemplo"""
+    _inicializar_tabla("venta_items")
+
+def inicializar_devoluciones():
+    """Inicializa el DataFrame de devoluciones"""
+    _inicializar_tabla("devoluciones")
 
 def get_inventario():
     """Retorna el DataFrame de inventario"""
-    return st.session_state.inventario
+    return _instantanea("inventario")
 
 def get_movimientos():
     """Retorna el DataFrame de movimientos"""
-    return st.session_state.movimientos
+    return _instantanea("movimientos")
 
 def get_promociones():
     """Retorna el DataFrame de promociones"""
-    return st.session_state.promociones
+    return _instantanea("promociones")
 
 def get_ventas():
     """Retorna el DataFrame de ventas"""
-    return st.session_state.ventas
+    return _instantanea("ventas")
+
+def get_venta_items():
+    """Retorna el DataFrame de líneas de venta"""
+    return _instantanea("venta_items")
+
+def get_devoluciones():
+    """Retorna el DataFrame de devoluciones"""
+    return _instantanea("devoluciones")
+
+# ----------------------------
+# Secuencias de IDs
+# ----------------------------
+
+def _numero_id(tabla, id_valor):
+    """Extrae el número de un ID secuencial (P012 -> 12) o None si no tiene el formato"""
+    prefijo = PREFIJOS_ID[tabla]
+    if isinstance(id_valor, str) and id_valor.startswith(prefijo):
+        numero = id_valor[len(prefijo):]
+        if numero.isdigit():
+            return int(numero)
+    return None
+
+def _formatear_id(tabla, numero):
+    """Formatea un número de secuencia como ID (ancho mínimo ANCHO_ID)"""
+    return f"{PREFIJOS_ID[tabla]}{numero:0{ANCHO_ID}d}"
+
+def _secuencia(tabla):
+    """
+    Último número asignado de la secuencia de una tabla. Se lee de SQLite;
+    solo si la secuencia aún no existe se calcula una vez a partir de los IDs
+    de la tabla.
+
+    Args:
+        tabla: Nombre de la tabla
+
+    Returns:
+        int: Último número asignado
+    """
+    secuencias = _obtener_store()["secuencias"]
+    if tabla not in secuencias:
+        with bloqueo_lectura():
+            if tabla not in secuencias:
+                valor = database.obtener_secuencia(tabla)
+                if valor is None:
+                    claves = _tabla(tabla)[TABLAS[tabla]["clave"]].tolist()
+                    numeros = [_numero_id(tabla, c) for c in claves]
+                    valor = max((n for n in numeros if n is not None), default=0)
+                secuencias[tabla] = valor
+    return secuencias[tabla]
+
+def _avanzar_secuencia(tabla, numero):
+    """
+    Lleva la secuencia de una tabla al menos hasta `numero`
+
+    Args:
+        tabla: Nombre de la tabla
+        numero: Número de ID asignado
+
+    Returns:
+        tuple: Cambio para el journal o None si la secuencia no avanzó
+    """
+    if numero is None or numero <= _secuencia(tabla):
+        return None
+
+    _obtener_store()["secuencias"][tabla] = numero
+    return ("upsert", "secuencias", {"Tabla": tabla, "Valor": numero})
+
+def siguiente_id(tabla):
+    """
+    Próximo ID de la secuencia de una tabla, sin reservarlo (O(1)).
+    Sirve para mostrarlo en formularios; al guardar se usa reservar_id.
+
+    Args:
+        tabla: Nombre de la tabla
+
+    Returns:
+        str: ID con el formato de la tabla (p. ej. P006)
+    """
+    return _formatear_id(tabla, _secuencia(tabla) + 1)
+
+def reservar_id(tabla, propuesto=None):
+    """
+    Reserva un ID de forma atómica entre sesiones. Si el ID propuesto (el que
+    se mostró en el formulario) sigue libre se usa ese; si otra sesión ya lo
+    tomó se asigna el siguiente de la secuencia.
+
+    Args:
+        tabla: Nombre de la tabla
+        propuesto: ID sugerido (opcional)
+
+    Returns:
+        str: ID reservado
+    """
+    with bloqueo_escritura():
+        if propuesto is not None and not existe_fila(tabla, propuesto):
+            numero = _numero_id(tabla, propuesto)
+            if numero is None or numero > _secuencia(tabla):
+                cambio = _avanzar_secuencia(tabla, numero)
+                if cambio:
+                    _registrar([cambio])
+                return propuesto
+
+        return reservar_ids(tabla, 1)[0]
+
+def reservar_ids(tabla, cantidad):
+    """
+    Reserva un bloque de IDs consecutivos con un solo avance de la secuencia
+
+    Args:
+        tabla: Nombre de la tabla
+        cantidad: Número de IDs a reservar
+
+    Returns:
+        list: IDs reservados, en orden
+    """
+    if cantidad <= 0:
+        return []
+
+    with bloqueo_escritura():
+        inicio = _secuencia(tabla) + 1
+        _registrar([_avanzar_secuencia(tabla, inicio + cantidad - 1)])
+        return [_formatear_id(tabla, numero) for numero in range(inicio, inicio + cantidad)]
+
+# ----------------------------
+# Tokens de idempotencia
+# ----------------------------
+
+def obtener_token(token):
+    """
+    Busca un token de idempotencia entre los recientes (O(1))
+
+    Args:
+        token: Token enviado con la operación
 
-def actualizar_inventario(df):
-    """Actualiza el DataFrame de inventario"""
-    st.session_state.inventario = df
+    Returns:
+        Resultado guardado con el token (p. ej. el ID de la venta) o None
+        si el token no se ha usado
+    """
+    tokens = _obtener_store()["tokens"]
+    with bloqueo_lectura():
+        if token not in tokens:
+            return None
+        tokens.move_to_end(token)
+        return tokens[token]
 
-def actualizar_movimientos(df):
-    """Actualiza el DataFrame de movimientos"""
-    st.session_state.movimientos = df
+def registrar_token(token, resultado):
+    """
+    Recuerda un token de idempotencia ya usado. Solo se conservan los
+    MAX_TOKENS_IDEMPOTENCIA más recientes; dentro de una transacción el
+    token se olvida si esta se deshace.
 
-def actualizar_promociones(df):
-    """Actualiza el DataFrame de promociones"""
-    st.session_state.promociones = df
+    Args:
+        token: Token enviado con la operación
+        resultado: Valor a devolver a los reintentos (p. ej. el ID de la venta)
+    """
+    store = _obtener_store()
+    tokens = store["tokens"]
+    with bloqueo_escritura():
+        tokens[token] = resultado
+        tokens.move_to_end(token)
+        while len(tokens) > MAX_TOKENS_IDEMPOTENCIA:
+            tokens.popitem(last=False)
 
-def actualizar_ventas(df):
-    """Actualiza el DataFrame de ventas"""
-    st.session_state.ventas = df
+        if store["transaccion"] is not None:
+            store["transaccion"]["deshacer"].append(lambda: tokens.pop(token, None))
+
+# ----------------------------
+# Acceso y escrituras por fila
+# ----------------------------
+
+def obtener_fila(tabla, clave_valor):
+    """
+    Busca una fila por clave primaria usando el índice hash (O(1))
+
+    Args:
+        tabla: Nombre de la tabla
+        clave_valor: Valor de la clave primaria
+
+    Returns:
+        Series: Fila encontrada o None si no existe
+    """
+    filas = obtener_filas(tabla, [clave_valor])
+    return filas.iloc[0] if not filas.empty else None
+
+def obtener_filas(tabla, claves, orden_tabla=False):
+    """
+    Busca varias filas por clave primaria con el índice hash (O(claves))
+
+    Args:
+        tabla: Nombre de la tabla
+        claves: Claves primarias a buscar
+        orden_tabla: Si es True, las filas salen en el orden de la tabla en
+            lugar del orden de las claves
+
+    Returns:
+        DataFrame: Filas encontradas, indexadas por su clave primaria
+            (las claves inexistentes no aparecen)
+    """
+    if _lee_en_vivo(_obtener_store()):
+        # Índice y tabla se leen juntos bajo el lock: una escritura puede
+        # mover las posiciones (eliminar filas) o reemplazar el DataFrame
+        with bloqueo_lectura():
+            indice = _indice(tabla)
+            posiciones = [indice[c] for c in claves if c in indice]
+            if orden_tabla:
+                posiciones.sort()
+            filas = _tabla(tabla).iloc[posiciones]
+    else:
+        # Sin lock: índice y filas de la misma instantánea publicada
+        publicada = _publicada(tabla)
+        posiciones = _posiciones_publicadas(tabla, publicada, claves)
+        if orden_tabla:
+            posiciones.sort()
+        filas = _consolidada(tabla, publicada).iloc[posiciones]
+    return filas.set_index(TABLAS[tabla]["clave"], drop=False)
+
+def existe_fila(tabla, clave_valor):
+    """
+    Verifica si existe una fila con la clave primaria dada (O(1))
+
+    Args:
+        tabla: Nombre de la tabla
+        clave_valor: Valor de la clave primaria
+
+    Returns:
+        bool: True si la fila existe
+    """
+    if _lee_en_vivo(_obtener_store()):
+        with bloqueo_lectura():
+            return clave_valor in _indice(tabla)
+    return bool(_posiciones_publicadas(tabla, _publicada(tabla), [clave_valor]))
+
+def _agregar(tabla, tuplas):
+    """Agrega filas ya convertidas al buffer de inserciones (sin registrar)"""
+    clave = columnas_de(tabla).index(TABLAS[tabla]["clave"])
+    store = _obtener_store()
+    pendientes = store["pendientes"][tabla]
+    inicio = len(store["tablas"][tabla]) + len(pendientes)
+    pendientes.extend(tuplas)
+    _marcar_sucia(tabla)
+
+    # Las filas quedarán al final de la tabla consolidada
+    indice = store["indices"].get(tabla)
+    if indice is not None:
+        for desplazamiento, tupla in enumerate(tuplas):
+            indice[tupla[clave]] = inicio + desplazamiento
+
+    if _derivados_activos(tabla):
+        _notificar(tabla, _vacia(tabla), pd.DataFrame(tuplas, columns=columnas_de(tabla)))
+
+    if len(pendientes) >= BUFFER_INSERCIONES:
+        _consolidar(tabla)
+
+def _asignar(tabla, claves, valores):
+    """
+    Escribe valores en filas existentes (sin registrar)
+
+    Args:
+        tabla: Nombre de la tabla
+        claves: Claves primarias de las filas
+        valores: dict {columna: list de valores, uno por clave}
+    """
+    df = _tabla(tabla)
+    indice = _indice(tabla)
+    etiquetas = df.index[[indice[c] for c in claves]]
+    notificar = bool(_derivados_activos(tabla))
+    _marcar_sucia(tabla)
+    if notificar:
+        quitadas = df.loc[etiquetas]
+
+    for col, lista in valores.items():
+        # Los valores nuevos de una columna category se agregan como categoría
+        if ESQUEMAS[tabla][col] == "category":
+            nuevas = [v for v in dict.fromkeys(lista) if v not in df[col].cat.categories]
+            if nuevas:
+                df[col] = df[col].cat.add_categories(nuevas)
+        df.loc[etiquetas, col] = pd.Series(lista, index=etiquetas).astype(df[col].dtype)
+
+    if notificar:
+        _notificar(tabla, quitadas, df.loc[etiquetas])
+
+def _quitar(tabla, claves):
+    """Elimina filas por clave primaria de la tabla en memoria (sin registrar)"""
+    df = _tabla(tabla)
+    indice = _indice(tabla)
+    posiciones = [indice[c] for c in claves if c in indice]
+    etiquetas = df.index[posiciones]
+    _tablas()[tabla] = df.drop(index=etiquetas).reset_index(drop=True)
+    _invalidar_indice(tabla)
+    _marcar_sucia(tabla)
+
+    if _derivados_activos(tabla):
+        _notificar(tabla, df.loc[etiquetas], _vacia(tabla))
+
+def insertar_fila(tabla, fila):
+    """
+    Agrega una fila al buffer de inserciones de la tabla (O(1) amortizado)
+    y la registra en el journal. El buffer se consolida en el DataFrame al
+    leer la tabla o al alcanzar BUFFER_INSERCIONES filas.
+
+    Args:
+        tabla: Nombre de la tabla
+        fila: dict con las columnas de la tabla
+    """
+    insertar_filas(tabla, [fila])
+
+def insertar_filas(tabla, filas):
+    """
+    Agrega varias filas al buffer de inserciones y las registra en el
+    journal con una sola escritura
+
+    Args:
+        tabla: Nombre de la tabla
+        filas: list de dicts con las columnas de la tabla
+    """
+    if not filas:
+        return
+
+    columnas = columnas_de(tabla)
+    clave = TABLAS[tabla]["clave"]
+    tuplas = [
+        tuple(convertir_valor(tabla, col, fila.get(col)) for col in columnas)
+        for fila in filas
+    ]
+
+    with bloqueo_escritura():
+        cambios = [("upsert", tabla, dict(zip(columnas, tupla))) for tupla in tuplas]
+        if tabla in PREFIJOS_ID:
+            # Un ID escrito a mano también hace avanzar la secuencia
+            numeros = [_numero_id(tabla, fila.get(clave)) for fila in filas]
+            cambio = _avanzar_secuencia(tabla, max((n for n in numeros if n is not None), default=None))
+            if cambio:
+                cambios.append(cambio)
+
+        _agregar(tabla, tuplas)
+        claves = [fila.get(clave) for fila in filas]
+        _registrar(cambios, deshacer=lambda: _quitar(tabla, claves))
+
+def actualizar_fila(tabla, clave_valor, cambios):
+    """
+    Modifica columnas de una fila existente y registra solo esa fila
+
+    Args:
+        tabla: Nombre de la tabla
+        clave_valor: Valor de la clave primaria de la fila
+        cambios: dict {columna: nuevo_valor}
+
+    Returns:
+        bool: True si la fila existía y se actualizó
+    """
+    with bloqueo_escritura():
+        if not existe_fila(tabla, clave_valor):
+            return False
+
+        actualizar_filas(tabla, [clave_valor], {col: [valor] for col, valor in cambios.items()})
+    return True
+
+def actualizar_filas(tabla, claves, cambios):
+    """
+    Modifica columnas de varias filas existentes en una sola operación y
+    registra esas filas con una sola escritura al journal
+
+    Args:
+        tabla: Nombre de la tabla
+        claves: Claves primarias de las filas (deben existir)
+        cambios: dict {columna: list de valores, uno por clave}
+    """
+    claves = list(claves)
+    if not claves:
+        return
+
+    cambios = {
+        col: [convertir_valor(tabla, col, valor) for valor in valores]
+        for col, valores in cambios.items()
+    }
+
+    with bloqueo_escritura():
+        anteriores = obtener_filas(tabla, claves)[list(cambios)]
+        previos = {col: anteriores[col].tolist() for col in cambios}
+
+        _asignar(tabla, claves, cambios)
+        filas = obtener_filas(tabla, claves).to_dict("records")
+        _registrar(
+            [("upsert", tabla, fila) for fila in filas],
+            deshacer=lambda: _asignar(tabla, claves, previos)
+        )
+
+def eliminar_fila(tabla, clave_valor):
+    """
+    Elimina una fila de la tabla en memoria y registra la eliminación
+
+    Args:
+        tabla: Nombre de la tabla
+        clave_valor: Valor de la clave primaria de la fila
+    """
+    with bloqueo_escritura():
+        fila = obtener_fila(tabla, clave_valor)
+        if fila is None:
+            return
+
+        tupla = tuple(fila[col] for col in columnas_de(tabla))
+        _quitar(tabla, [clave_valor])
+        _registrar(
+            [("delete", tabla, clave_valor)],
+            deshacer=lambda: _agregar(tabla, [tupla])
+        )
@@ -0,0 +1,346 @@
+"""
+Módulo de persistencia en SQLite (modo WAL)
+Guarda las tablas del sistema en disco con escrituras por fila
+"""
+import sqlite3
+import threading
+import numpy as np
+import pandas as pd
+from config import DB_PATH
+
+# Definición de tablas: clave primaria, columnas (con tipo SQLite) e índices
+TABLAS = {
+    "inventario": {
+        "clave": "ID",
+        "columnas": {
+            "ID": "TEXT",
+            "Nombre": "TEXT",
+            "Categoría": "TEXT",
+            "Cantidad": "INTEGER",
+            "Precio": "REAL",
+            "Fecha_Agregado": "TEXT",
+            # Se incrementa con cada cambio de la fila (control de concurrencia optimista)
+            "Version": "INTEGER"
+        },
+        "indices": [["Categoría"]]
+    },
+    "movimientos": {
+        "clave": "ID_Movimiento",
+        "columnas": {
+            "ID_Movimiento": "TEXT",
+            "Tipo": "TEXT",
+            "Producto_ID": "TEXT",
+            "Producto_Nombre": "TEXT",
+            "Cantidad": "INTEGER",
+            "Fecha": "TEXT",
+            "Usuario": "TEXT",
+            "Observaciones": "TEXT"
+        },
+        "indices": [["Producto_ID"], ["Fecha"], ["Tipo"]]
+    },
+    "promociones": {
+        "clave": "ID",
+        "columnas": {
+            "ID": "TEXT",
+            "Nombre": "TEXT",
+            "Tipo": "TEXT",
+            "Valor": "REAL",
+            "Producto_ID": "TEXT",
+            "Producto_Nombre": "TEXT",
+            "Fecha_Inicio": "TEXT",
+            "Fecha_Fin": "TEXT",
+            "Estado": "TEXT"
+        },
+        "indices": [["Producto_ID"], ["Estado", "Fecha_Inicio", "Fecha_Fin"]]
+    },
+    "ventas": {
+        "clave": "ID",
+        "columnas": {
+            "ID": "TEXT",
+            "Fecha": "TEXT",
+            "Total_Bruto": "REAL",
+            "Total_Descuento": "REAL",
+            "Total_Final": "REAL",
+            "Metodo_Pago": "TEXT",
+            "Promociones": "TEXT"
+        },
+        "indices": [["Fecha"], ["Metodo_Pago"]]
+    },
+    # Líneas de cada venta (reemplaza a la antigua columna de texto ventas.Items)
+    "venta_items": {
+        "clave": "ID_Item",
+        "columnas": {
+            "ID_Item": "TEXT",
+            "ID_Venta": "TEXT",
+            "Producto_ID": "TEXT",
+            "Cantidad": "INTEGER",
+            "Precio_Unitario": "REAL",
+            "Descuento": "REAL",
+            "Devuelto": "INTEGER"
+        },
+        "indices": [["ID_Venta"], ["Producto_ID"]]
+    },
+    "devoluciones": {
+        "clave": "ID_Devolucion",
+        "columnas": {
+            "ID_Devolucion": "TEXT",
+            "ID_Venta": "TEXT",
+            "Fecha": "TEXT",
+            "Items": "TEXT",
+            "Motivo": "TEXT",
+            "Estado": "TEXT"
+        },
+        "indices": [["ID_Venta"], ["Fecha"]]
+    },
+    # Último número asignado de cada secuencia de IDs (no se carga como DataFrame)
+    "secuencias": {
+        "clave": "Tabla",
+        "columnas": {
+            "Tabla": "TEXT",
+            "Valor": "INTEGER"
+        },
+        "indices": []
+    }
+}
+
+# Una conexión por hilo (cada sesión de Streamlit corre en su propio hilo)
+_local = threading.local()
+_esquema_creado = False
+_esquema_lock = threading.Lock()
+
+def get_connection():
+    """
+    Obtiene la conexión SQLite del hilo actual (creándola si no existe)
+
+    Returns:
+        Connection: Conexión en modo WAL con el esquema creado
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _local.conn = conn
+        crear_esquema(conn)
+    return conn
+
+def crear_esquema(conn):
+    """
+    Crea las tablas e índices si todavía no existen
+
+    Args:
+        conn: Conexión SQLite
+    """
+    global _esquema_creado
+
+    with _esquema_lock:
+        if _esquema_creado:
+            return
+
+        with conn:
+            for tabla, definicion in TABLAS.items():
+                columnas = ", ".join(
+                    f'"{col}" {tipo}' + (" PRIMARY KEY" if col == definicion["clave"] else "")
+                    for col, tipo in definicion["columnas"].items()
+                )
+                conn.execute(f'CREATE TABLE IF NOT EXISTS "{tabla}" ({columnas})')
+
+                # Columnas agregadas al esquema después de crear la tabla
+                existentes = {fila[1] for fila in conn.execute(f'PRAGMA table_info("{tabla}")')}
+                for col, tipo in definicion["columnas"].items():
+                    if col not in existentes:
+                        conn.execute(f'ALTER TABLE "{tabla}" ADD COLUMN "{col}" {tipo}')
+
+                for cols in definicion["indices"]:
+                    nombre_idx = f"idx_{tabla}_" + "_".join(cols)
+                    lista = ", ".join(f'"{c}"' for c in cols)
+                    conn.execute(
+                        f'CREATE INDEX IF NOT EXISTS "{nombre_idx}" ON "{tabla}" ({lista})'
+                    )
+
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS "meta" ("clave" TEXT PRIMARY KEY, "valor" TEXT)'
+            )
+
+        _esquema_creado = True
+
+def a_valor_sqlite(valor):
+    """Convierte valores de pandas/numpy a tipos nativos aceptados por SQLite"""
+    if valor is None:
+        return None
+    if isinstance(valor, pd.Timestamp):
+        return None if pd.isna(valor) else valor.isoformat(sep=" ")
+    if isinstance(valor, np.generic):
+        valor = valor.item()
+    if isinstance(valor, float) and np.isnan(valor):
+        return None
+    return valor
+
+def cargar_tabla(tabla):
+    """
+    Carga una tabla completa en un DataFrame (en orden de inserción)
+
+    Args:
+        tabla: Nombre de la tabla
+
+    Returns:
+        DataFrame: Contenido de la tabla
+    """
+    columnas = list(TABLAS[tabla]["columnas"])
+    lista = ", ".join(f'"{c}"' for c in columnas)
+    return pd.read_sql_query(
+        f'SELECT {lista} FROM "{tabla}" ORDER BY rowid',
+        get_connection()
+    )
+
+def _sql_upsert(tabla):
+    """Construye la sentencia INSERT ... ON CONFLICT para una tabla"""
+    definicion = TABLAS[tabla]
+    columnas = list(definicion["columnas"])
+    clave = definicion["clave"]
+
+    lista = ", ".join(f'"{c}"' for c in columnas)
+    marcas = ", ".join("?" for _ in columnas)
+    actualizaciones = ", ".join(
+        f'"{c}" = excluded."{c}"' for c in columnas if c != clave
+    )
+    return (
+        f'INSERT INTO "{tabla}" ({lista}) VALUES ({marcas}) '
+        f'ON CONFLICT("{clave}") DO UPDATE SET {actualizaciones}'
+    )
+
+def _sql_delete(tabla):
+    """Construye la sentencia DELETE por clave primaria para una tabla"""
+    return f'DELETE FROM "{tabla}" WHERE "{TABLAS[tabla]["clave"]}" = ?'
+
+def _valores_fila(tabla, fila):
+    """Ordena los valores de una fila según las columnas de la tabla"""
+    return tuple(a_valor_sqlite(fila.get(c)) for c in TABLAS[tabla]["columnas"])
+
+def guardar_filas(tabla, filas):
+    """
+    Inserta o actualiza (upsert) filas por clave primaria
+
+    Args:
+        tabla: Nombre de la tabla
+        filas: list de dicts con las columnas de la tabla
+    """
+    if not filas:
+        return
+
+    conn = get_connection()
+    with conn:
+        conn.executemany(
+            _sql_upsert(tabla),
+            [_valores_fila(tabla, fila) for fila in filas]
+        )
+
+def eliminar_filas(tabla, claves):
+    """
+    Elimina filas por clave primaria
+
+    Args:
+        tabla: Nombre de la tabla
+        claves: list de claves primarias a eliminar
+    """
+    if not claves:
+        return
+
+    conn = get_connection()
+    with conn:
+        conn.executemany(_sql_delete(tabla), [(a_valor_sqlite(c),) for c in claves])
+
+def aplicar_cambios(cambios, meta=None):
+    """
+    Aplica una secuencia ordenada de upserts y eliminaciones en una sola
+    transacción (todo o nada)
+
+    Args:
+        cambios: list de tuplas (operacion, tabla, dato) donde operacion es
+            "upsert" (dato = dict de la fila) o "delete" (dato = clave)
+        meta: dict opcional de metadatos a guardar en la misma transacción
+    """
+    conn = get_connection()
+    with conn:
+        for operacion, tabla, dato in cambios:
+            if operacion == "upsert":
+                conn.execute(_sql_upsert(tabla), _valores_fila(tabla, dato))
+            else:
+                conn.execute(_sql_delete(tabla), (a_valor_sqlite(dato),))
+
+        for clave, valor in (meta or {}).items():
+            conn.execute(
+                'INSERT INTO "meta" ("clave", "valor") VALUES (?, ?) '
+                'ON CONFLICT("clave") DO UPDATE SET "valor" = excluded."valor"',
+                (clave, str(valor))
+            )
+
+def leer_columna_heredada(tabla, columna):
+    """
+    Lee una columna que ya no forma parte del esquema pero puede seguir en
+    bases de datos creadas con versiones anteriores
+
+    Args:
+        tabla: Nombre de la tabla
+        columna: Nombre de la columna
+
+    Returns:
+        list: Tuplas (clave primaria, valor) o lista vacía si la columna no existe
+    """
+    conn = get_connection()
+    existentes = [fila[1] for fila in conn.execute(f'PRAGMA table_info("{tabla}")')]
+    if columna not in existentes:
+        return []
+
+    clave = TABLAS[tabla]["clave"]
+    return conn.execute(
+        f'SELECT "{clave}", "{columna}" FROM "{tabla}" '
+        f'WHERE "{columna}" IS NOT NULL ORDER BY rowid'
+    ).fetchall()
+
+def obtener_secuencia(tabla):
+    """
+    Lee el último número asignado de la secuencia de IDs de una tabla
+
+    Args:
+        tabla: Nombre de la tabla
+
+    Returns:
+        int: Último número asignado o None si la secuencia no existe
+    """
+    fila = get_connection().execute(
+        'SELECT "Valor" FROM "secuencias" WHERE "Tabla" = ?', (tabla,)
+    ).fetchone()
+    return int(fila[0]) if fila else None
+
+def obtener_meta(clave, defecto=None):
+    """
+    Lee un valor de la tabla de metadatos
+
+    Args:
+        clave: Clave del metadato
+        defecto: Valor a retornar si no existe
+
+    Returns:
+        str: Valor almacenado o el valor por defecto
+    """
+    fila = get_connection().execute(
+        'SELECT "valor" FROM "meta" WHERE "clave" = ?', (clave,)
+    ).fetchone()
+    return fila[0] if fila else defecto
+
+def guardar_meta(clave, valor):
+    """
+    Guarda un valor en la tabla de metadatos
+
+    Args:
+        clave: Clave del metadato
+        valor: Valor a guardar
+    """
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            'INSERT INTO "meta" ("clave", "valor") VALUES (?, ?) '
+            'ON CONFLICT("clave") DO UPDATE SET "valor" = excluded."valor"',
+            (clave, str(valor))
+        )
@@ -1,11 +1,130 @@
 """
 Módulo CRUD para gestión de inventario
 """
-import streamlit as st
+import numpy as np
 import pandas as pd
 from datetime import datetime
 from config import STOCK_BAJO
+from utils import (
+    normalizar_texto, texto_busqueda, indice_trigramas, actualizar_indice_trigramas,
+    candidatos_trigramas, SEPARADOR_BUSQUEDA
+)
+from data_manager import (
+    obtener_fila, obtener_filas, existe_fila, insertar_fila,
+    actualizar_fila, actualizar_filas, eliminar_fila, bloqueo_escritura, bloqueo_lectura,
+    reservar_id, registrar_derivado, obtener_derivado, escritura, transaccion
+)
 
+def _aportes_kpis(filas):
+    """
+    Aporte de un grupo de filas a los KPIs del inventario. El valor se
+    acumula en céntimos enteros para que el total no acumule error de redondeo.
+    """
+    cantidades = filas["Cantidad"].to_numpy(dtype=np.int64)
+    centimos = np.round(filas["Precio"].to_numpy(dtype=np.float64) * 100).astype(np.int64)
+    return {
+        "total_productos": len(filas),
+        "total_cantidad": int(cantidades.sum()),
+        "valor_centimos": int((cantidades * centimos).sum()),
+        "bajo_stock": int((cantidades < STOCK_BAJO).sum())
+    }
+
+def _construir_kpis(inventario):
+    """Calcula los KPIs del inventario desde la tabla completa"""
+    return _aportes_kpis(inventario)
+
+def _aplicar_kpis(kpis, quitadas, agregadas):
+    """Actualiza los KPIs con las filas que salen y entran del inventario"""
+    salen = _aportes_kpis(quitadas)
+    entran = _aportes_kpis(agregadas)
+    for clave in kpis:
+        kpis[clave] += entran[clave] - salen[clave]
+
+registrar_derivado("kpis_inventario", "inventario", _construir_kpis, _aplicar_kpis)
+
+# ----------------------------
+# Índice de búsqueda por trigramas (ID, Nombre y Categoría)
+# ----------------------------
+
+def _filas_busqueda(filas):
+    """Pares (id, texto normalizado) de un DataFrame de inventario"""
+    columnas = zip(
+        filas["ID"].tolist(), filas["Nombre"].tolist(), filas["Categoría"].astype(object).tolist()
+    )
+    return ((producto_id, texto_busqueda(producto_id, nombre, categoria))
+            for producto_id, nombre, categoria in columnas)
+
+def _construir_busqueda(inventario):
+    """Construye el índice invertido trigrama -> IDs de producto"""
+    indice = indice_trigramas()
+    actualizar_indice_trigramas(indice, [], _filas_busqueda(inventario))
+    return indice
+
+def _aplicar_busqueda(indice, quitadas, agregadas):
+    """Actualiza el índice con los productos que salen y entran"""
+    actualizar_indice_trigramas(indice, _filas_busqueda(quitadas), _filas_busqueda(agregadas))
+
+registrar_derivado("busqueda_inventario", "inventario", _construir_busqueda, _aplicar_busqueda)
+
+def _puntaje(texto, consulta):
+    """
+    Orden de relevancia de un producto (menor es mejor): ID exacto, nombre
+    que empieza con la consulta, palabra del nombre que empieza con ella,
+    nombre que la contiene y, al final, coincidencias en ID o categoría
+    """
+    producto_id, nombre, _ = texto.split(SEPARADOR_BUSQUEDA)
+    if producto_id == consulta:
+        return 0
+    if nombre.startswith(consulta):
+        return 1
+    if any(palabra.startswith(consulta) for palabra in nombre.split()):
+        return 2
+    if consulta in nombre:
+        return 3
+    return 4
+
+def buscar_productos(texto, limite=None):
+    """
+    Busca productos por ID, nombre o categoría (sin distinguir mayúsculas ni
+    tildes) con el índice de trigramas: solo se revisan los productos que
+    comparten todos los trigramas de la consulta.
+    
+    Args:
+        texto: Texto a buscar
+        limite: Máximo de resultados (None = todos)
+    
+    Returns:
+        DataFrame: Productos encontrados, del más al menos relevante
+    """
+    consulta = normalizar_texto(texto).strip()
+    if not consulta:
+        return obtener_filas("inventario", [])
+    
+    with bloqueo_lectura():
+        indice = obtener_derivado("busqueda_inventario")
+        textos = indice["textos"]
+        encontrados = [
+            (_puntaje(textos[producto_id], consulta), textos[producto_id].split(SEPARADOR_BUSQUEDA)[1], producto_id)
+            for producto_id in candidatos_trigramas(indice, consulta)
+        ]
+    
+    encontrados.sort()
+    ids = [producto_id for _, _, producto_id in encontrados[:limite]]
+    return obtener_filas("inventario", ids).reset_index(drop=True)
+
+class ConflictoVersion(Exception):
+    """
+    Otro proceso modificó un producto después de leerlo (su Version cambió).
+    Dentro de una transacción, lanzarla deshace todo lo hecho en ella.
+    
+    Attributes:
+        productos: IDs de los productos en conflicto
+    """
+    def __init__(self, productos):
+        super().__init__(f"Versión desactualizada: {', '.join(productos)}")
+        self.productos = productos
+
+@escritura
 def registrar_producto(id_, nombre, categoria, cantidad, precio):
     """
     Registra un nuevo producto en el inventario
@@ -16,17 +135,26 @@ def registrar_producto(id_, nombre, categoria, cantidad, precio):
         categoria: Categoría del producto
         cantidad: Cantidad inicial en stock
         precio: Precio unitario
+    
+    Returns:
+        str: ID asignado (otro si id_ ya fue tomado por otra sesión)
     """
     fecha_actual = datetime.now().strftime("%Y-%m-%d")
-    nuevo = pd.DataFrame(
-        [[id_, nombre, categoria, cantidad, precio, fecha_actual]], 
-        columns=["ID", "Nombre", "Categoría", "Cantidad", "Precio", "Fecha_Agregado"]
-    )
-    st.session_state.inventario = pd.concat(
-        [st.session_state.inventario, nuevo], 
-        ignore_index=True
-    )
+    # El avance de la secuencia y la fila van en un solo registro del journal
+    with transaccion():
+        id_ = reservar_id("inventario", id_)
+        insertar_fila("inventario", {
+            "ID": id_,
+            "Nombre": nombre,
+            "Categoría": categoria,
+            "Cantidad": cantidad,
+            "Precio": precio,
+            "Fecha_Agregado": fecha_actual
+        })
+    
+    return id_
 
+@escritura
 def eliminar_producto(id_):
     """
     Elimina un producto del inventario
@@ -34,11 +162,10 @@ def eliminar_producto(id_):
     Args:
         id_: ID del producto a eliminar
     """
-    st.session_state.inventario = st.session_state.inventario[
-        st.session_state.inventario["ID"] != id_
-    ]
+    eliminar_fila("inventario", id_)
 
-def actualizar_producto(id_, nombre, categoria, cantidad, precio):
+@escritura
+def actualizar_producto(id_, nombre, categoria, cantidad, precio, version=None):
     """
     Actualiza la información de un producto existente
     
@@ -46,53 +173,111 @@ def actualizar_producto(id_, nombre, categoria, cantidad, precio):
         id_: ID del producto a actualizar
         nombre: Nuevo nombre
         categoria: Nueva categoría
-        cantidad: Nueva cantidad
+        cantidad: Nueva cantidad (valor absoluto, no un delta)
         precio: Nuevo precio
+        version: Version leída al mostrar el formulario; si se indica y ya
+            no coincide (p. ej. hubo ventas desde entonces) no se modifica nada
+    
+    Raises:
+        ConflictoVersion: Si la versión ya no coincide
     """
-    idx = st.session_state.inventario[st.session_state.inventario["ID"] == id_].index
-    if not idx.empty:
-        st.session_state.inventario.loc[
-            idx[0], 
-            ["Nombre", "Categoría", "Cantidad", "Precio"]
-        ] = [nombre, categoria, cantidad, precio]
+    with bloqueo_escritura():
+        producto = obtener_fila("inventario", id_)
+        if version is not None and (producto is None or int(producto["Version"]) != version):
+            raise ConflictoVersion([id_])
+        
+        actualizar_fila("inventario", id_, {
+            "Nombre": nombre,
+            "Categoría": categoria,
+            "Cantidad": cantidad,
+            "Precio": precio,
+            "Version": int(producto["Version"]) + 1 if producto is not None else 0
+        })
 
-def actualizar_stock_producto(producto_id, cantidad_cambio):
+@escritura
+def actualizar_stock_producto(producto_id, cantidad_cambio, version=None):
     """
     Actualiza el stock de un producto
     
     Args:
         producto_id: ID del producto
         cantidad_cambio: Cantidad a agregar o quitar (puede ser negativa)
+        version: Version leída del producto; si se indica y ya no coincide
+            se lanza ConflictoVersion sin modificar nada
+    """
+    versiones = None if version is None else {producto_id: version}
+    actualizar_stock_productos([(producto_id, cantidad_cambio)], versiones)
+
+@escritura
+def actualizar_stock_productos(cambios, versiones=None):
     """
-    idx = st.session_state.inventario[
-        st.session_state.inventario["ID"] == producto_id
-    ].index
+    Actualiza el stock de muchos productos en una sola operación vectorizada
+    (ingresos de mercadería, ajustes por conteo físico, ventas de varias líneas).
+    Igual que actualizar_stock_producto, el stock nunca baja de cero. Cada
+    producto modificado incrementa su Version.
+    
+    Con versiones funciona como compare-and-swap: el cambio solo se aplica
+    si ningún producto cambió desde que se leyó su versión, de modo que el
+    llamador puede validar el stock sin tomar el lock y reintentar si falla.
     
-    if not idx.empty:
-        nueva_cantidad = max(
-            0, 
-            st.session_state.inventario.loc[idx[0], "Cantidad"] + cantidad_cambio
-        )
-        st.session_state.inventario.loc[idx[0], "Cantidad"] = nueva_cantidad
+    Args:
+        cambios: Iterable de pares (producto_id, cantidad_cambio); si un
+            producto aparece varias veces sus cambios se suman
+        versiones: dict o Series {producto_id: Version leída} (opcional)
+    
+    Returns:
+        list: IDs de productos que no existen (se ignoran)
+    
+    Raises:
+        ConflictoVersion: Si alguna versión ya no coincide
+    """
+    cambios = pd.DataFrame(list(cambios), columns=["producto_id", "cambio"])
+    if cambios.empty:
+        return []
+    
+    deltas = cambios.groupby("producto_id", sort=False)["cambio"].sum()
+    
+    with bloqueo_escritura():
+        productos = obtener_filas("inventario", deltas.index)
+        
+        if versiones is not None:
+            esperadas = pd.Series(versiones, dtype="int64")
+            leidas = productos["Version"].reindex(esperadas.index)
+            conflictos = esperadas.index[leidas.to_numpy() != esperadas.to_numpy()]
+            if len(conflictos) > 0:
+                raise ConflictoVersion(conflictos.tolist())
+        
+        deltas_validos = deltas[deltas.index.isin(productos.index)]
+        validos = productos.loc[deltas_validos.index]
+        
+        actuales = validos["Cantidad"].to_numpy(dtype=np.int64)
+        nuevas = np.maximum(0, actuales + deltas_validos.to_numpy(dtype=np.int64))
+        actualizar_filas("inventario", deltas_validos.index, {
+            "Cantidad": nuevas.tolist(),
+            "Version": (validos["Version"].to_numpy(dtype=np.int64) + 1).tolist()
+        })
+    
+    return deltas.index[~deltas.index.isin(productos.index)].tolist()
 
 def obtener_estadisticas():
     """
     Obtiene estadísticas generales del inventario
     
+    Se leen de totales que cada escritura del inventario mantiene al día (O(1)).
+    
     Returns:
         tuple: (total_productos, total_cantidad, valor_total, productos_bajo_stock)
     """
-    inventario = st.session_state.inventario
-    
-    if inventario.empty:
-        return 0, 0, 0, 0
+    # Los totales se leen juntos: una escritura los actualiza uno por uno
+    with bloqueo_lectura():
+        kpis = dict(obtener_derivado("kpis_inventario"))
     
-    total_productos = len(inventario)
-    total_cantidad = inventario["Cantidad"].sum()
-    valor_total = (inventario["Cantidad"] * inventario["Precio"]).sum()
-    productos_bajo_stock = len(inventario[inventario["Cantidad"] < STOCK_BAJO])
-    
-    return total_productos, total_cantidad, valor_total, productos_bajo_stock
+    return (
+        kpis["total_productos"],
+        kpis["total_cantidad"],
+        kpis["valor_centimos"] / 100,
+        kpis["bajo_stock"]
+    )
 
 def obtener_producto(producto_id):
     """
@@ -104,10 +289,7 @@ def obtener_producto(producto_id):
     Returns:
         Series: Información del producto o None si no existe
     """
-    inventario = st.session_state.inventario
-    producto = inventario[inventario["ID"] == producto_id]
-    
-    return producto.iloc[0] if not producto.empty else None
+    return obtener_fila("inventario", producto_id)
 
 def producto_existe(producto_id):
     """
@@ -119,4 +301,4 @@ def producto_existe(producto_id):
     Returns:
         bool: True si el producto existe
     """
-    return producto_id in st.session_state.inventario["ID"].values
+    return existe_fila("inventario", producto_id)
@@ -0,0 +1,231 @@
+"""
+Módulo de journal de mutaciones (append-only)
+Cada escritura se agrega como una línea JSON compacta; un hilo en segundo
+plano toma instantáneas periódicas volcando el journal a SQLite y lo recorta
+"""
+import atexit
+import json
+import os
+import threading
+import database
+from config import JOURNAL_PATH, JOURNAL_FSYNC, SNAPSHOT_INTERVALO, SNAPSHOT_MAX_REGISTROS
+
+_lock = threading.Lock()
+_hay_pendientes = threading.Event()
+_estado = {
+    "archivo": None,      # Archivo del journal abierto en modo append
+    "lsn": 0,             # Número del último registro escrito
+    "pendientes": [],     # Registros escritos desde la última instantánea
+    "hilo": None          # Hilo de instantáneas
+}
+
+def _serializar(valor):
+    """Convierte valores no serializables (numpy, Timestamp) para json.dumps"""
+    return database.a_valor_sqlite(valor)
+
+def _leer_registros():
+    """
+    Lee todos los registros del journal en disco
+
+    Returns:
+        list: Registros en orden de escritura (se ignora una última línea
+        incompleta por un corte durante la escritura)
+    """
+    if not os.path.exists(JOURNAL_PATH):
+        return []
+
+    registros = []
+    with open(JOURNAL_PATH, encoding="utf-8") as archivo:
+        for linea in archivo:
+            try:
+                registros.append(json.loads(linea))
+            except json.JSONDecodeError:
+                break
+    return registros
+
+def _reescribir(registros):
+    """
+    Reemplaza el journal en disco por los registros dados (recorte atómico)
+
+    Args:
+        registros: Registros que deben seguir en el journal
+    """
+    if _estado["archivo"] is not None:
+        _estado["archivo"].close()
+
+    temporal = JOURNAL_PATH + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as archivo:
+        for registro in registros:
+            archivo.write(_linea(registro))
+        archivo.flush()
+        os.fsync(archivo.fileno())
+    os.replace(temporal, JOURNAL_PATH)
+
+    _estado["archivo"] = open(JOURNAL_PATH, "a", encoding="utf-8")
+
+def _linea(registro):
+    """Serializa un registro como una línea JSON compacta"""
+    return json.dumps(
+        registro, separators=(",", ":"), ensure_ascii=False, default=_serializar
+    ) + "\n"
+
+def _aplicar_en_sqlite(registros):
+    """
+    Vuelca registros del journal a SQLite en una sola transacción y guarda
+    el LSN alcanzado junto con los datos
+
+    Args:
+        registros: Registros a aplicar (en orden)
+    """
+    cambios = []
+    for r in registros:
+        if r["op"] == "lote":
+            # Transacción: sus cambios se aplican juntos en la misma transacción SQLite
+            cambios.extend(tuple(cambio) for cambio in r["d"])
+        else:
+            cambios.append((r["op"], r["t"], r["d"]))
+    database.aplicar_cambios(cambios, meta={"journal_lsn": registros[-1]["n"]})
+
+def recuperar():
+    """
+    Recuperación al arrancar: aplica a la última instantánea (SQLite) la cola
+    del journal que aún no estaba incluida y deja el journal vacío.
+    Debe llamarse una vez por proceso, antes de cargar las tablas.
+    """
+    with _lock:
+        lsn_instantanea = int(database.obtener_meta("journal_lsn", 0))
+        cola = [r for r in _leer_registros() if r["n"] > lsn_instantanea]
+
+        if cola:
+            _aplicar_en_sqlite(cola)
+
+        _estado["lsn"] = cola[-1]["n"] if cola else lsn_instantanea
+        _estado["pendientes"] = []
+        _reescribir([])
+
+def registrar(operacion, tabla, dato):
+    """
+    Agrega un registro al journal (O(1), sin reescribir tablas)
+
+    Args:
+        operacion: "upsert" o "delete"
+        tabla: Nombre de la tabla
+        dato: dict de la fila (upsert) o clave primaria (delete)
+    """
+    registrar_lote([(operacion, tabla, dato)])
+
+def registrar_lote(cambios):
+    """
+    Agrega varios registros al journal con una sola escritura a disco
+
+    Args:
+        cambios: list de tuplas (operacion, tabla, dato)
+    """
+    if not cambios:
+        return
+
+    _escribir([{"op": operacion, "t": tabla, "d": dato} for operacion, tabla, dato in cambios])
+
+def registrar_transaccion(cambios):
+    """
+    Agrega los cambios de una transacción como un único registro, de modo
+    que tras un corte se recuperan todos o ninguno
+
+    Args:
+        cambios: list de tuplas (operacion, tabla, dato)
+    """
+    if not cambios:
+        return
+
+    _escribir([{"op": "lote", "t": None, "d": [list(cambio) for cambio in cambios]}])
+
+def registrar_grupo(grupo):
+    """
+    Escritura agrupada (group commit): agrega los cambios de varias
+    operaciones con una sola escritura a disco. Cada operación queda como un
+    registro propio, que se recupera completo o no se recupera.
+
+    Args:
+        grupo: list de listas de tuplas (operacion, tabla, dato), una por operación
+    """
+    registros = [
+        {"op": "lote", "t": None, "d": [list(cambio) for cambio in cambios]}
+        for cambios in grupo if cambios
+    ]
+    if registros:
+        _escribir(registros)
+
+def _escribir(registros):
+    """
+    Numera registros, los escribe al final del journal con una sola
+    escritura a disco y los deja pendientes para la próxima instantánea
+
+    Args:
+        registros: list de dicts {"op", "t", "d"}
+    """
+    with _lock:
+        texto = []
+        for registro in registros:
+            _estado["lsn"] += 1
+            registro = {"n": _estado["lsn"], **registro}
+            texto.append(_linea(registro))
+            _estado["pendientes"].append(registro)
+
+        archivo = _estado["archivo"]
+        archivo.write("".join(texto))
+        archivo.flush()
+        if JOURNAL_FSYNC:
+            os.fsync(archivo.fileno())
+
+        if len(_estado["pendientes"]) >= SNAPSHOT_MAX_REGISTROS:
+            _hay_pendientes.set()
+
+def tomar_instantanea():
+    """
+    Vuelca a SQLite los registros pendientes y recorta el journal
+
+    Returns:
+        int: Número de registros incluidos en la instantánea
+    """
+    with _lock:
+        registros = _estado["pendientes"]
+        _estado["pendientes"] = []
+
+    if not registros:
+        return 0
+
+    try:
+        _aplicar_en_sqlite(registros)
+    except Exception:
+        # Se reintentará en la siguiente instantánea
+        with _lock:
+            _estado["pendientes"] = registros + _estado["pendientes"]
+        raise
+
+    with _lock:
+        # Solo quedan en disco los registros escritos durante el volcado
+        _reescribir(_estado["pendientes"])
+
+    return len(registros)
+
+def _bucle_instantaneas():
+    """Toma instantáneas cada SNAPSHOT_INTERVALO segundos o al llenarse el journal"""
+    while True:
+        _hay_pendientes.wait(SNAPSHOT_INTERVALO)
+        _hay_pendientes.clear()
+        try:
+            tomar_instantanea()
+        except Exception:
+            pass
+
+def iniciar_instantaneas():
+    """Inicia (una sola vez) el hilo de instantáneas en segundo plano"""
+    with _lock:
+        if _estado["hilo"] is not None:
+            return
+
+        hilo = threading.Thread(target=_bucle_instantaneas, name="journal-instantaneas", daemon=True)
+        hilo.start()
+        _estado["hilo"] = hilo
+
+    atexit.register(tomar_instantanea)
@@ -1,11 +1,112 @@
 """
 Módulo CRUD para gestión de movimientos de inventario
 """
-import streamlit as st
+import heapq
 import pandas as pd
+import streamlit as st
 from datetime import datetime
+from data_manager import (
+    get_movimientos, insertar_fila, insertar_filas, actualizar_fila, eliminar_fila,
+    transaccion, bloqueo_lectura, reservar_id, reservar_ids, escritura,
+    registrar_derivado, obtener_derivado, obtener_filas
+)
 from inventario_crud import actualizar_stock_producto, obtener_producto
+from utils import (
+    normalizar_texto, texto_busqueda, indice_trigramas, actualizar_indice_trigramas,
+    candidatos_trigramas, SEPARADOR_BUSQUEDA
+)
+
+# ----------------------------
+# Índice de búsqueda combinado (ID, Tipo, Producto, Fecha y Usuario)
+# ----------------------------
+
+def _numero_movimiento(id_mov):
+    """Número de un ID de movimiento (M0012 -> 12), o -1 si no tiene ese formato"""
+    numero = id_mov[1:] if isinstance(id_mov, str) and id_mov.startswith("M") else ""
+    return int(numero) if numero.isdigit() else -1
+
+def _filas_busqueda(filas):
+    """Tuplas (id, texto normalizado, clave de orden) de un DataFrame de movimientos"""
+    fechas = pd.to_datetime(filas["Fecha"])
+    columnas = zip(
+        filas["ID_Movimiento"].tolist(), filas["Tipo"].astype(object).tolist(),
+        filas["Producto_ID"].tolist(), filas["Producto_Nombre"].tolist(),
+        fechas.dt.strftime("%Y-%m-%d").tolist(), filas["Usuario"].astype(object).tolist(),
+        fechas.to_numpy(dtype="int64").tolist()
+    )
+    return [
+        (id_mov, texto_busqueda(id_mov, tipo, producto_id, nombre, fecha, usuario),
+         (ns, _numero_movimiento(id_mov), id_mov))
+        for id_mov, tipo, producto_id, nombre, fecha, usuario, ns in columnas
+    ]
+
+def _construir_busqueda(movimientos):
+    """
+    Construye el índice de trigramas y la clave de orden de cada movimiento:
+    fecha y, a igual fecha, el número del ID (M1000 es posterior a M999)
+    """
+    indice = {"trigramas": indice_trigramas(), "orden": {}}
+    _aplicar_busqueda(indice, movimientos.iloc[:0], movimientos)
+    return indice
+
+def _aplicar_busqueda(indice, quitadas, agregadas):
+    """Actualiza el índice con los movimientos que salen y entran"""
+    quitados = _filas_busqueda(quitadas)
+    agregados = _filas_busqueda(agregadas)
+    actualizar_indice_trigramas(
+        indice["trigramas"],
+        [(id_mov, texto) for id_mov, texto, _ in quitados],
+        [(id_mov, texto) for id_mov, texto, _ in agregados]
+    )
+    for id_mov, _, _ in quitados:
+        indice["orden"].pop(id_mov, None)
+    for id_mov, _, orden in agregados:
+        indice["orden"][id_mov] = orden
+
+registrar_derivado("busqueda_movimientos", "movimientos", _construir_busqueda, _aplicar_busqueda)
+
+def buscar_movimientos(texto, pagina=1, por_pagina=50, prefijo=False):
+    """
+    Busca movimientos por ID, tipo, producto, fecha (AAAA-MM-DD) o usuario
+    con el índice de trigramas, sin distinguir mayúsculas ni tildes. Solo se
+    ordenan por fecha los movimientos de la página pedida (heap), no todos
+    los encontrados.
+    
+    Args:
+        texto: Texto a buscar
+        pagina: Número de página (desde 1)
+        por_pagina: Movimientos por página
+        prefijo: Si es True, solo coinciden los campos o palabras que
+            empiezan con el texto (si no, basta con que lo contengan)
+    
+    Returns:
+        tuple: (DataFrame con la página, más recientes primero; total de
+            movimientos encontrados)
+    """
+    consulta = normalizar_texto(texto).strip()
+    if not consulta:
+        return obtener_filas("movimientos", []).reset_index(drop=True), 0
+    
+    with bloqueo_lectura():
+        indice = obtener_derivado("busqueda_movimientos")
+        encontrados = candidatos_trigramas(indice["trigramas"], consulta)
+        
+        if prefijo:
+            textos = indice["trigramas"]["textos"]
+            encontrados = [
+                id_mov for id_mov in encontrados
+                if any(palabra.startswith(consulta)
+                       for campo in textos[id_mov].split(SEPARADOR_BUSQUEDA)
+                       for palabra in [campo, *campo.split()])
+            ]
+        
+        hasta = max(pagina, 1) * por_pagina
+        recientes = heapq.nlargest(hasta, encontrados, key=indice["orden"].__getitem__)
+    
+    ids = recientes[hasta - por_pagina:]
+    return obtener_filas("movimientos", ids).reset_index(drop=True), len(encontrados)
 
+@escritura
 def registrar_movimiento(id_mov, tipo, producto_id, cantidad, observaciones=""):
     """
     Registra un nuevo movimiento de inventario
@@ -22,47 +123,86 @@ def registrar_movimiento(id_mov, tipo, producto_id, cantidad, observaciones=""):
     """
     fecha_actual = datetime.now().strftime("%Y-%m-%d")
     
-    # Obtener información del producto
-    producto_info = obtener_producto(producto_id)
-    
-    if producto_info is None:
-        st.error("❌ Producto no encontrado.")
-        return False
-    
-    producto_nombre = producto_info["Nombre"]
-    stock_actual = int(producto_info["Cantidad"])
-    
-    # Validar stock suficiente para salidas
-    if tipo == "Salida" and cantidad > stock_actual:
-        st.error(
-            f"❌ No hay suficiente stock. Stock actual: {stock_actual}, "
-            f"intentaste sacar: {cantidad}."
-        )
-        return False
-    
-    # Crear movimiento
-    nuevo_movimiento = pd.DataFrame(
-        [[id_mov, tipo, producto_id, producto_nombre, cantidad, fecha_actual, 
-          st.session_state.username, observaciones]],
-        columns=["ID_Movimiento", "Tipo", "Producto_ID", "Producto_Nombre", 
-                "Cantidad", "Fecha", "Usuario", "Observaciones"]
-    )
+    # Validar, insertar y mover el stock como una transacción: o se guarda
+    # todo (secuencia, movimiento y stock) o no se guarda nada
+    with transaccion():
+        # Obtener información del producto
+        producto_info = obtener_producto(producto_id)
+        
+        if producto_info is None:
+            st.error("❌ Producto no encontrado.")
+            return False
+        
+        producto_nombre = producto_info["Nombre"]
+        stock_actual = int(producto_info["Cantidad"])
+        
+        # Validar stock suficiente para salidas
+        if tipo == "Salida" and cantidad > stock_actual:
+            st.error(
+                f"❌ No hay suficiente stock. Stock actual: {stock_actual}, "
+                f"intentaste sacar: {cantidad}."
+            )
+            return False
+        
+        # Crear movimiento (con un ID libre aunque otra sesión haya tomado id_mov)
+        id_mov = reservar_id("movimientos", id_mov)
+        insertar_fila("movimientos", {
+            "ID_Movimiento": id_mov,
+            "Tipo": tipo,
+            "Producto_ID": producto_id,
+            "Producto_Nombre": producto_nombre,
+            "Cantidad": cantidad,
+            "Fecha": fecha_actual,
+            "Usuario": st.session_state.username,
+            "Observaciones": observaciones
+        })
+        
+        # Actualizar inventario según el tipo de movimiento
+        if tipo in ["Entrada", "Devolución"]:
+            actualizar_stock_producto(producto_id, cantidad)
+        elif tipo in ["Salida", "Ajuste"] and cantidad < 0:
+            actualizar_stock_producto(producto_id, cantidad)
+        elif tipo == "Salida":
+            actualizar_stock_producto(producto_id, -cantidad)
     
-    st.session_state.movimientos = pd.concat(
-        [st.session_state.movimientos, nuevo_movimiento], 
-        ignore_index=True
-    )
+    return True
+
+@escritura
+def registrar_movimientos_lote(tipo, items, observaciones=""):
+    """
+    Registra varios movimientos del mismo tipo con un solo bloque de IDs y
+    una sola inserción. No modifica el stock: el llamador ya lo actualizó.
     
-    # Actualizar inventario según el tipo de movimiento
-    if tipo in ["Entrada", "Devolución"]:
-        actualizar_stock_producto(producto_id, cantidad)
-    elif tipo in ["Salida", "Ajuste"] and cantidad < 0:
-        actualizar_stock_producto(producto_id, cantidad)
-    elif tipo == "Salida":
-        actualizar_stock_producto(producto_id, -cantidad)
+    Args:
+        tipo: Tipo de movimiento (Salida, Devolución, ...)
+        items: list de dicts con "producto_id", "nombre", "cantidad" y
+            opcionalmente "observaciones" propias del item
+        observaciones: Observaciones para los items que no traen las suyas
     
-    return True
+    Returns:
+        list: IDs asignados a los movimientos
+    """
+    fecha_actual = datetime.now().strftime("%Y-%m-%d")
+    
+    with transaccion():
+        ids = reservar_ids("movimientos", len(items))
+        insertar_filas("movimientos", [
+            {
+                "ID_Movimiento": id_mov,
+                "Tipo": tipo,
+                "Producto_ID": item["producto_id"],
+                "Producto_Nombre": item["nombre"],
+                "Cantidad": item["cantidad"],
+                "Fecha": fecha_actual,
+                "Usuario": st.session_state.username,
+                "Observaciones": item.get("observaciones", observaciones)
+            }
+            for id_mov, item in zip(ids, items)
+        ])
+    
+    return ids
 
+@escritura
 def eliminar_movimiento(id_movimiento):
     """
     Elimina un movimiento (sin revertir cambios de stock)
@@ -70,10 +210,9 @@ def eliminar_movimiento(id_movimiento):
     Args:
         id_movimiento: ID del movimiento a eliminar
     """
-    st.session_state.movimientos = st.session_state.movimientos[
-        st.session_state.movimientos["ID_Movimiento"] != id_movimiento
-    ]
+    eliminar_fila("movimientos", id_movimiento)
 
+@escritura
 def actualizar_movimiento(id_mov, tipo, producto_id, cantidad, fecha, observaciones):
     """
     Actualiza los datos de un movimiento
@@ -86,19 +225,19 @@ def actualizar_movimiento(id_mov, tipo, producto_id, cantidad, fecha, observacio
         fecha: Nueva fecha
         observaciones: Nuevas observaciones
     """
-    idx = st.session_state.movimientos[
-        st.session_state.movimientos["ID_Movimiento"] == id_mov
-    ].index
-    
-    if not idx.empty:
+    if movimiento_existe(id_mov):
         # Obtener nombre del producto
         producto_info = obtener_producto(producto_id)
         producto_nombre = producto_info["Nombre"] if producto_info is not None else "Producto no encontrado"
         
-        st.session_state.movimientos.loc[
-            idx[0], 
-            ["Tipo", "Producto_ID", "Producto_Nombre", "Cantidad", "Fecha", "Observaciones"]
-        ] = [tipo, producto_id, producto_nombre, cantidad, fecha, observaciones]
+        actualizar_fila("movimientos", id_mov, {
+            "Tipo": tipo,
+            "Producto_ID": producto_id,
+            "Producto_Nombre": producto_nombre,
+            "Cantidad": cantidad,
+            "Fecha": fecha,
+            "Observaciones": observaciones
+        })
 
 def obtener_estadisticas_movimientos():
     """
@@ -107,7 +246,7 @@ def obtener_estadisticas_movimientos():
     Returns:
         tuple: (total_movimientos, entradas, salidas, ajustes)
     """
-    movimientos = st.session_state.movimientos
+    movimientos = get_movimientos()
     
     if movimientos.empty:
         return 0, 0, 0, 0
@@ -129,4 +268,4 @@ def movimiento_existe(id_movimiento):
     Returns:
         bool: True si el movimiento existe
     """
-    return id_movimiento in st.session_state.movimientos["ID_Movimiento"].values
+    return id_movimiento in get_movimientos()["ID_Movimiento"].values
@@ -1,11 +1,24 @@
 """
 Módulo CRUD para gestión de promociones
 """
+import bisect
+import numpy as np
 import streamlit as st
 import pandas as pd
 from datetime import datetime
+from config import TIPOS_PROMOCION, UMBRAL_CARRITO_VECTORIZADO
+from data_manager import (
+    get_promociones, get_ventas, get_venta_items, insertar_fila, actualizar_fila,
+    eliminar_fila, bloqueo_escritura, bloqueo_lectura, reservar_id, registrar_derivado,
+    obtener_derivado, obtener_fila, obtener_filas, escritura, transaccion
+)
 from inventario_crud import obtener_producto
+from utils import (
+    normalizar_texto, texto_busqueda, indice_trigramas, actualizar_indice_trigramas,
+    candidatos_trigramas
+)
 
+@escritura
 def crear_promocion(datos_promocion):
     """
     Crea una nueva promoción
@@ -49,27 +62,25 @@ def crear_promocion(datos_promocion):
         st.error("❌ El porcentaje debe estar entre 0 y 100.")
         return False
     
-    # Crear el registro
-    nueva_promocion = pd.DataFrame(
-        [[
-            datos_promocion["id"],
-            datos_promocion["nombre"],
-            datos_promocion["tipo"],
-            datos_promocion["valor"],
-            datos_promocion["producto_id"],
-            producto["Nombre"],  # Nombre del producto
-            datos_promocion["fecha_inicio"],
-            datos_promocion["fecha_fin"],
-            datos_promocion["estado"]
-        ]],
-        columns=["ID", "Nombre", "Tipo", "Valor", "Producto_ID", "Producto_Nombre",
-                "Fecha_Inicio", "Fecha_Fin", "Estado"]
-    )
-    
-    st.session_state.promociones = pd.concat(
-        [st.session_state.promociones, nueva_promocion],
-        ignore_index=True
-    )
+    # Crear el registro (la verificación de cruces, la secuencia y la inserción
+    # son una sola transacción)
+    with transaccion():
+        if datos_promocion["estado"] == "activa" and not _verificar_solapamiento(
+            datos_promocion["producto_id"], fecha_inicio, fecha_fin
+        ):
+            return False
+        
+        insertar_fila("promociones", {
+            "ID": reservar_id("promociones", datos_promocion["id"]),
+            "Nombre": datos_promocion["nombre"],
+            "Tipo": datos_promocion["tipo"],
+            "Valor": datos_promocion["valor"],
+            "Producto_ID": datos_promocion["producto_id"],
+            "Producto_Nombre": producto["Nombre"],  # Nombre del producto
+            "Fecha_Inicio": datos_promocion["fecha_inicio"],
+            "Fecha_Fin": datos_promocion["fecha_fin"],
+            "Estado": datos_promocion["estado"]
+        })
     
     return True
 
@@ -83,11 +94,32 @@ def obtener_promocion_por_id(promocion_id):
     Returns:
         Series: Datos de la promoción o None si no existe
     """
-    promociones = st.session_state.promociones
+    promociones = get_promociones()
     promocion = promociones[promociones["ID"] == promocion_id]
     
     return promocion.iloc[0] if not promocion.empty else None
 
+# ----------------------------
+# Claves de búsqueda de nombres (sin mayúsculas ni tildes)
+# ----------------------------
+
+def _nombres_busqueda(filas):
+    """Pares (id, nombre normalizado) de un DataFrame de promociones"""
+    return [(promocion_id, texto_busqueda(nombre))
+            for promocion_id, nombre in zip(filas["ID"].tolist(), filas["Nombre"].tolist())]
+
+def _construir_nombres(promociones):
+    """Construye el índice de trigramas de los nombres normalizados"""
+    indice = indice_trigramas()
+    actualizar_indice_trigramas(indice, [], _nombres_busqueda(promociones))
+    return indice
+
+def _aplicar_nombres(indice, quitadas, agregadas):
+    """Actualiza el índice con las promociones que salen y entran"""
+    actualizar_indice_trigramas(indice, _nombres_busqueda(quitadas), _nombres_busqueda(agregadas))
+
+registrar_derivado("nombres_promociones", "promociones", _construir_nombres, _aplicar_nombres)
+
 def buscar_promociones(filtros):
     """
     Busca promociones según filtros
@@ -106,17 +138,19 @@ def buscar_promociones(filtros):
     Returns:
         DataFrame: Promociones que cumplen los criterios
     """
-    promociones = st.session_state.promociones.copy()
+    # Filtrar por nombre (sin distinguir mayúsculas ni tildes: "lacteos"
+    # encuentra "Lácteos") con las claves ya normalizadas del índice
+    consulta = normalizar_texto(filtros.get("nombre")).strip()
+    if consulta:
+        with bloqueo_lectura():
+            ids = candidatos_trigramas(obtener_derivado("nombres_promociones"), consulta)
+        promociones = obtener_filas("promociones", ids, orden_tabla=True).reset_index(drop=True)
+    else:
+        promociones = get_promociones().copy()
     
     if promociones.empty:
         return promociones
     
-    # Filtrar por nombre
-    if filtros.get("nombre"):
-        promociones = promociones[
-            promociones["Nombre"].str.contains(filtros["nombre"], case=False, na=False)
-        ]
-    
     # Filtrar por tipo
     if filtros.get("tipo") and filtros["tipo"] != "Todos":
         promociones = promociones[promociones["Tipo"] == filtros["tipo"]]
@@ -131,13 +165,14 @@ def buscar_promociones(filtros):
     
     # Filtrar por rango de fechas
     if filtros.get("fecha_inicio"):
-        promociones = promociones[promociones["Fecha_Inicio"] >= filtros["fecha_inicio"]]
+        promociones = promociones[promociones["Fecha_Inicio"] >= pd.Timestamp(filtros["fecha_inicio"])]
     
     if filtros.get("fecha_fin"):
-        promociones = promociones[promociones["Fecha_Fin"] <= filtros["fecha_fin"]]
+        promociones = promociones[promociones["Fecha_Fin"] <= pd.Timestamp(filtros["fecha_fin"])]
     
     return promociones
 
+@escritura
 def actualizar_promocion(promocion_id, nuevos_datos):
     """
     Actualiza los datos de una promoción
@@ -149,11 +184,7 @@ def actualizar_promocion(promocion_id, nuevos_datos):
     Returns:
         bool: True si se actualizó exitosamente
     """
-    idx = st.session_state.promociones[
-        st.session_state.promociones["ID"] == promocion_id
-    ].index
-    
-    if idx.empty:
+    if not promocion_existe(promocion_id):
         st.error(f"❌ No existe promoción con ID {promocion_id}")
         return False
     
@@ -185,23 +216,37 @@ def actualizar_promocion(promocion_id, nuevos_datos):
             return False
     
     # Actualizar campos
-    for campo, valor in nuevos_datos.items():
-        columna_map = {
-            "nombre": "Nombre",
-            "tipo": "Tipo",
-            "valor": "Valor",
-            "producto_id": "Producto_ID",
-            "producto_nombre": "Producto_Nombre",
-            "fecha_inicio": "Fecha_Inicio",
-            "fecha_fin": "Fecha_Fin",
-            "estado": "Estado"
-        }
+    columna_map = {
+        "nombre": "Nombre",
+        "tipo": "Tipo",
+        "valor": "Valor",
+        "producto_id": "Producto_ID",
+        "producto_nombre": "Producto_Nombre",
+        "fecha_inicio": "Fecha_Inicio",
+        "fecha_fin": "Fecha_Fin",
+        "estado": "Estado"
+    }
+    cambios = {
+        columna_map[campo]: valor
+        for campo, valor in nuevos_datos.items()
+        if campo in columna_map
+    }
+    
+    with bloqueo_escritura():
+        # Verificar cruces con la promoción tal como quedaría
+        resultante = obtener_fila("promociones", promocion_id).to_dict()
+        resultante.update(cambios)
+        if resultante["Estado"] == "activa" and not _verificar_solapamiento(
+            resultante["Producto_ID"], resultante["Fecha_Inicio"], resultante["Fecha_Fin"],
+            excluir=promocion_id
+        ):
+            return False
         
-        if campo in columna_map:
-            st.session_state.promociones.loc[idx[0], columna_map[campo]] = valor
+        actualizar_fila("promociones", promocion_id, cambios)
     
     return True
 
+@escritura
 def eliminar_promocion(promocion_id):
     """
     Elimina una promoción
@@ -216,12 +261,105 @@ def eliminar_promocion(promocion_id):
         st.error(f"❌ No existe promoción con ID {promocion_id}")
         return False
     
-    st.session_state.promociones = st.session_state.promociones[
-        st.session_state.promociones["ID"] != promocion_id
-    ]
+    eliminar_fila("promociones", promocion_id)
     
     return True
 
+# ----------------------------
+# Índice de vigencias (intervalos Fecha_Inicio..Fecha_Fin)
+# ----------------------------
+
+# Mayor que cualquier ID: para buscar "todas las entradas con esta fecha"
+_ID_MAXIMO = chr(0x10FFFF)
+
+def _filas_vigencia(filas):
+    """Tuplas (id, inicio, fin, estado) de un DataFrame de promociones"""
+    return zip(
+        filas["ID"].tolist(), filas["Fecha_Inicio"].tolist(),
+        filas["Fecha_Fin"].tolist(), filas["Estado"].astype(object).tolist()
+    )
+
+def _construir_vigencias(promociones):
+    """
+    Construye el índice de vigencias: extremos de los intervalos de las
+    promociones activas ordenados por inicio y por fin, conteo por estado y
+    la memoria del conjunto vigente del día
+    """
+    vigencias = {"inicios": [], "fines": [], "intervalos": {}, "estados": {}, "memo": None}
+    for promocion_id, inicio, fin, estado in _filas_vigencia(promociones):
+        _vigencias_contar(vigencias, estado, 1)
+        if estado == "activa" and not (pd.isna(inicio) or pd.isna(fin)):
+            intervalo = (pd.Timestamp(inicio).value, pd.Timestamp(fin).value)
+            vigencias["intervalos"][promocion_id] = intervalo
+            vigencias["inicios"].append((intervalo[0], promocion_id))
+            vigencias["fines"].append((intervalo[1], promocion_id))
+    
+    vigencias["inicios"].sort()
+    vigencias["fines"].sort()
+    return vigencias
+
+def _vigencias_contar(vigencias, estado, signo):
+    """Suma signo al conteo de promociones del estado dado"""
+    estado = None if pd.isna(estado) else estado
+    vigencias["estados"][estado] = vigencias["estados"].get(estado, 0) + signo
+
+def _aplicar_vigencias(vigencias, quitadas, agregadas):
+    """Actualiza el índice con las promociones que salen y entran"""
+    for promocion_id, _, _, estado in _filas_vigencia(quitadas):
+        _vigencias_contar(vigencias, estado, -1)
+        intervalo = vigencias["intervalos"].pop(promocion_id, None)
+        if intervalo is not None:
+            for lista, valor in ((vigencias["inicios"], intervalo[0]), (vigencias["fines"], intervalo[1])):
+                del lista[bisect.bisect_left(lista, (valor, promocion_id))]
+    
+    for promocion_id, inicio, fin, estado in _filas_vigencia(agregadas):
+        _vigencias_contar(vigencias, estado, 1)
+        if estado == "activa" and not (pd.isna(inicio) or pd.isna(fin)):
+            intervalo = (pd.Timestamp(inicio).value, pd.Timestamp(fin).value)
+            vigencias["intervalos"][promocion_id] = intervalo
+            bisect.insort(vigencias["inicios"], (intervalo[0], promocion_id))
+            bisect.insort(vigencias["fines"], (intervalo[1], promocion_id))
+    
+    # Cualquier cambio invalida el conjunto vigente memorizado
+    vigencias["memo"] = None
+
+registrar_derivado("vigencias_promociones", "promociones", _construir_vigencias, _aplicar_vigencias)
+
+def _ids_vigentes(vigencias, dia):
+    """
+    IDs de las promociones activas cuyo intervalo contiene el día. Se
+    recorre el lado más corto: las que ya empezaron o las que aún no
+    terminan (las temporadas pasadas quedan fuera por búsqueda binaria).
+    
+    Args:
+        vigencias: Índice de vigencias
+        dia: Fecha consultada
+    
+    Returns:
+        list: IDs vigentes
+    """
+    if vigencias["memo"] is not None and vigencias["memo"][0] == dia:
+        return vigencias["memo"][1]
+    
+    instante = pd.Timestamp(dia).value
+    iniciadas = bisect.bisect_right(vigencias["inicios"], (instante, _ID_MAXIMO))
+    terminadas = bisect.bisect_left(vigencias["fines"], (instante, ""))
+    
+    if iniciadas <= len(vigencias["fines"]) - terminadas:
+        ids = [
+            promocion_id for _, promocion_id in vigencias["inicios"][:iniciadas]
+            if vigencias["intervalos"][promocion_id][1] >= instante
+        ]
+    else:
+        ids = [
+            promocion_id for _, promocion_id in vigencias["fines"][terminadas:]
+            if vigencias["intervalos"][promocion_id][0] <= instante
+        ]
+    
+    # La memoria es por fecha: al pasar la medianoche deja de coincidir
+    vigencias["memo"] = (dia, ids)
+    return ids
+
 def obtener_promociones_activas():
     """
     Obtiene todas las promociones activas vigentes
@@ -229,25 +367,285 @@ def obtener_promociones_activas():
     Returns:
         DataFrame: Promociones activas en el rango de fechas actual
     """
-    promociones = st.session_state.promociones
+    with bloqueo_lectura():
+        ids = _ids_vigentes(obtener_derivado("vigencias_promociones"), datetime.now().date())
+        return obtener_filas("promociones", ids, orden_tabla=True).reset_index(drop=True)
+
+# ----------------------------
+# Intervalos por producto (detección de promociones que se cruzan)
+# ----------------------------
+
+def _construir_intervalos_productos(promociones):
+    """
+    Construye {producto_id: {"lista": [(inicio, fin, id)] ordenada por inicio,
+    "max_fin": máximo acumulado de los fines}}, solo con las promociones activas
+    """
+    intervalos = {}
+    _aplicar_intervalos_productos(intervalos, promociones.iloc[:0], promociones)
+    return intervalos
+
+def _intervalos_filas(filas):
+    """Tuplas (producto_id, (inicio, fin, id)) de las promociones activas con fechas"""
+    columnas = zip(
+        filas["ID"].tolist(), filas["Producto_ID"].tolist(), filas["Fecha_Inicio"].tolist(),
+        filas["Fecha_Fin"].tolist(), filas["Estado"].astype(object).tolist()
+    )
+    for promocion_id, producto_id, inicio, fin, estado in columnas:
+        if estado == "activa" and not (pd.isna(inicio) or pd.isna(fin)):
+            yield producto_id, (pd.Timestamp(inicio).value, pd.Timestamp(fin).value, promocion_id)
+
+def _aplicar_intervalos_productos(intervalos, quitadas, agregadas):
+    """Actualiza los intervalos por producto con las promociones que salen y entran"""
+    tocados = {}
+    for producto_id, intervalo in _intervalos_filas(quitadas):
+        lista = intervalos.get(producto_id, {"lista": []})["lista"]
+        posicion = bisect.bisect_left(lista, intervalo)
+        if posicion < len(lista) and lista[posicion] == intervalo:
+            del lista[posicion]
+            tocados[producto_id] = min(tocados.get(producto_id, posicion), posicion)
+    
+    for producto_id, intervalo in _intervalos_filas(agregadas):
+        lista = intervalos.setdefault(producto_id, {"lista": [], "max_fin": []})["lista"]
+        posicion = bisect.bisect_left(lista, intervalo)
+        lista.insert(posicion, intervalo)
+        tocados[producto_id] = min(tocados.get(producto_id, posicion), posicion)
+    
+    # El máximo acumulado solo cambia desde la primera posición tocada
+    for producto_id, desde in tocados.items():
+        entrada = intervalos[producto_id]
+        lista, max_fin = entrada["lista"], entrada["max_fin"]
+        del max_fin[desde:]
+        for _, fin, _ in lista[desde:]:
+            max_fin.append(max(fin, max_fin[-1]) if max_fin else fin)
+        if not lista:
+            del intervalos[producto_id]
+
+registrar_derivado(
+    "intervalos_productos", "promociones",
+    _construir_intervalos_productos, _aplicar_intervalos_productos
+)
+
+def _solapamientos(entrada, inicio, fin, excluir=None):
+    """
+    Promociones de un producto cuyo intervalo se cruza con [inicio, fin].
+    No supone que las promociones registradas sean disjuntas (pueden venir
+    de datos anteriores a esta validación): se recorren hacia atrás las que
+    empiezan antes del fin y se corta cuando el máximo acumulado de los
+    fines ya no alcanza el inicio.
     
-    if promociones.empty:
-        return promociones
+    Args:
+        entrada: {"lista", "max_fin"} del producto (o None si no tiene)
+        inicio: Inicio del intervalo (ns)
+        fin: Fin del intervalo (ns)
+        excluir: ID a ignorar (la propia promoción al actualizar)
     
-    fecha_actual = datetime.now().strftime("%Y-%m-%d")
+    Returns:
+        list: IDs de las promociones que se cruzan, por fecha de inicio
+    """
+    if not entrada:
+        return []
+    
+    lista, max_fin = entrada["lista"], entrada["max_fin"]
+    cruces = []
+    posicion = bisect.bisect_right(lista, (fin, float("inf")))
+    for i in range(posicion - 1, -1, -1):
+        if max_fin[i] < inicio:
+            break
+        if lista[i][1] >= inicio and lista[i][2] != excluir:
+            cruces.append(lista[i][2])
+    
+    cruces.reverse()
+    return cruces
+
+def _verificar_solapamiento(producto_id, fecha_inicio, fecha_fin, excluir=None):
+    """
+    Muestra un error si el intervalo se cruza con otra promoción activa del
+    producto. Debe llamarse con el lock de escritura tomado.
     
-    # Filtrar por estado activo y fechas vigentes
-    promociones_activas = promociones[
-        (promociones["Estado"] == "activa") &
-        (promociones["Fecha_Inicio"] <= fecha_actual) &
-        (promociones["Fecha_Fin"] >= fecha_actual)
+    Returns:
+        bool: True si no hay cruce
+    """
+    entrada = obtener_derivado("intervalos_productos").get(producto_id)
+    cruces = _solapamientos(
+        entrada, pd.Timestamp(fecha_inicio).value, pd.Timestamp(fecha_fin).value, excluir
+    )
+    if cruces:
+        st.error(
+            f"❌ El producto {producto_id} ya tiene una promoción activa en esas fechas: "
+            f"{', '.join(cruces)}."
+        )
+        return False
+    return True
+
+def validar_calendario_promociones(calendario):
+    """
+    Valida en una sola pasada un calendario de promociones a importar:
+    cruces entre filas del propio calendario y con las promociones activas
+    ya registradas
+    
+    Args:
+        calendario: list de dicts con el formato de crear_promocion
+            ("estado" es opcional y vale "activa" por defecto)
+    
+    Returns:
+        list: Problemas encontrados, en orden de fila
+            [{"fila": 3, "nombre": "...", "producto_id": "P001",
+              "motivo": "Se cruza con PR004"}]
+    """
+    problemas = []
+    activas = []
+    for fila, datos in enumerate(calendario):
+        if not datos.get("producto_id"):
+            problemas.append((fila, datos, "Falta el producto"))
+            continue
+        try:
+            inicio = pd.Timestamp(datetime.strptime(datos["fecha_inicio"], "%Y-%m-%d")).value
+            fin = pd.Timestamp(datetime.strptime(datos["fecha_fin"], "%Y-%m-%d")).value
+        except (KeyError, TypeError, ValueError):
+            problemas.append((fila, datos, "Formato de fecha inválido"))
+            continue
+        if fin < inicio:
+            problemas.append((fila, datos, "La fecha de fin es anterior a la de inicio"))
+        elif datos.get("estado", "activa") == "activa":
+            activas.append((datos["producto_id"], inicio, fin, fila, datos))
+    
+    # Barrido por producto y fecha de inicio (un solo ordenamiento)
+    activas.sort(key=lambda a: (a[0], a[1]))
+    with bloqueo_lectura():
+        intervalos = obtener_derivado("intervalos_productos")
+        previa = None
+        for producto_id, inicio, fin, fila, datos in activas:
+            cruces = _solapamientos(intervalos.get(producto_id), inicio, fin, datos.get("id"))
+            if cruces:
+                problemas.append((fila, datos, f"Se cruza con {', '.join(cruces)}"))
+            if previa is not None and previa[0] == producto_id and previa[2] >= inicio:
+                problemas.append((fila, datos, f"Se cruza con la fila {previa[3] + 1} del calendario"))
+            if previa is None or previa[0] != producto_id or fin > previa[2]:
+                previa = (producto_id, inicio, fin, fila)
+    
+    problemas.sort(key=lambda p: p[0])
+    return [
+        {
+            "fila": fila + 1,
+            "nombre": datos.get("nombre", ""),
+            "producto_id": datos.get("producto_id", ""),
+            "motivo": motivo
+        }
+        for fila, datos, motivo in problemas
     ]
+
+# ----------------------------
+# Motor de promociones compilado (producto -> reglas)
+# ----------------------------
+
+def _construir_motor(promociones):
+    """Motor vacío: se compila al primer uso del día"""
+    return {"dia": None, "compilado": None}
+
+def _invalidar_motor(motor, quitadas, agregadas):
+    """Cualquier cambio en promociones obliga a recompilar las reglas"""
+    motor["dia"] = None
+
+registrar_derivado("motor_promociones", "promociones", _construir_motor, _invalidar_motor)
+
+def _compilar_reglas(promociones):
+    """
+    Compila promociones en un diccionario producto_id -> reglas
+
+    Args:
+        promociones: DataFrame de promociones vigentes
+
+    Returns:
+        dict: {producto_id: [(posicion, nombre, tipo, valor)]}, en el orden
+            de la tabla
+    """
+    reglas = {}
+    columnas = zip(
+        promociones["Producto_ID"].tolist(), promociones["Nombre"].tolist(),
+        promociones["Tipo"].astype(object).tolist(), promociones["Valor"].tolist()
+    )
+    for posicion, (producto_id, nombre, tipo, valor) in enumerate(columnas):
+        reglas.setdefault(producto_id, []).append((posicion, nombre, tipo, valor))
+    return reglas
+
+def _compilar_arreglos(reglas):
+    """
+    Versión en arreglos de las reglas compiladas, agrupadas por producto,
+    para el cálculo vectorizado
+
+    Args:
+        reglas: dict {producto_id: [(posicion, nombre, tipo, valor)]}
+
+    Returns:
+        dict: "rangos" {producto_id: (desde, hasta)} sobre los arreglos
+            "posicion", "nombre", "tipo" (índice en TIPOS_PROMOCION, -1 si
+            es desconocido) y "valor"
+    """
+    rangos = {}
+    planas = []
+    for producto_id, lista in reglas.items():
+        rangos[producto_id] = (len(planas), len(planas) + len(lista))
+        planas.extend(lista)
     
-    return promociones_activas
+    codigos = {tipo: codigo for codigo, tipo in enumerate(TIPOS_PROMOCION)}
+    return {
+        "rangos": rangos,
+        "posicion": np.array([r[0] for r in planas], dtype=np.int64),
+        "nombre": np.array([r[1] for r in planas], dtype=object),
+        "tipo": np.array([codigos.get(r[2], -1) for r in planas], dtype=np.int8),
+        "valor": np.array([r[3] for r in planas], dtype=np.float64)
+    }
+
+def _reglas_vigentes():
+    """
+    Reglas de las promociones vigentes hoy; se recompilan solo cuando
+    cambian las promociones o cambia el día
+
+    Returns:
+        dict: "reglas" {producto_id: [(posicion, nombre, tipo, valor)]} y
+            "arreglos" (ver _compilar_arreglos)
+    """
+    hoy = datetime.now().date()
+    with bloqueo_lectura():
+        motor = obtener_derivado("motor_promociones")
+        if motor["dia"] != hoy:
+            reglas = _compilar_reglas(obtener_promociones_activas())
+            motor["compilado"] = {"reglas": reglas, "arreglos": _compilar_arreglos(reglas)}
+            motor["dia"] = hoy
+        return motor["compilado"]
+
+def _descuento_regla(tipo, valor, cantidad, precio_unitario):
+    """
+    Descuento de una regla sobre una línea del carrito
+
+    Args:
+        tipo: Tipo de promoción
+        valor: Valor de la promoción
+        cantidad: Unidades de la línea
+        precio_unitario: Precio por unidad
+
+    Returns:
+        float: Descuento de la línea
+    """
+    if tipo == "2x1":
+        # Por cada 2 unidades, descuenta 1
+        return (cantidad // 2) * precio_unitario
+    
+    if tipo == "porcentaje":
+        # Descuento porcentual sobre el subtotal del item
+        return cantidad * precio_unitario * (valor / 100)
+    
+    if tipo == "monto fijo":
+        # Descuento fijo por unidad
+        return min(valor * cantidad, cantidad * precio_unitario)
+    
+    return 0
 
 def aplicar_promociones_a_carrito(carrito):
     """
-    Aplica promociones a un carrito de compras
+    Aplica promociones a un carrito de compras. Cada item consulta solo las
+    reglas de su producto en el motor compilado: O(items). Los carritos de
+    UMBRAL_CARRITO_VECTORIZADO líneas o más se calculan con arreglos NumPy.
     
     Args:
         carrito: list de dicts con productos del carrito
@@ -270,6 +668,8 @@ def aplicar_promociones_a_carrito(carrito):
                 "promociones_aplicadas": [
                     {
                         "nombre": "2x1 en Gaseosas",
+                        "producto": "Inca Kola 1.5L",
+                        "producto_id": "P001",
                         "descuento": 15.00
                     }
                 ],
@@ -285,44 +685,14 @@ def aplicar_promociones_a_carrito(carrito):
             "items": []
         }
     
-    promociones_activas = obtener_promociones_activas()
+    compilado = _reglas_vigentes()
     
-    subtotal = sum(item["cantidad"] * item["precio_unitario"] for item in carrito)
-    descuento_total = 0
-    promociones_aplicadas = []
-    
-    # Aplicar promociones
-    for _, promocion in promociones_activas.iterrows():
-        for item in carrito:
-            if item["producto_id"] == promocion["Producto_ID"]:
-                descuento_item = 0
-                
-                # Aplicar según tipo de promoción
-                if promocion["Tipo"] == "2x1":
-                    # Por cada 2 unidades, descuenta 1
-                    pares = item["cantidad"] // 2
-                    descuento_item = pares * item["precio_unitario"]
-                
-                elif promocion["Tipo"] == "porcentaje":
-                    # Descuento porcentual sobre el subtotal del item
-                    subtotal_item = item["cantidad"] * item["precio_unitario"]
-                    descuento_item = subtotal_item * (promocion["Valor"] / 100)
-                
-                elif promocion["Tipo"] == "monto fijo":
-                    # Descuento fijo por unidad
-                    descuento_item = min(
-                        promocion["Valor"] * item["cantidad"],
-                        item["cantidad"] * item["precio_unitario"]
-                    )
-                
-                if descuento_item > 0:
-                    descuento_total += descuento_item
-                    promociones_aplicadas.append({
-                        "nombre": promocion["Nombre"],
-                        "producto": item["nombre"],
-                        "descuento": descuento_item
-                    })
+    if len(carrito) >= UMBRAL_CARRITO_VECTORIZADO:
+        subtotal, promociones_aplicadas = _calcular_vectorizado(carrito, compilado["arreglos"])
+    else:
+        subtotal, promociones_aplicadas = _calcular_por_item(carrito, compilado["reglas"])
     
+    descuento_total = sum(promocion["descuento"] for promocion in promociones_aplicadas)
     total = max(0, subtotal - descuento_total)
     
     return {
@@ -333,42 +703,221 @@ def aplicar_promociones_a_carrito(carrito):
         "items": carrito
     }
 
-def obtener_estadisticas_promociones():
+def _calcular_por_item(carrito, reglas):
+    """
+    Calcula subtotal y promociones aplicadas item por item (carritos chicos)
+
+    Returns:
+        tuple: (subtotal, promociones_aplicadas)
     """
-    Obtiene estadísticas de promociones
+    subtotal = sum(item["cantidad"] * item["precio_unitario"] for item in carrito)
+    aplicadas = []
     
+    for orden_item, item in enumerate(carrito):
+        for posicion, nombre, tipo, valor in reglas.get(item["producto_id"], ()):
+            descuento_item = _descuento_regla(tipo, valor, item["cantidad"], item["precio_unitario"])
+            
+            if descuento_item > 0:
+                aplicadas.append(((posicion, orden_item), {
+                    "nombre": nombre,
+                    "producto": item["nombre"],
+                    "producto_id": item["producto_id"],
+                    "descuento": descuento_item
+                }))
+    
+    # Mismo orden que antes: por promoción y luego por item del carrito
+    return subtotal, [promocion for _, promocion in sorted(aplicadas, key=lambda a: a[0])]
+
+def _descuentos_arreglo(tipo, valor, cantidad, precio_unitario):
+    """
+    Versión sobre arreglos de _descuento_regla (mismas operaciones, mismos
+    resultados)
+
+    Args:
+        tipo: Arreglo de códigos de tipo (índice en TIPOS_PROMOCION)
+        valor: Arreglo de valores de la promoción
+        cantidad: Arreglo de unidades (enteros)
+        precio_unitario: Arreglo de precios por unidad
+
     Returns:
-        dict: Estadísticas generales
+        ndarray: Descuento de cada par (línea, regla)
     """
-    promociones = st.session_state.promociones
+    bruto = cantidad * precio_unitario
+    return np.select(
+        [tipo == 0, tipo == 1, tipo == 2],
+        [(cantidad // 2) * precio_unitario, bruto * (valor / 100), np.minimum(valor * cantidad, bruto)],
+        default=0.0
+    )
+
+def _calcular_vectorizado(carrito, arreglos):
+    """
+    Calcula subtotal y promociones aplicadas con arreglos NumPy: cada item se
+    une con las reglas de su producto y los tres tipos de descuento se
+    evalúan como expresiones sobre arreglos (carritos mayoristas)
+
+    Returns:
+        tuple: (subtotal, promociones_aplicadas), iguales a _calcular_por_item
+    """
+    n = len(carrito)
+    cantidad = np.fromiter((item["cantidad"] for item in carrito), dtype=np.int64, count=n)
+    precio = np.fromiter((item["precio_unitario"] for item in carrito), dtype=np.float64, count=n)
     
-    if promociones.empty:
-        return {
-            "total": 0,
-            "activas": 0,
-            "inactivas": 0,
-            "vigentes": 0
+    # Suma secuencial (cumsum) para obtener exactamente el mismo float que sum()
+    subtotal = float(np.cumsum(cantidad * precio)[-1])
+    
+    # Unión item -> reglas de su producto
+    rangos = np.array(
+        [arreglos["rangos"].get(item["producto_id"], (0, 0)) for item in carrito], dtype=np.int64
+    )
+    largos = rangos[:, 1] - rangos[:, 0]
+    item = np.repeat(np.arange(n), largos)
+    regla = np.arange(len(item)) - np.repeat(np.cumsum(largos) - largos, largos) + np.repeat(rangos[:, 0], largos)
+    
+    descuento = _descuentos_arreglo(
+        arreglos["tipo"][regla], arreglos["valor"][regla], cantidad[item], precio[item]
+    )
+    
+    # Mismo orden que el cálculo por item: por promoción y luego por item
+    aplicadas = np.flatnonzero(descuento > 0)
+    aplicadas = aplicadas[np.lexsort((item[aplicadas], arreglos["posicion"][regla[aplicadas]]))]
+    
+    filas = zip(
+        arreglos["nombre"][regla[aplicadas]].tolist(),
+        item[aplicadas].tolist(),
+        descuento[aplicadas].tolist()
+    )
+    return subtotal, [
+        {
+            "nombre": nombre,
+            "producto": carrito[i]["nombre"],
+            "producto_id": carrito[i]["producto_id"],
+            "descuento": monto
         }
+        for nombre, i, monto in filas
+    ]
+
+def simular_promociones(candidatas, meses=3):
+    """
+    Simula el costo de promociones candidatas sobre el historial de ventas:
+    vuelve a calcular todas las líneas vendidas en los últimos meses con las
+    reglas candidatas, en lote (una unión líneas x reglas y expresiones sobre
+    arreglos), con la misma semántica que aplicar_promociones_a_carrito.
+    El descuento simulado se suma al ya otorgado (las promociones se
+    acumulan) sin superar el importe de la línea. Solo cuentan las unidades
+    que no se devolvieron.
+    
+    Args:
+        candidatas: list de dicts con "tipo", "valor", "producto_id" y
+            opcionalmente "nombre" (mismo formato que crear_promocion)
+        meses: Meses de historial a simular
     
-    fecha_actual = datetime.now().strftime("%Y-%m-%d")
+    Returns:
+        dict: Resultado de la simulación
+            {
+                "lineas": 120,              # líneas del periodo
+                "lineas_afectadas": 35,
+                "ventas_afectadas": 30,
+                "descuento_actual": 80.50,
+                "descuento_simulado": 140.00,
+                "delta_descuento": 59.50,
+                "ingresos_actuales": 1500.00,
+                "ingresos_simulados": 1440.50,
+                "delta_ingresos": -59.50,
+                "por_promocion": [{"nombre", "producto_id", "lineas", "descuento"}]
+            }
+            El descuento de cada candidata ya está recortado al importe de
+            la línea: por_promocion suma delta_descuento.
+    """
+    items = get_venta_items()
+    ventas = get_ventas()
+    desde = pd.Timestamp(datetime.now()) - pd.DateOffset(months=meses)
+    
+    # Líneas de ventas del periodo (unión por ID_Venta, sin recorrer tickets)
+    fechas = items["ID_Venta"].map(pd.Series(ventas["Fecha"].to_numpy(), index=ventas["ID"]))
+    lineas = items[fechas >= desde].reset_index(drop=True)
+    
+    # Las unidades devueltas no son ingresos: el importe y el descuento ya
+    # otorgado se prorratean a lo que quedó vendido (como _montos_devueltos)
+    vendidas = lineas["Cantidad"].to_numpy(dtype=np.int64)
+    lineas["Netas"] = vendidas - lineas["Devuelto"].to_numpy(dtype=np.int64)
+    
+    codigos = {tipo: codigo for codigo, tipo in enumerate(TIPOS_PROMOCION)}
+    reglas = pd.DataFrame({
+        "Regla": range(len(candidatas)),
+        "Nombre_Regla": [c.get("nombre", f"Candidata {n + 1}") for n, c in enumerate(candidatas)],
+        "Producto_ID": [c["producto_id"] for c in candidatas],
+        "Tipo_Codigo": np.array([codigos.get(c["tipo"], -1) for c in candidatas], dtype=np.int8),
+        "Valor_Regla": np.array([c["valor"] for c in candidatas], dtype=np.float64)
+    })
+    
+    pares = lineas.reset_index(names="Linea").merge(reglas, on="Producto_ID")
+    pares["Simulado"] = _descuentos_arreglo(
+        pares["Tipo_Codigo"].to_numpy(), pares["Valor_Regla"].to_numpy(),
+        pares["Netas"].to_numpy(dtype=np.int64), pares["Precio_Unitario"].to_numpy()
+    )
     
-    total = len(promociones)
-    activas = len(promociones[promociones["Estado"] == "activa"])
-    inactivas = len(promociones[promociones["Estado"] == "inactiva"])
+    netas = lineas["Netas"].to_numpy()
+    bruto = netas * lineas["Precio_Unitario"].to_numpy()
+    actual = lineas["Descuento"].fillna(0).to_numpy() * netas / np.maximum(vendidas, 1)
+    adicional = np.bincount(pares["Linea"].to_numpy(), weights=pares["Simulado"].to_numpy(), minlength=len(lineas))
+    simulado = np.minimum(actual + adicional, np.maximum(bruto, actual))
     
-    vigentes = len(promociones[
-        (promociones["Estado"] == "activa") &
-        (promociones["Fecha_Inicio"] <= fecha_actual) &
-        (promociones["Fecha_Fin"] >= fecha_actual)
-    ])
+    # El recorte de cada línea se reparte entre sus candidatas en proporción
+    # a su descuento, antes de agregar por promoción
+    aplicado = simulado - actual
+    proporcion = np.divide(aplicado, adicional, out=np.zeros(len(lineas)), where=adicional > 0)
+    pares["Simulado"] = pares["Simulado"].to_numpy() * proporcion[pares["Linea"].to_numpy()]
+    pares = pares[pares["Simulado"] > 0]
+    
+    por_promocion = pares.groupby(["Regla", "Nombre_Regla", "Producto_ID"]).agg(
+        lineas=("Linea", "size"), descuento=("Simulado", "sum")
+    ).reset_index()
+    
+    descuento_actual = float(actual.sum())
+    descuento_simulado = float(simulado.sum())
+    ingresos_actuales = float((bruto - actual).sum())
+    ingresos_simulados = float((bruto - simulado).sum())
     
     return {
-        "total": total,
-        "activas": activas,
-        "inactivas": inactivas,
-        "vigentes": vigentes
+        "lineas": len(lineas),
+        "lineas_afectadas": int((aplicado > 0).sum()),
+        "ventas_afectadas": int(lineas.loc[aplicado > 0, "ID_Venta"].nunique()),
+        "descuento_actual": round(descuento_actual, 2),
+        "descuento_simulado": round(descuento_simulado, 2),
+        "delta_descuento": round(descuento_simulado - descuento_actual, 2),
+        "ingresos_actuales": round(ingresos_actuales, 2),
+        "ingresos_simulados": round(ingresos_simulados, 2),
+        "delta_ingresos": round(ingresos_simulados - ingresos_actuales, 2),
+        "por_promocion": [
+            {
+                "nombre": fila.Nombre_Regla,
+                "producto_id": fila.Producto_ID,
+                "lineas": int(fila.lineas),
+                "descuento": round(float(fila.descuento), 2)
+            }
+            for fila in por_promocion.itertuples()
+        ]
     }
 
+def obtener_estadisticas_promociones():
+    """
+    Obtiene estadísticas de promociones desde el índice de vigencias
+    
+    Returns:
+        dict: Estadísticas generales
+    """
+    with bloqueo_lectura():
+        vigencias = obtener_derivado("vigencias_promociones")
+        estados = vigencias["estados"]
+        vigentes = len(_ids_vigentes(vigencias, datetime.now().date()))
+        
+        return {
+            "total": sum(estados.values()),
+            "activas": estados.get("activa", 0),
+            "inactivas": estados.get("inactiva", 0),
+            "vigentes": vigentes
+        }
+
 def promocion_existe(promocion_id):
     """
     Verifica si una promoción existe
@@ -379,4 +928,4 @@ def promocion_existe(promocion_id):
     Returns:
         bool: True si la promoción existe
     """
-    return promocion_id in st.session_state.promociones["ID"].values
+    return promocion_id in get_promociones()["ID"].values
@@ -0,0 +1,192 @@
+"""
+Esquema tipado de las tablas del sistema
+Registro central de dtypes: todas las tablas se convierten a estos tipos
+compactos (category, enteros de ancho fijo, float y datetime64)
+"""
+import pandas as pd
+from config import (
+    CATEGORIAS, TIPOS_MOVIMIENTO, TIPOS_PROMOCION, ESTADOS_PROMOCION,
+    METODOS_PAGO, EMPLEADOS_AUTORIZADOS
+)
+
+# dtype de cada columna, en el orden de las columnas de la tabla
+ESQUEMAS = {
+    "inventario": {
+        "ID": "object",
+        "Nombre": "object",
+        "Categoría": "category",
+        "Cantidad": "int32",
+        "Precio": "float64",
+        "Fecha_Agregado": "datetime64[ns]",
+        "Version": "int64"
+    },
+    "movimientos": {
+        "ID_Movimiento": "object",
+        "Tipo": "category",
+        "Producto_ID": "object",
+        "Producto_Nombre": "object",
+        "Cantidad": "int32",
+        "Fecha": "datetime64[ns]",
+        "Usuario": "category",
+        "Observaciones": "object"
+    },
+    "promociones": {
+        "ID": "object",
+        "Nombre": "object",
+        "Tipo": "category",
+        "Valor": "float64",
+        "Producto_ID": "object",
+        "Producto_Nombre": "object",
+        "Fecha_Inicio": "datetime64[ns]",
+        "Fecha_Fin": "datetime64[ns]",
+        "Estado": "category"
+    },
+    "ventas": {
+        "ID": "object",
+        "Fecha": "datetime64[ns]",
+        "Total_Bruto": "float64",
+        "Total_Descuento": "float64",
+        "Total_Final": "float64",
+        "Metodo_Pago": "category",
+        "Promociones": "object"
+    },
+    "venta_items": {
+        "ID_Item": "object",
+        "ID_Venta": "object",
+        "Producto_ID": "object",
+        "Cantidad": "int32",
+        "Precio_Unitario": "float64",
+        "Descuento": "float64",
+        "Devuelto": "int32"
+    },
+    "devoluciones": {
+        "ID_Devolucion": "object",
+        "ID_Venta": "object",
+        "Fecha": "datetime64[ns]",
+        "Items": "object",
+        "Motivo": "object",
+        "Estado": "category"
+    }
+}
+
+# Categorías conocidas de antemano; valores nuevos se agregan al final
+CATEGORIAS_BASE = {
+    ("inventario", "Categoría"): CATEGORIAS,
+    ("movimientos", "Tipo"): TIPOS_MOVIMIENTO,
+    ("movimientos", "Usuario"): list(EMPLEADOS_AUTORIZADOS),
+    ("promociones", "Tipo"): TIPOS_PROMOCION,
+    ("promociones", "Estado"): ESTADOS_PROMOCION,
+    ("ventas", "Metodo_Pago"): METODOS_PAGO,
+    ("devoluciones", "Estado"): ["procesada"]
+}
+
+def columnas(tabla):
+    """
+    Retorna las columnas de una tabla en orden
+
+    Args:
+        tabla: Nombre de la tabla
+
+    Returns:
+        list: Nombres de columnas
+    """
+    return list(ESQUEMAS[tabla])
+
+def _convertir_columna(serie, dtype, categorias=None):
+    """Convierte una Serie al dtype del esquema"""
+    if dtype == "category":
+        valores = serie.astype(object)
+        extra = sorted(set(valores.dropna()) - set(categorias))
+        return pd.Categorical(valores, categories=list(categorias) + extra)
+    if dtype.startswith("datetime64"):
+        return pd.to_datetime(serie, format="ISO8601", errors="coerce").astype(dtype)
+    if dtype.startswith("int"):
+        return pd.to_numeric(serie, errors="coerce").fillna(0).astype(dtype)
+    if dtype.startswith("float"):
+        return pd.to_numeric(serie, errors="coerce").astype(dtype)
+    return serie.astype(object)
+
+def aplicar_esquema(df, tabla, referencia=None):
+    """
+    Convierte un DataFrame a los tipos del esquema de la tabla
+
+    Args:
+        df: DataFrame con las columnas de la tabla
+        tabla: Nombre de la tabla
+        referencia: DataFrame ya tipado cuyas categorías se deben conservar
+            (para que pd.concat mantenga el dtype category)
+
+    Returns:
+        DataFrame: Copia tipada con las columnas en el orden del esquema
+    """
+    tipado = {}
+    for col, dtype in ESQUEMAS[tabla].items():
+        serie = df[col] if col in df.columns else pd.Series([None] * len(df), index=df.index)
+        categorias = None
+        if dtype == "category":
+            if referencia is not None and isinstance(referencia[col].dtype, pd.CategoricalDtype):
+                categorias = list(referencia[col].cat.categories)
+            else:
+                categorias = CATEGORIAS_BASE.get((tabla, col), [])
+        tipado[col] = _convertir_columna(serie, dtype, categorias)
+
+    return pd.DataFrame(tipado, index=df.index)
+
+def tabla_vacia(tabla):
+    """
+    Crea un DataFrame vacío con los tipos del esquema
+
+    Args:
+        tabla: Nombre de la tabla
+
+    Returns:
+        DataFrame: Tabla vacía tipada
+    """
+    return aplicar_esquema(pd.DataFrame(columns=columnas(tabla)), tabla)
+
+def unir_categorias(actual, nuevo, tabla):
+    """
+    Iguala las categorías de dos DataFrames tipados para poder concatenarlos
+    sin perder el dtype category
+
+    Args:
+        actual: DataFrame tipado existente
+        nuevo: DataFrame tipado a concatenar
+        tabla: Nombre de la tabla
+
+    Returns:
+        tuple: (actual, nuevo) con las mismas categorías
+    """
+    for col, dtype in ESQUEMAS[tabla].items():
+        if dtype != "category":
+            continue
+        faltantes = [c for c in nuevo[col].cat.categories if c not in actual[col].cat.categories]
+        if faltantes:
+            actual = actual.assign(**{col: actual[col].cat.add_categories(faltantes)})
+        nuevo = nuevo.assign(**{col: nuevo[col].cat.set_categories(actual[col].cat.categories)})
+    return actual, nuevo
+
+def convertir_valor(tabla, columna, valor):
+    """
+    Convierte un valor suelto al tipo de su columna (para actualizaciones
+    de una sola celda)
+
+    Args:
+        tabla: Nombre de la tabla
+        columna: Nombre de la columna
+        valor: Valor a convertir
+
+    Returns:
+        Valor convertido (Timestamp, int, float o el valor original)
+    """
+    dtype = ESQUEMAS[tabla][columna]
+    if valor is None:
+        # Igual que al convertir columnas: los enteros faltantes valen 0
+        return 0 if dtype.startswith("int") else valor
+    if dtype.startswith("datetime64"):
+        return pd.Timestamp(valor)
+    if dtype.startswith("int"):
+        return int(valor)
+    if dtype.startswith("float"):
+        return float(valor)
+    return valor
@@ -3,6 +3,7 @@ Módulo de componentes de interfaz de usuario reutilizables
 """
 import streamlit as st
 from config import LOGO_URL, EMPLEADOS_AUTORIZADOS
+from utils import formatear_fecha
 
 def mostrar_header(titulo, subtitulo, usuario):
     """
@@ -155,7 +156,7 @@ def mostrar_movimiento_card(movimiento):
         <h4>{icon} {movimiento['Tipo']} - ID: {movimiento['ID_Movimiento']}</h4>
         <p><strong>Producto:</strong> {movimiento['Producto_Nombre']} ({movimiento['Producto_ID']})</p>
         <p><strong>Cantidad:</strong> {cantidad_text} unidades</p>
-        <p><strong>Fecha:</strong> {movimiento['Fecha']}</p>
+        <p><strong>Fecha:</strong> {formatear_fecha(movimiento['Fecha'])}</p>
         <p><strong>Usuario:</strong> {movimiento['Usuario']}</p>
         <p><strong>Observaciones:</strong> {observaciones}</p>
     </div>
@@ -1,176 +1,183 @@
 """
 Módulo de utilidades para el sistema Q'Bodega
 """
-import streamlit as st
+import unicodedata
+import pandas as pd
+from data_manager import siguiente_id, existe_fila
 
 def generar_id_producto():
     """
     Genera un ID único para un nuevo producto
-    Formato: P001, P002, P003, etc.
-    
+    Formato: P001, P002, P003, etc. (más dígitos al pasar de P999)
+
     Returns:
         str: ID del producto generado
     """
-    inventario = st.session_state.inventario
-    
-    if inventario.empty:
-        return "P001"
-    
-    # Obtener todos los IDs actuales que empiecen con P
-    ids_productos = inventario[inventario["ID"].str.startswith("P", na=False)]["ID"].tolist()
-    
-    if not ids_productos:
-        return "P001"
-    
-    # Extraer números de los IDs
-    numeros = []
-    for id_prod in ids_productos:
-        try:
-            # Extraer el número después de 'P'
-            numero = int(id_prod[1:])
-            numeros.append(numero)
-        except (ValueError, IndexError):
-            continue
-    
-    # Obtener el siguiente número
-    if numeros:
-        siguiente_numero = max(numeros) + 1
-    else:
-        siguiente_numero = 1
-    
-    # Formatear con ceros a la izquierda (3 dígitos)
-    return f"P{siguiente_numero:03d}"
+    return siguiente_id("inventario")
 
 def generar_id_movimiento():
     """
     Genera un ID único para un nuevo movimiento
-    Formato: M001, M002, M003, etc.
-    
+    Formato: M001, M002, M003, etc. (más dígitos al pasar de M999)
+
     Returns:
         str: ID del movimiento generado
     """
-    movimientos = st.session_state.movimientos
-    
-    if movimientos.empty:
-        return "M001"
-    
-    # Obtener todos los IDs actuales que empiecen con M
-    ids_movimientos = movimientos[movimientos["ID_Movimiento"].str.startswith("M", na=False)]["ID_Movimiento"].tolist()
-    
-    if not ids_movimientos:
-        return "M001"
-    
-    # Extraer números de los IDs
-    numeros = []
-    for id_mov in ids_movimientos:
-        try:
-            # Extraer el número después de 'M'
-            numero = int(id_mov[1:])
-            numeros.append(numero)
-        except (ValueError, IndexError):
-            continue
-    
-    # Obtener el siguiente número
-    if numeros:
-        siguiente_numero = max(numeros) + 1
-    else:
-        siguiente_numero = 1
-    
-    # Formatear con ceros a la izquierda (3 dígitos)
-    return f"M{siguiente_numero:03d}"
+    return siguiente_id("movimientos")
 
 def generar_id_promocion():
     """
     Genera un ID único para una nueva promoción
-    Formato: PR001, PR002, PR003, etc.
-    
+    Formato: PR001, PR002, PR003, etc. (más dígitos al pasar de PR999)
+
     Returns:
         str: ID de la promoción generado
     """
-    promociones = st.session_state.promociones
-    
-    if promociones.empty:
-        return "PR001"
-    
-    # Obtener todos los IDs actuales que empiecen con PR
-    ids_promociones = promociones[promociones["ID"].str.startswith("PR", na=False)]["ID"].tolist()
-    
-    if not ids_promociones:
-        return "PR001"
-    
-    # Extraer números de los IDs
-    numeros = []
-    for id_promo in ids_promociones:
-        try:
-            # Extraer el número después de 'PR'
-            numero = int(id_promo[2:])
-            numeros.append(numero)
-        except (ValueError, IndexError):
-            continue
-    
-    # Obtener el siguiente número
-    if numeros:
-        siguiente_numero = max(numeros) + 1
-    else:
-        siguiente_numero = 1
-    
-    # Formatear con ceros a la izquierda (3 dígitos)
-    return f"PR{siguiente_numero:03d}"
+    return siguiente_id("promociones")
 
 def generar_id_venta():
     """
     Genera un ID único para una nueva venta
-    Formato: V001, V002, V003, etc.
-    
+    Formato: V001, V002, V003, etc. (más dígitos al pasar de V999)
+
     Returns:
         str: ID de la venta generado
     """
-    ventas = st.session_state.ventas
-    
-    if ventas.empty:
-        return "V001"
-    
-    # Obtener todos los IDs actuales que empiecen con V
-    ids_ventas = ventas[ventas["ID"].str.startswith("V", na=False)]["ID"].tolist()
-    
-    if not ids_ventas:
-        return "V001"
-    
-    # Extraer números de los IDs
-    numeros = []
-    for id_venta in ids_ventas:
-        try:
-            # Extraer el número después de 'V'
-            numero = int(id_venta[1:])
-            numeros.append(numero)
-        except (ValueError, IndexError):
-            continue
-    
-    # Obtener el siguiente número
-    if numeros:
-        siguiente_numero = max(numeros) + 1
-    else:
-        siguiente_numero = 1
-    
-    # Formatear con ceros a la izquierda (3 dígitos)
-    return f"V{siguiente_numero:03d}"
+    return siguiente_id("ventas")
 
 def validar_id_unico(id_valor, tipo="producto"):
     """
     Valida si un ID es único en el sistema
-    
+
     Args:
         id_valor: ID a validar
         tipo: Tipo de entidad ('producto', 'movimiento', 'promocion')
-    
+
     Returns:
         bool: True si el ID es único, False si ya existe
     """
-    if tipo == "producto":
-        return id_valor not in st.session_state.inventario["ID"].values
-    elif tipo == "movimiento":
-        return id_valor not in st.session_state.movimientos["ID_Movimiento"].values
-    elif tipo == "promocion":
-        return id_valor not in st.session_state.promociones["ID"].values
-    
+    tablas = {"producto": "inventario", "movimiento": "movimientos", "promocion": "promociones"}
+
+    if tipo in tablas:
+        return not existe_fila(tablas[tipo], id_valor)
+
     return False
+
+def formatear_fecha(fecha, formato="%Y-%m-%d"):
+    """
+    Formatea una fecha para mostrarla. Las fechas inválidas de datos
+    heredados quedan como NaT al cargar la tabla y se muestran como "—"
+
+    Args:
+        fecha: Timestamp, datetime o NaT
+        formato: Formato de strftime
+
+    Returns:
+        str: Fecha formateada, o "—" si no hay fecha
+    """
+    if pd.isna(fecha):
+        return "—"
+    return f"{fecha:{formato}}"
+
+def normalizar_texto(texto):
+    """
+    Normaliza un texto para búsquedas: sin mayúsculas ni tildes
+    ("Lácteos" -> "lacteos", "Costeño" -> "costeno")
+
+    Args:
+        texto: Texto a normalizar (None o NaN se tratan como vacío)
+
+    Returns:
+        str: Texto normalizado
+    """
+    if not isinstance(texto, str):
+        return ""
+    descompuesto = unicodedata.normalize("NFKD", texto.casefold())
+    return "".join(c for c in descompuesto if not unicodedata.combining(c))
+
+# ----------------------------
+# Índices invertidos de trigramas para búsquedas por subcadena
+# ----------------------------
+
+# Separa los campos de un texto indexado: ninguna consulta lo contiene, así
+# que no hay coincidencias que crucen de un campo a otro
+SEPARADOR_BUSQUEDA = "\x00"
+
+def texto_busqueda(*campos):
+    """
+    Une y normaliza los campos de una fila en el texto que se indexa
+
+    Args:
+        *campos: Valores de los campos (None o NaN se tratan como vacío)
+
+    Returns:
+        str: Campos normalizados separados por SEPARADOR_BUSQUEDA
+    """
+    return SEPARADOR_BUSQUEDA.join(normalizar_texto(c) for c in campos)
+
+def trigramas(texto):
+    """
+    Conjunto de trigramas (subcadenas de 3 caracteres) de un texto
+
+    Args:
+        texto: Texto ya normalizado
+
+    Returns:
+        set: Trigramas del texto (vacío si tiene menos de 3 caracteres)
+    """
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+def indice_trigramas():
+    """
+    Crea un índice invertido vacío
+
+    Returns:
+        dict: {"textos": {clave: texto}, "trigramas": {trigrama: set de claves}}
+    """
+    return {"textos": {}, "trigramas": {}}
+
+def actualizar_indice_trigramas(indice, quitados, agregados):
+    """
+    Actualiza un índice invertido con las filas que salen y entran
+
+    Args:
+        indice: Índice creado con indice_trigramas()
+        quitados: Pares (clave, texto) que dejan el índice
+        agregados: Pares (clave, texto) que entran al índice
+    """
+    for clave, texto in quitados:
+        indice["textos"].pop(clave, None)
+        for trigrama in trigramas(texto):
+            claves = indice["trigramas"].get(trigrama)
+            if claves is not None:
+                claves.discard(clave)
+                if not claves:
+                    del indice["trigramas"][trigrama]
+
+    for clave, texto in agregados:
+        indice["textos"][clave] = texto
+        for trigrama in trigramas(texto):
+            indice["trigramas"].setdefault(trigrama, set()).add(clave)
+
+def candidatos_trigramas(indice, consulta):
+    """
+    Claves cuyo texto contiene la consulta: se intersectan las listas
+    invertidas de sus trigramas (de la más corta a la más larga) y se
+    confirma la subcadena solo sobre esos candidatos
+
+    Args:
+        indice: Índice creado con indice_trigramas()
+        consulta: Texto ya normalizado
+
+    Returns:
+        list: Claves cuyo texto contiene la consulta
+    """
+    textos = indice["textos"]
+    buscados = trigramas(consulta)
+    if buscados:
+        listas = sorted((indice["trigramas"].get(t, set()) for t in buscados), key=len)
+        candidatos = listas[0].intersection(*listas[1:])
+    else:
+        # Consultas de 1 o 2 letras: se revisan los textos ya normalizados
+        candidatos = textos.keys()
+    return [clave for clave in candidatos if consulta in textos[clave]]
@@ -1,17 +1,170 @@
 """
 Módulo CRUD para gestión de ventas
 """
+import bisect
+import heapq
 import streamlit as st
 import pandas as pd
 from datetime import datetime
-from inventario_crud import actualizar_stock_producto, obtener_producto
-from movimientos_crud import registrar_movimiento
+from data_manager import (
+    get_ventas, get_devoluciones, insertar_fila, insertar_filas,
+    obtener_filas, actualizar_filas, transaccion, reservar_id,
+    registrar_derivado, obtener_derivado, reconstruir_derivado, bloqueo_lectura,
+    obtener_token, registrar_token, escritura
+)
+from inventario_crud import actualizar_stock_productos, ConflictoVersion
+from movimientos_crud import registrar_movimientos_lote
 from promociones_crud import aplicar_promociones_a_carrito
-from utils import generar_id_movimiento
+
+def _construir_indice_items(items):
+    """Índices secundarios de venta_items: ID_Venta y Producto_ID -> IDs de línea"""
+    return {
+        "venta": items.groupby("ID_Venta", sort=False)["ID_Item"].agg(list).to_dict(),
+        "producto": items.groupby("Producto_ID", sort=False)["ID_Item"].agg(list).to_dict()
+    }
+
+def _aplicar_indice_items(indice, quitadas, agregadas):
+    """Mantiene los índices secundarios de venta_items con cada escritura"""
+    for columna, nombre in (("ID_Venta", "venta"), ("Producto_ID", "producto")):
+        for clave, id_item in zip(quitadas[columna], quitadas["ID_Item"]):
+            indice[nombre][clave].remove(id_item)
+            if not indice[nombre][clave]:
+                del indice[nombre][clave]
+        for clave, id_item in zip(agregadas[columna], agregadas["ID_Item"]):
+            indice[nombre].setdefault(clave, []).append(id_item)
+
+registrar_derivado("indice_venta_items", "venta_items", _construir_indice_items, _aplicar_indice_items)
+
+# ----------------------------
+# Ranking de productos más vendidos
+# ----------------------------
+
+# Posición de cada criterio en los contadores [cantidad, ingresos]
+CRITERIOS_RANKING = {"cantidad": 0, "ingresos": 1}
+
+def _ranking_nuevo():
+    """Ranking vacío: contadores por producto y un heap por criterio"""
+    return {"valores": {}, "heaps": {criterio: [] for criterio in CRITERIOS_RANKING}}
+
+def _ranking_sumar(ranking, producto_id, cantidad, ingresos):
+    """
+    Suma (o resta, con valores negativos) a los contadores de un producto y
+    deja su nuevo valor en los heaps. Las entradas viejas del producto quedan
+    en el heap y se descartan al consultar (borrado perezoso).
+    """
+    valores = ranking["valores"].setdefault(producto_id, [0, 0.0])
+    valores[0] += cantidad
+    valores[1] += ingresos
+
+    for criterio, posicion in CRITERIOS_RANKING.items():
+        heap = ranking["heaps"][criterio]
+        heapq.heappush(heap, (-valores[posicion], producto_id))
+
+        # Compactar cuando las entradas obsoletas superan a las vigentes
+        if len(heap) > 2 * len(ranking["valores"]) + 16:
+            heap[:] = [(-v[posicion], p) for p, v in ranking["valores"].items()]
+            heapq.heapify(heap)
+
+def _ranking_top(ranking, limite, criterio):
+    """
+    Los `limite` productos con mayor valor según el criterio, en O(k log n)
+
+    Returns:
+        list: Tuplas (producto_id, cantidad, ingresos) en orden descendente
+    """
+    posicion = CRITERIOS_RANKING[criterio]
+    heap = ranking["heaps"][criterio]
+    tomadas, vistos, resultado = [], set(), []
+
+    while heap and len(resultado) < limite:
+        entrada = heapq.heappop(heap)
+        valor, producto_id = -entrada[0], entrada[1]
+        valores = ranking["valores"][producto_id]
+
+        # Entrada obsoleta (el producto cambió de valor) o repetida: se descarta
+        if valores[posicion] != valor or producto_id in vistos:
+            continue
+
+        vistos.add(producto_id)
+        tomadas.append(entrada)
+        if valor <= 0:
+            break
+        resultado.append((producto_id, valores[0], valores[1]))
+
+    for entrada in tomadas:
+        heapq.heappush(heap, entrada)
+
+    return resultado
+
+def _aportes_lineas(lineas):
+    """
+    Aporte neto de líneas de venta al ranking (descontando lo devuelto)
+
+    Returns:
+        DataFrame: Producto_ID, Fecha de la venta, Cantidad neta e Ingresos netos
+    """
+    vendidas = lineas["Cantidad"].astype("int64")
+    netas = vendidas - lineas["Devuelto"].astype("int64")
+    precio_neto = lineas["Precio_Unitario"] - lineas["Descuento"] / vendidas.where(vendidas > 0, 1)
+    fechas = lineas["ID_Venta"].map(
+        obtener_filas("ventas", lineas["ID_Venta"].unique())["Fecha"]
+    )
+
+    return pd.DataFrame({
+        "Producto_ID": lineas["Producto_ID"].to_numpy(),
+        "Fecha": fechas.astype("datetime64[ns]").to_numpy(),
+        "Cantidad": netas.to_numpy(),
+        "Ingresos": (netas * precio_neto).to_numpy()
+    })
+
+def _ventanas_ranking(estado, fecha):
+    """Rankings que abarcan una fecha: histórico, su mes y su día"""
+    if pd.isna(fecha):
+        return [estado["total"]]
+    return [
+        estado["total"],
+        estado["mes"].setdefault((fecha.year, fecha.month), _ranking_nuevo()),
+        estado["dia"].setdefault(fecha.date(), _ranking_nuevo())
+    ]
+
+def _construir_ranking(items):
+    """Construye los rankings histórico, mensual y diario desde venta_items"""
+    estado = {"total": _ranking_nuevo(), "mes": {}, "dia": {}}
+    if items.empty:
+        return estado
+
+    aportes = _aportes_lineas(items)
+    agrupado = aportes.groupby(
+        [aportes["Fecha"].dt.normalize(), "Producto_ID"], sort=False, dropna=False
+    )[["Cantidad", "Ingresos"]].sum()
+
+    for (dia, producto_id), fila in agrupado.iterrows():
+        for ranking in _ventanas_ranking(estado, dia):
+            _ranking_sumar(ranking, producto_id, int(fila["Cantidad"]), float(fila["Ingresos"]))
+    return estado
+
+def _aplicar_ranking(estado, quitadas, agregadas):
+    """Actualiza los rankings con las líneas de venta que salen y entran"""
+    for lineas, signo in ((quitadas, -1), (agregadas, 1)):
+        if lineas.empty:
+            continue
+        for _, aporte in _aportes_lineas(lineas).iterrows():
+            for ranking in _ventanas_ranking(estado, aporte["Fecha"]):
+                _ranking_sumar(
+                    ranking, aporte["Producto_ID"],
+                    signo * int(aporte["Cantidad"]), signo * float(aporte["Ingresos"])
+                )
+
+registrar_derivado("ranking_productos", "venta_items", _construir_ranking, _aplicar_ranking)
 
 def registrar_venta(venta):
     """
-    Registra una nueva venta
+    Registra una nueva venta. El stock se valida primero fuera del hilo
+    escritor (lectura optimista: un carrito sin stock falla sin pasar por
+    la cola) y se descuenta en el escritor con compare-and-swap sobre la
+    Version de cada producto. Si otro cajero se adelantó, el escritor vuelve
+    a validar contra las filas actuales en lugar de rechazar la venta, así
+    una ráfaga de ventas del mismo producto entra en un solo lote.
     
     Args:
         venta: dict con los datos de la venta
@@ -23,66 +176,163 @@ def registrar_venta(venta):
             "total_descuento": 10.00,
             "total_final": 90.00,
             "metodo_pago": "efectivo",
-            "promociones_aplicadas": ["PR001"]
+            "promociones_aplicadas": ["PR001"],
+            "token": "9f1c..."  # opcional: token de idempotencia del checkout
         }
     
     Returns:
-        bool: True si se registró exitosamente
+        bool: True si se registró exitosamente (venta["id"] queda con el ID asignado)
     """
-    # Validar stock de todos los productos antes de procesar
-    for item in venta["items"]:
-        producto = obtener_producto(item["producto_id"])
-        if producto is None:
-            st.error(f"❌ Producto {item['producto_id']} no existe.")
-            return False
-        
-        if producto["Cantidad"] < item["cantidad"]:
-            st.error(
-                f"❌ Stock insuficiente para {producto['Nombre']}. "
-                f"Stock: {producto['Cantidad']}, Solicitado: {item['cantidad']}"
-            )
-            return False
+    token = venta.get("token")
+    if token is not None and _venta_repetida(venta, token):
+        return False
     
-    # Registrar la venta
-    nueva_venta = pd.DataFrame(
-        [[
-            venta["id"],
-            venta["fecha"],
-            str(venta["items"]),  # Guardar como string JSON
-            venta["total_bruto"],
-            venta["total_descuento"],
-            venta["total_final"],
-            venta["metodo_pago"],
-            ",".join(venta["promociones_aplicadas"]) if venta["promociones_aplicadas"] else ""
-        ]],
-        columns=["ID", "Fecha", "Items", "Total_Bruto", "Total_Descuento", 
-                "Total_Final", "Metodo_Pago", "Promociones"]
-    )
+    carrito = pd.DataFrame(venta["items"], columns=["producto_id", "cantidad"])
+    solicitado = carrito.groupby("producto_id", sort=False)["cantidad"].sum()
     
-    st.session_state.ventas = pd.concat(
-        [st.session_state.ventas, nueva_venta],
-        ignore_index=True
-    )
+    # Lectura optimista: se valida el stock sin lock y se recuerda la
+    # versión de cada producto
+    productos = obtener_filas("inventario", solicitado.index)
+    if not _validar_stock(solicitado, productos):
+        return False
+    
+    # Precio y descuento de cada línea: se calculan fuera de la sección crítica
+    descuentos = {}
+    for promo in aplicar_promociones_a_carrito(venta["items"])["promociones_aplicadas"]:
+        descuentos[promo["producto_id"]] = descuentos.get(promo["producto_id"], 0) + promo["descuento"]
     
-    # Actualizar inventario y registrar movimientos
+    precios = {}
     for item in venta["items"]:
-        # Restar del inventario
-        actualizar_stock_producto(item["producto_id"], -item["cantidad"])
+        precios.setdefault(item["producto_id"], item["precio_unitario"])
+    
+    return _confirmar_venta(venta, solicitado, productos, precios, descuentos)
+
+def _validar_stock(solicitado, productos):
+    """
+    Verifica que existan los productos de la venta y que alcance su stock
+    (si no, muestra el error)
+    
+    Args:
+        solicitado: Series {producto_id: cantidad total}
+        productos: DataFrame de inventario indexado por ID
+    
+    Returns:
+        bool: True si la venta se puede aplicar
+    """
+    faltantes = solicitado.index.difference(productos.index)
+    if len(faltantes) > 0:
+        st.error(f"❌ Producto {faltantes[0]} no existe.")
+        return False
+    
+    detalle = productos[["Nombre", "Cantidad"]].join(solicitado.rename("Solicitado"))
+    sin_stock = detalle[detalle["Cantidad"] < detalle["Solicitado"]]
+    if not sin_stock.empty:
+        producto = sin_stock.iloc[0]
+        st.error(
+            f"❌ Stock insuficiente para {producto['Nombre']}. "
+            f"Stock: {producto['Cantidad']}, Solicitado: {producto['Solicitado']}"
+        )
+        return False
+    
+    return True
+
+@escritura
+def _confirmar_venta(venta, solicitado, productos, precios, descuentos):
+    """
+    Aplica una venta ya validada como una transacción: o se guarda todo
+    (venta, stock y movimientos) o no se guarda nada
+    
+    Args:
+        venta: dict con los datos de la venta (ver registrar_venta)
+        solicitado: Series {producto_id: cantidad total}
+        productos: Filas de inventario leídas al validar (Nombre, Version)
+        precios: dict {producto_id: precio unitario}
+        descuentos: dict {producto_id: descuento total de sus líneas}
+    
+    Returns:
+        bool: True si se registró, False si el token ya se había usado o el
+            stock ya no alcanza
+    """
+    token = venta.get("token")
+    with transaccion():
+        if token is not None and _venta_repetida(venta, token):
+            return False
         
-        # Registrar movimiento de salida
-        id_mov = generar_id_movimiento()
-        producto = obtener_producto(item["producto_id"])
+        try:
+            # Compare-and-swap: falla si otro cajero cambió alguno de los
+            # productos después de la validación
+            actualizar_stock_productos(
+                zip(solicitado.index, -solicitado), versiones=productos["Version"]
+            )
+        except ConflictoVersion:
+            # Otro cajero se adelantó: con el lock de escritura tomado las
+            # filas actuales ya no cambian, basta con volver a validarlas
+            productos = obtener_filas("inventario", solicitado.index)
+            if not _validar_stock(solicitado, productos):
+                return False
+            actualizar_stock_productos(
+                zip(solicitado.index, -solicitado), versiones=productos["Version"]
+            )
+        
+        # Registrar la venta (con un ID libre aunque otra sesión haya tomado venta["id"])
+        venta["id"] = reservar_id("ventas", venta["id"])
+        if token is not None:
+            registrar_token(token, venta["id"])
+        insertar_fila("ventas", {
+            "ID": venta["id"],
+            "Fecha": venta["fecha"],
+            "Total_Bruto": venta["total_bruto"],
+            "Total_Descuento": venta["total_descuento"],
+            "Total_Final": venta["total_final"],
+            "Metodo_Pago": venta["metodo_pago"],
+            "Promociones": ",".join(venta["promociones_aplicadas"]) if venta["promociones_aplicadas"] else ""
+        })
+        
+        # Registrar una línea por producto con su precio y su descuento
+        insertar_filas("venta_items", [
+            {
+                "ID_Item": f"{venta['id']}-{numero}",
+                "ID_Venta": venta["id"],
+                "Producto_ID": producto_id,
+                "Cantidad": cantidad,
+                "Precio_Unitario": precios[producto_id],
+                "Descuento": round(descuentos.get(producto_id, 0), 2),
+                "Devuelto": 0
+            }
+            for numero, (producto_id, cantidad) in enumerate(solicitado.items(), start=1)
+        ])
         
-        registrar_movimiento(
-            id_mov,
+        # Registrar las salidas con un solo bloque de IDs
+        registrar_movimientos_lote(
             "Salida",
-            item["producto_id"],
-            item["cantidad"],
+            [
+                {
+                    "producto_id": item["producto_id"],
+                    "nombre": productos.at[item["producto_id"], "Nombre"],
+                    "cantidad": item["cantidad"]
+                }
+                for item in venta["items"]
+            ],
             f"Venta {venta['id']}"
         )
     
     return True
 
+def _venta_repetida(venta, token):
+    """
+    Rechaza un reenvío del mismo checkout (doble clic, reintento) en O(1)
+    
+    Returns:
+        bool: True si el token ya se usó (venta["id"] queda con la venta registrada)
+    """
+    registrada = obtener_token(token)
+    if registrada is None:
+        return False
+    
+    venta["id"] = registrada
+    st.warning(f"⚠️ Esta venta ya fue registrada como {registrada}.")
+    return True
+
 def obtener_venta_por_id(venta_id):
     """
     Obtiene una venta específica por su ID
@@ -93,7 +343,7 @@ def obtener_venta_por_id(venta_id):
     Returns:
         dict: Datos de la venta o None si no existe
     """
-    ventas = st.session_state.ventas
+    ventas = get_ventas()
     venta = ventas[ventas["ID"] == venta_id]
     
     if venta.empty:
@@ -101,6 +351,41 @@ def obtener_venta_por_id(venta_id):
     
     return venta.iloc[0].to_dict()
 
+def obtener_items_venta(venta_id):
+    """
+    Obtiene las líneas de una venta usando el índice por ID de venta
+    
+    Args:
+        venta_id: ID de la venta
+    
+    Returns:
+        DataFrame: Líneas de la venta con el nombre del producto y su subtotal
+    """
+    # Índice y líneas se leen juntos: una escritura modifica las listas en el lugar
+    with bloqueo_lectura():
+        ids_items = list(obtener_derivado("indice_venta_items")["venta"].get(venta_id, []))
+        items = obtener_filas("venta_items", ids_items).reset_index(drop=True)
+    
+    nombres = obtener_filas("inventario", items["Producto_ID"].unique())["Nombre"]
+    items["Nombre"] = items["Producto_ID"].map(nombres).fillna("Producto eliminado")
+    items["Subtotal"] = items["Cantidad"] * items["Precio_Unitario"] - items["Descuento"]
+    
+    return items
+
+def obtener_items_producto(producto_id):
+    """
+    Obtiene todas las líneas de venta de un producto usando el índice por producto
+    
+    Args:
+        producto_id: ID del producto
+    
+    Returns:
+        DataFrame: Líneas de venta del producto
+    """
+    with bloqueo_lectura():
+        ids_items = list(obtener_derivado("indice_venta_items")["producto"].get(producto_id, []))
+        return obtener_filas("venta_items", ids_items).reset_index(drop=True)
+
 def buscar_ventas(filtros):
     """
     Busca ventas según filtros
@@ -117,7 +402,7 @@ def buscar_ventas(filtros):
     Returns:
         DataFrame: Ventas que cumplen los criterios
     """
-    ventas = st.session_state.ventas.copy()
+    ventas = get_ventas().copy()
     
     if ventas.empty:
         return ventas
@@ -132,10 +417,10 @@ def buscar_ventas(filtros):
     
     # Filtrar por rango de fechas
     if filtros.get("fecha_inicio"):
-        ventas = ventas[ventas["Fecha"] >= filtros["fecha_inicio"]]
+        ventas = ventas[ventas["Fecha"] >= pd.Timestamp(filtros["fecha_inicio"])]
     
     if filtros.get("fecha_fin"):
-        ventas = ventas[ventas["Fecha"] <= filtros["fecha_fin"]]
+        ventas = ventas[ventas["Fecha"] <= pd.Timestamp(filtros["fecha_fin"])]
     
     return ventas
 
@@ -146,7 +431,7 @@ def obtener_todas_las_ventas():
     Returns:
         DataFrame: Todas las ventas
     """
-    return st.session_state.ventas
+    return get_ventas()
 
 def calcular_totales(carrito):
     """
@@ -184,72 +469,236 @@ def calcular_totales(carrito):
         "promociones": resultado["promociones_aplicadas"]
     }
 
+# ----------------------------
+# Resumen diario de ventas (rollup por fecha y método de pago)
+# ----------------------------
+
+# Columnas del resumen: ventas, bruto, descuento y neto (Total_Final)
+COLUMNAS_RESUMEN = ["Ventas", "Bruto", "Descuento", "Neto"]
+
+def _resumen_nuevo():
+    """Resumen vacío: {dia: {metodo: [valores]}} y la lista ordenada de días"""
+    return {"por_dia": {}, "dias": []}
+
+def _resumen_sumar(resumen, dia, metodo, valores):
+    """Suma valores a la celda (dia, metodo); los días nuevos casi siempre van al final"""
+    if dia not in resumen["por_dia"]:
+        resumen["por_dia"][dia] = {}
+        if not resumen["dias"] or dia > resumen["dias"][-1]:
+            resumen["dias"].append(dia)
+        else:
+            bisect.insort(resumen["dias"], dia)
+    
+    celda = resumen["por_dia"][dia].setdefault(metodo, [0] * len(valores))
+    for posicion, valor in enumerate(valores):
+        celda[posicion] += valor
+
+def _resumen_rango(resumen, inicio, fin):
+    """
+    Celdas de los días con inicio <= dia < fin (búsqueda binaria sobre los días)
+
+    Returns:
+        list: Tuplas (dia, metodo, valores)
+    """
+    desde = bisect.bisect_left(resumen["dias"], inicio)
+    hasta = bisect.bisect_left(resumen["dias"], fin)
+    return [
+        (dia, metodo, valores)
+        for dia in resumen["dias"][desde:hasta]
+        for metodo, valores in resumen["por_dia"][dia].items()
+    ]
+
+def _construir_resumen_ventas(ventas):
+    """Construye el resumen diario desde el historial completo de ventas"""
+    resumen = _resumen_nuevo()
+    agrupado = ventas.groupby(
+        [ventas["Fecha"].dt.date, "Metodo_Pago"], observed=True, sort=True
+    ).agg(
+        Ventas=("ID", "size"), Bruto=("Total_Bruto", "sum"),
+        Descuento=("Total_Descuento", "sum"), Neto=("Total_Final", "sum")
+    )
+    for (dia, metodo), fila in agrupado.iterrows():
+        _resumen_sumar(resumen, dia, metodo, [int(fila["Ventas"])] + [
+            float(fila[col]) for col in COLUMNAS_RESUMEN[1:]
+        ])
+    return resumen
+
+def _aplicar_resumen_ventas(resumen, quitadas, agregadas):
+    """Actualiza el resumen con las ventas que salen y entran"""
+    for filas, signo in ((quitadas, -1), (agregadas, 1)):
+        for _, venta in filas.iterrows():
+            if pd.isna(venta["Fecha"]):
+                continue
+            _resumen_sumar(resumen, pd.Timestamp(venta["Fecha"]).date(), venta["Metodo_Pago"], [
+                signo,
+                signo * float(venta["Total_Bruto"] or 0),
+                signo * float(venta["Total_Descuento"] or 0),
+                signo * float(venta["Total_Final"] or 0)
+            ])
+
+registrar_derivado("resumen_ventas", "ventas", _construir_resumen_ventas, _aplicar_resumen_ventas)
+
+def _montos_devueltos(lineas):
+    """
+    Monto devuelto de cada línea de venta, con el día y el método de pago de
+    la venta original
+
+    Returns:
+        DataFrame: Dia, Metodo_Pago y Monto
+    """
+    ventas = obtener_filas("ventas", lineas["ID_Venta"].unique())
+    vendidas = lineas["Cantidad"].astype("int64")
+    precio_neto = lineas["Precio_Unitario"] - lineas["Descuento"] / vendidas.where(vendidas > 0, 1)
+    fechas = lineas["ID_Venta"].map(ventas["Fecha"]).astype("datetime64[ns]")
+    
+    return pd.DataFrame({
+        "Dia": fechas.dt.date.to_numpy(),
+        "Metodo_Pago": lineas["ID_Venta"].map(ventas["Metodo_Pago"].astype(object)).to_numpy(),
+        "Monto": (lineas["Devuelto"].astype("int64") * precio_neto).to_numpy()
+    })
+
+def _construir_resumen_devoluciones(items):
+    """Construye el resumen diario de montos devueltos desde venta_items"""
+    resumen = _resumen_nuevo()
+    devueltas = items[items["Devuelto"] > 0]
+    if devueltas.empty:
+        return resumen
+    
+    montos = _montos_devueltos(devueltas).dropna(subset=["Dia"])
+    for (dia, metodo), monto in montos.groupby(["Dia", "Metodo_Pago"])["Monto"].sum().items():
+        _resumen_sumar(resumen, dia, metodo, [float(monto)])
+    return resumen
+
+def _aplicar_resumen_devoluciones(resumen, quitadas, agregadas):
+    """Actualiza el resumen de devoluciones cuando cambia lo devuelto de una línea"""
+    for lineas, signo in ((quitadas, -1), (agregadas, 1)):
+        lineas = lineas[lineas["Devuelto"] > 0]
+        if lineas.empty:
+            continue
+        for _, fila in _montos_devueltos(lineas).dropna(subset=["Dia"]).iterrows():
+            _resumen_sumar(resumen, fila["Dia"], fila["Metodo_Pago"], [signo * float(fila["Monto"])])
+
+registrar_derivado(
+    "resumen_devoluciones", "venta_items",
+    _construir_resumen_devoluciones, _aplicar_resumen_devoluciones
+)
+
+def obtener_resumen_ventas(fecha_inicio=None, fecha_fin=None):
+    """
+    Obtiene el resumen diario de ventas por método de pago. Las devoluciones
+    se descuentan del día y método de la venta original.
+    
+    Args:
+        fecha_inicio: Primer día incluido (por defecto, el primero con ventas)
+        fecha_fin: Último día incluido (por defecto, el último con ventas)
+    
+    Returns:
+        DataFrame: Fecha, Metodo_Pago, Ventas, Bruto, Descuento, Neto,
+            Devuelto y Neto_Final, ordenado por fecha
+    """
+    inicio = pd.Timestamp(fecha_inicio).date() if fecha_inicio else datetime.min.date()
+    fin = (pd.Timestamp(fecha_fin) + pd.Timedelta(days=1)).date() if fecha_fin else datetime.max.date()
+    
+    with bloqueo_lectura():
+        ventas = _resumen_rango(obtener_derivado("resumen_ventas"), inicio, fin)
+        devoluciones = _resumen_rango(obtener_derivado("resumen_devoluciones"), inicio, fin)
+    
+    resumen = pd.DataFrame(
+        [[dia, metodo] + list(valores) for dia, metodo, valores in ventas],
+        columns=["Fecha", "Metodo_Pago"] + COLUMNAS_RESUMEN
+    )
+    devuelto = pd.DataFrame(
+        [[dia, metodo, valores[0]] for dia, metodo, valores in devoluciones],
+        columns=["Fecha", "Metodo_Pago", "Devuelto"]
+    )
+    resumen = resumen.merge(devuelto, on=["Fecha", "Metodo_Pago"], how="left")
+    resumen["Devuelto"] = resumen["Devuelto"].astype("float64").fillna(0.0)
+    resumen["Neto_Final"] = resumen["Neto"] - resumen["Devuelto"]
+    resumen["Fecha"] = pd.to_datetime(resumen["Fecha"])
+    
+    montos = ["Bruto", "Descuento", "Neto", "Devuelto", "Neto_Final"]
+    resumen[montos] = resumen[montos].astype("float64").round(2)
+    
+    # Las celdas que quedaron en cero (p. ej. tras deshacer una venta) no se muestran
+    resumen = resumen[resumen["Ventas"] > 0].astype({"Ventas": "int64"})
+    return resumen.sort_values(["Fecha", "Metodo_Pago"], kind="stable").reset_index(drop=True)
+
+def reconstruir_resumen_ventas():
+    """Reconstruye el resumen diario desde el historial de ventas y devoluciones"""
+    reconstruir_derivado("resumen_ventas")
+    reconstruir_derivado("resumen_devoluciones")
+
 def obtener_estadisticas_ventas():
     """
-    Obtiene estadísticas de ventas
+    Obtiene estadísticas de ventas desde el resumen diario. No modifica la
+    tabla de ventas: los días de hoy y del mes se ubican con búsqueda binaria.
     
     Returns:
         dict: Estadísticas generales
     """
-    ventas = st.session_state.ventas
+    hoy = datetime.now().date()
+    inicio_mes = hoy.replace(day=1)
+    fin_mes = (pd.Timestamp(inicio_mes) + pd.offsets.MonthBegin(1)).date()
     
-    if ventas.empty:
-        return {
-            "total_ventas": 0,
-            "ventas_hoy": 0,
-            "ventas_mes": 0,
-            "ingresos_totales": 0,
-            "ingresos_hoy": 0,
-            "ingresos_mes": 0
-        }
+    def totales(celdas):
+        return sum(v[0] for _, _, v in celdas), round(sum(v[3] for _, _, v in celdas), 2)
     
-    # Convertir fechas
-    ventas["Fecha_dt"] = pd.to_datetime(ventas["Fecha"])
-    hoy = datetime.now().date()
-    mes_actual = datetime.now().month
-    anio_actual = datetime.now().year
-    
-    # Filtros
-    ventas_hoy = ventas[ventas["Fecha_dt"].dt.date == hoy]
-    ventas_mes = ventas[
-        (ventas["Fecha_dt"].dt.month == mes_actual) &
-        (ventas["Fecha_dt"].dt.year == anio_actual)
-    ]
+    with bloqueo_lectura():
+        resumen = obtener_derivado("resumen_ventas")
+        total_ventas, ingresos_totales = totales(
+            _resumen_rango(resumen, datetime.min.date(), datetime.max.date())
+        )
+        ventas_hoy, ingresos_hoy = totales(_resumen_rango(resumen, hoy, hoy + pd.Timedelta(days=1)))
+        ventas_mes, ingresos_mes = totales(_resumen_rango(resumen, inicio_mes, fin_mes))
     
     return {
-        "total_ventas": len(ventas),
-        "ventas_hoy": len(ventas_hoy),
-        "ventas_mes": len(ventas_mes),
-        "ingresos_totales": ventas["Total_Final"].sum(),
-        "ingresos_hoy": ventas_hoy["Total_Final"].sum() if not ventas_hoy.empty else 0,
-        "ingresos_mes": ventas_mes["Total_Final"].sum() if not ventas_mes.empty else 0
+        "total_ventas": total_ventas,
+        "ventas_hoy": ventas_hoy,
+        "ventas_mes": ventas_mes,
+        "ingresos_totales": ingresos_totales,
+        "ingresos_hoy": ingresos_hoy,
+        "ingresos_mes": ingresos_mes
     }
 
-def obtener_productos_mas_vendidos(limite=5):
+def obtener_productos_mas_vendidos(limite=5, periodo="total", fecha=None, criterio="cantidad"):
     """
-    Obtiene los productos más vendidos
+    Obtiene los productos más vendidos desde contadores que se actualizan en
+    cada venta y devolución (no recorre el historial de ventas)
     
     Args:
         limite: Número de productos a retornar
+        periodo: "total", "mes" o "dia"
+        fecha: Fecha de referencia para "mes" y "dia" (por defecto hoy)
+        criterio: "cantidad" (unidades netas) o "ingresos" (ingresos netos)
     
     Returns:
-        list: Lista de productos más vendidos
+        list: dicts {"producto_id", "nombre", "cantidad", "ingresos"} ordenados
+            por el criterio
     """
-    ventas = st.session_state.ventas
-    
-    if ventas.empty:
-        return []
-    
-    # Contar productos vendidos
-    productos_count = {}
+    fecha = pd.Timestamp(fecha) if fecha is not None else pd.Timestamp(datetime.now())
+    
+    with bloqueo_lectura():
+        estado = obtener_derivado("ranking_productos")
+        if periodo == "mes":
+            ranking = estado["mes"].get((fecha.year, fecha.month))
+        elif periodo == "dia":
+            ranking = estado["dia"].get(fecha.date())
+        else:
+            ranking = estado["total"]
+        
+        top = _ranking_top(ranking, limite, criterio) if ranking else []
     
-    for _, venta in ventas.iterrows():
-        items_str = venta["Items"]
-        # Parsear items (esto es simplificado, en producción usar json.loads)
-        # Por ahora retornamos lista vacía si no hay datos
-        pass
+    nombres = obtener_filas("inventario", [producto_id for producto_id, _, _ in top])["Nombre"]
     
-    return []
+    return [
+        {
+            "producto_id": producto_id,
+            "nombre": nombres.get(producto_id, "Producto eliminado"),
+            "cantidad": int(cantidad),
+            "ingresos": round(float(ingresos), 2)
+        }
+        for producto_id, cantidad, ingresos in top
+    ]
 
 def venta_existe(venta_id):
     """
@@ -261,8 +710,9 @@ def venta_existe(venta_id):
     Returns:
         bool: True si la venta existe
     """
-    return venta_id in st.session_state.ventas["ID"].values
+    return venta_id in get_ventas()["ID"].values
 
+@escritura
 def procesar_devolucion(venta_id, items_devolucion, motivo=""):
     """
     Procesa una devolución parcial o total de una venta
@@ -282,53 +732,93 @@ def procesar_devolucion(venta_id, items_devolucion, motivo=""):
     Returns:
         bool: True si se procesó exitosamente
     """
-    from datetime import datetime
-    
     # Verificar que la venta existe
     venta = obtener_venta_por_id(venta_id)
     if not venta:
         st.error(f"❌ No existe la venta {venta_id}")
         return False
     
-    # Procesar cada item de devolución
-    for item in items_devolucion:
-        producto = obtener_producto(item["producto_id"])
-        if producto is None:
-            st.error(f"❌ Producto {item['producto_id']} no encontrado")
-            continue
+    with transaccion():
+        # Lo que queda por devolver de cada producto de la venta (las ventas
+        # migradas pueden tener varias líneas del mismo producto)
+        lineas = obtener_items_venta(venta_id)
+        lineas["Pendiente"] = lineas["Cantidad"] - lineas["Devuelto"]
+        disponibles = lineas.groupby("Producto_ID", sort=False)["Pendiente"].sum().to_dict()
+        productos = obtener_filas(
+            "inventario", list(dict.fromkeys(item["producto_id"] for item in items_devolucion))
+        )
+        
+        # Se valida y recorta cada item antes de tocar el stock: un producto
+        # repetido en la lista descuenta de lo que queda por devolver
+        items_validos = []
+        for item in items_devolucion:
+            producto_id = item["producto_id"]
+            if producto_id not in disponibles:
+                st.error(f"❌ El producto {producto_id} no forma parte de la venta {venta_id}")
+                continue
+            if producto_id not in productos.index:
+                st.error(f"❌ Producto {producto_id} no encontrado")
+                continue
+            
+            cantidad = min(int(item["cantidad"]), int(disponibles[producto_id]))
+            if cantidad <= 0:
+                st.warning(f"⚠️ Ya se devolvió todo lo vendido de {producto_id} en la venta {venta_id}")
+                continue
+            if cantidad < item["cantidad"]:
+                st.warning(f"⚠️ Solo quedaban {cantidad} unidades de {producto_id} por devolver")
+            
+            disponibles[producto_id] -= cantidad
+            items_validos.append({**item, "cantidad": cantidad})
         
-        # Devolver al inventario
-        actualizar_stock_producto(item["producto_id"], item["cantidad"])
+        if not items_validos:
+            st.error("❌ No hay productos válidos para devolver")
+            return False
         
-        # Registrar movimiento de devolución
-        id_mov = generar_id_movimiento()
-        registrar_movimiento(
-            id_mov,
-            "Devolución",
-            item["producto_id"],
-            item["cantidad"],
-            f"Devolución de venta {venta_id}. Motivo: {item.get('motivo', motivo)}"
+        # Devolver al inventario (una sola vez por item) en una sola operación
+        actualizar_stock_productos(
+            (item["producto_id"], item["cantidad"]) for item in items_validos
         )
-    
-    # Registrar en historial de devoluciones
-    if "devoluciones" not in st.session_state:
-        st.session_state.devoluciones = pd.DataFrame(
-            columns=["ID_Devolucion", "ID_Venta", "Fecha", "Items", "Motivo", "Estado"]
+        
+        # Registrar movimientos de devolución con un solo bloque de IDs
+        registrar_movimientos_lote("Devolución", [
+            {
+                "producto_id": item["producto_id"],
+                "nombre": productos.at[item["producto_id"], "Nombre"],
+                "cantidad": item["cantidad"],
+                "observaciones": f"Devolución de venta {venta_id}. Motivo: {item.get('motivo', motivo)}"
+            }
+            for item in items_validos
+        ])
+        
+        # Marcar lo devuelto en las líneas de la venta (revierte el ranking);
+        # ya está recortado a lo vendido, así que stock y líneas coinciden.
+        # Lo devuelto de un producto se reparte entre sus líneas en orden
+        devueltos = (
+            pd.DataFrame(items_validos, columns=["producto_id", "cantidad"])
+            .groupby("producto_id", sort=False)["cantidad"].sum()
         )
-    
-    id_devolucion = f"DEV{len(st.session_state.devoluciones) + 1:03d}"
-    
-    nueva_devolucion = pd.DataFrame(
-        [[id_devolucion, venta_id, datetime.now().strftime("%Y-%m-%d %H:%M"),
-          str(items_devolucion), motivo, "procesada"]],
-        columns=["ID_Devolucion", "ID_Venta", "Fecha", "Items", "Motivo", "Estado"]
-    )
-    
-    st.session_state.devoluciones = pd.concat(
-        [st.session_state.devoluciones, nueva_devolucion],
-        ignore_index=True
-    )
-    
+        lineas = lineas[lineas["Producto_ID"].isin(devueltos.index)]
+        anteriores = lineas.groupby("Producto_ID", sort=False)["Pendiente"].cumsum() - lineas["Pendiente"]
+        asignado = (lineas["Producto_ID"].map(devueltos).astype("int64") - anteriores).clip(
+            lower=0, upper=lineas["Pendiente"]
+        )
+        lineas = lineas[asignado > 0]
+        actualizar_filas("venta_items", lineas["ID_Item"], {
+            "Devuelto": (lineas["Devuelto"] + asignado[asignado > 0]).tolist()
+        })
+        
+        # Registrar en historial de devoluciones
+        id_devolucion = reservar_id("devoluciones")
+        
+        insertar_fila("devoluciones", {
+            "ID_Devolucion": id_devolucion,
+            "ID_Venta": venta_id,
+            "Fecha": datetime.now().strftime("%Y-%m-%d %H:%M"),
+            "Items": str(items_validos),
+            "Motivo": motivo,
+            "Estado": "procesada"
+        })
+        
     return True
 
 def obtener_devoluciones():
@@ -338,9 +828,4 @@ def obtener_devoluciones():
     Returns:
         DataFrame: Todas las devoluciones
     """
-    if "devoluciones" not in st.session_state:
-        st.session_state.devoluciones = pd.DataFrame(
-            columns=["ID_Devolucion", "ID_Venta", "Fecha", "Items", "Motivo", "Estado"]
-        )
-    
-    return st.session_state.devoluciones
+    return get_devoluciones()
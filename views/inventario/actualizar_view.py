@@ -3,7 +3,7 @@ Vista de Actualización de Productos
 """
 import streamlit as st
 from data_manager import get_inventario
-from inventario_crud import actualizar_producto
+from inventario_crud import actualizar_producto, ConflictoVersion
 from config import CATEGORIAS
 
 def mostrar():
@@ -16,6 +16,9 @@ def mostrar():
     if ids:
         col1, col2 = st.columns([2, 1])
         
+        # Versión del producto que se mostró en el formulario (la de la ejecución anterior)
+        leido = st.session_state.get("producto_leido")
+        
         with col1:
             id_sel = st.selectbox("🔍 Selecciona un producto por ID", ids)
             producto = inventario[inventario["ID"] == id_sel].iloc[0]
@@ -51,9 +54,16 @@ def mostrar():
             st.metric("💎 Valor Total", f"S/{float(producto['Precio']) * int(producto['Cantidad']):.2f}")
         
         if submit:
-            actualizar_producto(id_sel, nombre, categoria, cantidad, precio)
-            st.markdown('<div class="success-message">✅ Producto actualizado correctamente.</div>', 
-                       unsafe_allow_html=True)
-            st.rerun()
+            version = leido[1] if leido and leido[0] == id_sel else int(producto["Version"])
+            try:
+                actualizar_producto(id_sel, nombre, categoria, cantidad, precio, version=version)
+                st.markdown('<div class="success-message">✅ Producto actualizado correctamente.</div>', 
+                           unsafe_allow_html=True)
+                st.rerun()
+            except ConflictoVersion:
+                st.error("⚠️ El producto cambió mientras lo editabas (p. ej. se vendieron unidades). "
+                         "Revisa los datos actuales y vuelve a guardar.")
+        
+        st.session_state.producto_leido = (id_sel, int(producto["Version"]))
     else:
         st.info("📭 No hay productos en el inventario para actualizar.")
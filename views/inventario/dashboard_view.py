@@ -90,7 +90,8 @@ def mostrar():
                     "Precio",
                     help="Precio por unidad",
                     format="S/%.2f"
-                )
+                ),
+                "Version": None  # columna interna de control de concurrencia
             }
         )
         
@@ -47,9 +47,9 @@ def mostrar():
     if submit:
         if nombre:
             # Usar el ID generado automáticamente
-            registrar_producto(id_producto_auto, nombre, categoria, cantidad, precio)
+            id_asignado = registrar_producto(id_producto_auto, nombre, categoria, cantidad, precio)
             st.markdown(
-                '<div class="success-message">✅ Producto agregado correctamente con ID: <strong>' + id_producto_auto + '</strong></div>', 
+                '<div class="success-message">✅ Producto agregado correctamente con ID: <strong>' + id_asignado + '</strong></div>', 
                 unsafe_allow_html=True
             )
             st.balloons()
@@ -60,6 +60,7 @@ def mostrar():
         # Distribución por categorías
         st.markdown("### 📊 Distribución por Categorías")
         categoria_counts = inventario['Categoría'].value_counts()
+        categoria_counts = categoria_counts[categoria_counts > 0]
         max_count = categoria_counts.max()
         
         for categoria, count in categoria_counts.items():
@@ -110,7 +111,8 @@ def mostrar():
                         help="⚠️ Stock bajo - requiere reabastecimiento",
                         format="%d unidades"
                     ),
-                    "Precio": st.column_config.NumberColumn("Precio", format="S/%.2f")
+                    "Precio": st.column_config.NumberColumn("Precio", format="S/%.2f"),
+                    "Version": None  # columna interna de control de concurrencia
                 }
             )
         else:
@@ -118,11 +120,11 @@ def mostrar():
         
         # Análisis por categoría
         st.markdown("### 📈 Análisis por Categoría")
-        analisis_categoria = inventario.groupby('Categoría').agg({
+        analisis_categoria = inventario.groupby('Categoría', observed=True).agg({
             'Cantidad': 'sum',
             'Precio': 'mean'
         }).round(2)
-        analisis_categoria['Valor_Categoria'] = inventario.groupby('Categoría').apply(
+        analisis_categoria['Valor_Categoria'] = inventario.groupby('Categoría', observed=True).apply(
             lambda x: (x['Cantidad'] * x['Precio']).sum()
         ).round(2)
         
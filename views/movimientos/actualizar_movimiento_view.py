@@ -5,6 +5,7 @@ import streamlit as st
 import pandas as pd
 from data_manager import get_movimientos, get_inventario
 from movimientos_crud import actualizar_movimiento
+from utils import formatear_fecha
 
 def mostrar():
     """Muestra el formulario de actualización de movimientos"""
@@ -42,7 +43,7 @@ def mostrar():
                 
                 with col_form2:
                     cantidad = st.number_input("📊 Cantidad", value=int(movimiento["Cantidad"]), step=1)
-                    fecha = st.date_input("📅 Fecha", value=pd.to_datetime(movimiento["Fecha"]).date())
+                    fecha = st.date_input("📅 Fecha", value=movimiento["Fecha"].date() if pd.notna(movimiento["Fecha"]) else "today")
                 
                 observaciones = st.text_area("📝 Observaciones", value=movimiento["Observaciones"])
                 
@@ -57,7 +58,7 @@ def mostrar():
             
             **Cantidad:** {movimiento['Cantidad']}
             
-            **Fecha:** {movimiento['Fecha']}
+            **Fecha:** {formatear_fecha(movimiento['Fecha'])}
             
             **Usuario:** {movimiento['Usuario']}
             """)
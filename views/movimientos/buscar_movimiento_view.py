@@ -2,33 +2,46 @@
 Vista de Búsqueda de Movimientos
 """
 import streamlit as st
-from data_manager import get_movimientos
+from movimientos_crud import buscar_movimientos
+
+MOVIMIENTOS_POR_PAGINA = 50
 
 def mostrar():
     """Muestra la interfaz de búsqueda de movimientos"""
     st.markdown("## 🔍 Buscar Movimiento")
     
-    movimientos = get_movimientos()
     col1, col2 = st.columns([2, 1])
     
     with col1:
         busqueda = st.text_input("🔎 Ingrese ID de movimiento, tipo, producto o fecha:")
+        solo_prefijo = st.checkbox("Solo coincidencias al inicio de la palabra")
         
         if busqueda:
-            resultados = movimientos[
-                movimientos["ID_Movimiento"].str.contains(busqueda, case=False, na=False) |
-                movimientos["Tipo"].str.contains(busqueda, case=False, na=False) |
-                movimientos["Producto_ID"].str.contains(busqueda, case=False, na=False) |
-                movimientos["Producto_Nombre"].str.contains(busqueda, case=False, na=False) |
-                movimientos["Fecha"].str.contains(busqueda, case=False, na=False) |
-                movimientos["Usuario"].str.contains(busqueda, case=False, na=False)
-            ]
+            clave_pagina = "pagina_busqueda_movimientos"
+            pagina = st.session_state.get(clave_pagina, 1)
+            resultados, total = buscar_movimientos(
+                busqueda, pagina=pagina, por_pagina=MOVIMIENTOS_POR_PAGINA, prefijo=solo_prefijo
+            )
             
-            if not resultados.empty:
-                st.success(f"✅ Se encontraron {len(resultados)} movimientos que coinciden con '{busqueda}'.")
+            if total:
+                paginas = (total - 1) // MOVIMIENTOS_POR_PAGINA + 1
+                if pagina > paginas:
+                    # La búsqueda cambió y la página guardada ya no existe
+                    pagina = st.session_state[clave_pagina] = paginas
+                    resultados, _ = buscar_movimientos(
+                        busqueda, pagina=pagina, por_pagina=MOVIMIENTOS_POR_PAGINA, prefijo=solo_prefijo
+                    )
+                
+                st.success(f"✅ Se encontraron {total} movimientos que coinciden con '{busqueda}'.")
+                
+                if paginas > 1:
+                    st.number_input(
+                        f"Página (de {paginas})", min_value=1, max_value=paginas, step=1, key=clave_pagina
+                    )
                 
+                # Ya vienen ordenados por fecha, de la más reciente a la más antigua
                 st.dataframe(
-                    resultados.sort_values('Fecha', ascending=False),
+                    resultados,
                     use_container_width=True,
                     hide_index=True,
                     column_config={
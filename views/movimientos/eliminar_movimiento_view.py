@@ -4,6 +4,7 @@ Vista de Eliminación de Movimientos
 import streamlit as st
 from data_manager import get_movimientos
 from movimientos_crud import eliminar_movimiento
+from utils import formatear_fecha
 
 def mostrar():
     """Muestra la interfaz de eliminación de movimientos"""
@@ -26,7 +27,7 @@ def mostrar():
                 <h4>🏷️ {movimiento['ID_Movimiento']} - {movimiento['Tipo']}</h4>
                 <p><strong>Producto:</strong> {movimiento['Producto_Nombre']} ({movimiento['Producto_ID']})</p>
                 <p><strong>Cantidad:</strong> {movimiento['Cantidad']} unidades</p>
-                <p><strong>Fecha:</strong> {movimiento['Fecha']}</p>
+                <p><strong>Fecha:</strong> {formatear_fecha(movimiento['Fecha'])}</p>
                 <p><strong>Usuario:</strong> {movimiento['Usuario']}</p>
                 <p><strong>Observaciones:</strong> {movimiento['Observaciones'] if movimiento['Observaciones'] else 'Sin observaciones'}</p>
             </div>
@@ -6,6 +6,7 @@ import pandas as pd
 from datetime import datetime
 from data_manager import get_promociones, get_inventario
 from promociones_crud import actualizar_promocion, obtener_promocion_por_id
+from utils import formatear_fecha
 
 def mostrar():
     """Muestra el formulario de actualización de promociones"""
@@ -86,12 +87,12 @@ def mostrar():
                     # Fechas
                     fecha_inicio = st.date_input(
                         "📅 Fecha de inicio",
-                        value=pd.to_datetime(promo["Fecha_Inicio"]).date()
+                        value=promo["Fecha_Inicio"].date() if pd.notna(promo["Fecha_Inicio"]) else "today"
                     )
                     
                     fecha_fin = st.date_input(
                         "📅 Fecha de fin",
-                        value=pd.to_datetime(promo["Fecha_Fin"]).date()
+                        value=promo["Fecha_Fin"].date() if pd.notna(promo["Fecha_Fin"]) else "today"
                     )
                     
                     # Estado
@@ -114,13 +115,13 @@ def mostrar():
         
         **Producto:** {promo['Producto_Nombre']}
         
-        **Vigencia:** {promo['Fecha_Inicio']} - {promo['Fecha_Fin']}
+        **Vigencia:** {formatear_fecha(promo['Fecha_Inicio'])} - {formatear_fecha(promo['Fecha_Fin'])}
         
         **Estado:** {promo['Estado']}
         """)
         
         # Verificar si está vigente
-        fecha_actual = datetime.now().strftime("%Y-%m-%d")
+        fecha_actual = pd.Timestamp(datetime.now().date())
         if (promo['Estado'] == 'activa' and 
             promo['Fecha_Inicio'] <= fecha_actual <= promo['Fecha_Fin']):
             st.success("✅ Esta promoción está vigente")
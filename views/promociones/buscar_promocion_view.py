@@ -5,6 +5,7 @@ import streamlit as st
 from datetime import datetime
 from data_manager import get_promociones, get_inventario
 from promociones_crud import buscar_promociones
+from utils import formatear_fecha
 
 def mostrar():
     """Muestra la interfaz de búsqueda de promociones"""
@@ -159,8 +160,8 @@ def mostrar_card_resultado(promo):
             </div>
             <div>
                 <p><strong>Producto:</strong> {promo['Producto_Nombre']}</p>
-                <p><strong>Inicio:</strong> {promo['Fecha_Inicio']}</p>
-                <p><strong>Fin:</strong> {promo['Fecha_Fin']}</p>
+                <p><strong>Inicio:</strong> {formatear_fecha(promo['Fecha_Inicio'])}</p>
+                <p><strong>Fin:</strong> {formatear_fecha(promo['Fecha_Fin'])}</p>
             </div>
         </div>
     </div>
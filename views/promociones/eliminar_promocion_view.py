@@ -4,6 +4,7 @@ Vista de Eliminación de Promociones
 import streamlit as st
 from data_manager import get_promociones
 from promociones_crud import eliminar_promocion, obtener_promocion_por_id
+from utils import formatear_fecha
 
 def mostrar():
     """Muestra la interfaz de eliminación de promociones"""
@@ -49,8 +50,8 @@ def mostrar():
                     </div>
                     <div>
                         <p><strong>Producto:</strong> {promo['Producto_Nombre']} ({promo['Producto_ID']})</p>
-                        <p><strong>Inicio:</strong> {promo['Fecha_Inicio']}</p>
-                        <p><strong>Fin:</strong> {promo['Fecha_Fin']}</p>
+                        <p><strong>Inicio:</strong> {formatear_fecha(promo['Fecha_Inicio'])}</p>
+                        <p><strong>Fin:</strong> {formatear_fecha(promo['Fecha_Fin'])}</p>
                     </div>
                 </div>
             </div>
@@ -5,6 +5,7 @@ import streamlit as st
 from data_manager import get_promociones
 from promociones_crud import obtener_estadisticas_promociones, obtener_promociones_activas
 from datetime import datetime
+from utils import formatear_fecha
 
 def mostrar():
     """Muestra el dashboard de promociones"""
@@ -148,7 +149,7 @@ def mostrar_card_promocion(promo, vigente=False):
         valor_texto = f"S/ {promo['Valor']:.2f} OFF"
     
     # Verificar si está por vencer (menos de 3 días)
-    fecha_fin = datetime.strptime(promo['Fecha_Fin'], "%Y-%m-%d")
+    fecha_fin = promo['Fecha_Fin']
     dias_restantes = (fecha_fin - datetime.now()).days
     
     alerta_vencimiento = ""
@@ -161,7 +162,7 @@ def mostrar_card_promocion(promo, vigente=False):
         <p><strong>Tipo:</strong> {promo['Tipo']}</p>
         <p><strong>Descuento:</strong> {valor_texto}</p>
         <p><strong>Producto:</strong> {promo['Producto_Nombre']} ({promo['Producto_ID']})</p>
-        <p><strong>Vigencia:</strong> {promo['Fecha_Inicio']} hasta {promo['Fecha_Fin']}</p>
+        <p><strong>Vigencia:</strong> {formatear_fecha(promo['Fecha_Inicio'])} hasta {formatear_fecha(promo['Fecha_Fin'])}</p>
         <p><strong>Estado:</strong> <span style="color: {'#28a745' if promo['Estado'] == 'activa' else '#dc3545'}; font-weight: bold;">{promo['Estado'].upper()}</span></p>
         {alerta_vencimiento}
     </div>
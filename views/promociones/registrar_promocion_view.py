@@ -2,11 +2,16 @@
 Vista de Registro de Promociones
 """
 import streamlit as st
+import pandas as pd
 from datetime import datetime, timedelta
+from config import TIPOS_PROMOCION
 from data_manager import get_inventario
-from promociones_crud import crear_promocion
+from promociones_crud import crear_promocion, simular_promociones, validar_calendario_promociones
 from utils import generar_id_promocion
 
+# Columnas del CSV de un calendario de promociones ("estado" es opcional)
+COLUMNAS_CALENDARIO = ["nombre", "tipo", "valor", "producto_id", "fecha_inicio", "fecha_fin"]
+
 def mostrar():
     """Muestra el formulario de registro de promociones"""
     st.markdown("## ➕ Registrar Nueva Promoción")
@@ -22,8 +27,13 @@ def mostrar():
     
     col1, col2 = st.columns([2, 1])
     
+    # El formulario no se limpia al enviarse (simular debe conservar lo
+    # escrito); se reinicia cambiando su clave después de crear la promoción
+    if "version_form_promocion" not in st.session_state:
+        st.session_state.version_form_promocion = 0
+    
     with col1:
-        with st.form("form_registrar_promocion", clear_on_submit=True):
+        with st.form(f"form_registrar_promocion_{st.session_state.version_form_promocion}"):
             st.markdown("### 📝 Información de la Promoción")
             
             # Mostrar ID que se asignará
@@ -90,7 +100,19 @@ def mostrar():
                     index=0
                 )
             
-            submit = st.form_submit_button("✅ Crear Promoción", use_container_width=True)
+            meses_simulacion = st.number_input(
+                "🧪 Meses de historial para simular",
+                min_value=1,
+                max_value=24,
+                value=3,
+                help="Recalcula las ventas de este periodo con la promoción para estimar su costo"
+            )
+            
+            col_btn1, col_btn2 = st.columns(2)
+            with col_btn1:
+                submit = st.form_submit_button("✅ Crear Promoción", use_container_width=True)
+            with col_btn2:
+                simular = st.form_submit_button("🧪 Simular Impacto", use_container_width=True)
     
     with col2:
         st.markdown("### 💡 Tipos de Promoción")
@@ -110,9 +132,30 @@ def mostrar():
         - El ID se genera automáticamente
         - Verifica que las fechas sean correctas
         - Las promociones activas se aplican automáticamente en ventas
-        - Puedes tener múltiples promociones por producto
+        - Puedes tener múltiples promociones por producto, en fechas que no se crucen
         """)
     
+    if simular:
+        resultado = simular_promociones(
+            [{"nombre": nombre or "Nueva promoción", "tipo": tipo, "valor": valor, "producto_id": producto_id}],
+            meses=meses_simulacion
+        )
+        
+        st.markdown(f"### 🧪 Impacto en los últimos {meses_simulacion} meses")
+        col_sim1, col_sim2, col_sim3 = st.columns(3)
+        with col_sim1:
+            st.metric("Líneas afectadas", resultado["lineas_afectadas"],
+                     delta=f"{resultado['ventas_afectadas']} ventas", delta_color="off")
+        with col_sim2:
+            st.metric("Descuento", f"S/{resultado['descuento_simulado']:,.2f}",
+                     delta=f"S/{resultado['delta_descuento']:,.2f}", delta_color="inverse")
+        with col_sim3:
+            st.metric("Ingresos", f"S/{resultado['ingresos_simulados']:,.2f}",
+                     delta=f"S/{resultado['delta_ingresos']:,.2f}")
+        
+        if resultado["lineas_afectadas"] == 0:
+            st.info("📭 Ninguna venta del periodo habría recibido esta promoción.")
+    
     if submit:
         if nombre:
             # Preparar datos usando el ID automático
@@ -134,9 +177,70 @@ def mostrar():
                     unsafe_allow_html=True
                 )
                 st.balloons()
+                st.session_state.version_form_promocion += 1
                 st.rerun()
         else:
             st.markdown(
                 '<div class="error-message">❌ Debes completar el nombre de la promoción.</div>',
                 unsafe_allow_html=True
             )
+    
+    st.markdown("---")
+    mostrar_importar_calendario()
+
+def mostrar_importar_calendario():
+    """Importa un calendario de promociones desde un CSV; se valida completo antes de crear nada"""
+    with st.expander("📅 Importar calendario de promociones (CSV)"):
+        st.caption(
+            f"Columnas: {', '.join(COLUMNAS_CALENDARIO)} (fechas AAAA-MM-DD) y, "
+            "opcionalmente, estado (activa por defecto)"
+        )
+        archivo = st.file_uploader("📄 Archivo CSV", type="csv", key="calendario_promociones")
+        if archivo is None:
+            return
+        
+        try:
+            tabla = pd.read_csv(archivo, dtype=str, keep_default_na=False)
+        except (ValueError, pd.errors.ParserError):
+            st.error("❌ No se pudo leer el archivo CSV.")
+            return
+        
+        faltantes = [columna for columna in COLUMNAS_CALENDARIO if columna not in tabla.columns]
+        if faltantes:
+            st.error(f"❌ Faltan columnas en el archivo: {', '.join(faltantes)}")
+            return
+        
+        calendario = tabla.to_dict("records")
+        for datos in calendario:
+            datos["estado"] = datos.get("estado") or "activa"
+        
+        problemas = validar_calendario_promociones(calendario)
+        for fila, datos in enumerate(calendario, start=1):
+            motivo = None
+            if datos["tipo"] not in TIPOS_PROMOCION:
+                motivo = f"Tipo inválido: {datos['tipo']}"
+            else:
+                try:
+                    datos["valor"] = float(datos["valor"] or 0)
+                except ValueError:
+                    motivo = f"Valor inválido: {datos['valor']}"
+            if motivo:
+                problemas.append({
+                    "fila": fila, "nombre": datos["nombre"],
+                    "producto_id": datos["producto_id"], "motivo": motivo
+                })
+        
+        if problemas:
+            st.error(f"❌ El calendario tiene {len(problemas)} problema(s). Corrígelos y vuelve a subirlo.")
+            st.dataframe(
+                pd.DataFrame(problemas).sort_values("fila", kind="stable"),
+                use_container_width=True, hide_index=True
+            )
+            return
+        
+        st.success(f"✅ {len(calendario)} promociones sin cruces entre sí ni con las registradas.")
+        if st.button("📥 Importar calendario", use_container_width=True):
+            creadas = sum(
+                crear_promocion({**datos, "id": generar_id_promocion()}) for datos in calendario
+            )
+            st.success(f"✅ Se importaron {creadas} de {len(calendario)} promociones.")
@@ -5,6 +5,7 @@ import streamlit as st
 from datetime import datetime, timedelta
 from ventas_crud import buscar_ventas
 from data_manager import get_ventas
+from utils import formatear_fecha
 
 def mostrar():
     """Muestra la interfaz de búsqueda de ventas"""
@@ -77,7 +78,7 @@ def mostrar():
                 with col1:
                     st.markdown(f"**🆔 {venta['ID']}**")
                 with col2:
-                    st.markdown(f"📅 {venta['Fecha']}")
+                    st.markdown(f"📅 {formatear_fecha(venta['Fecha'], '%Y-%m-%d %H:%M')}")
                 with col3:
                     st.markdown(f"💵 S/{venta['Total_Final']:.2f}")
                 with col4:
@@ -2,8 +2,8 @@
 Vista de Detalle de Venta
 """
 import streamlit as st
-import json
-from ventas_crud import obtener_venta_por_id
+from ventas_crud import obtener_venta_por_id, obtener_items_venta
+from utils import formatear_fecha
 
 def mostrar():
     """Muestra el detalle completo de una venta"""
@@ -19,6 +19,7 @@ def mostrar():
     
     venta_id = st.session_state.venta_detalle_id
     venta = obtener_venta_por_id(venta_id)
+    items = obtener_items_venta(venta_id)
     
     if not venta:
         st.error(f"❌ No se encontró la venta {venta_id}")
@@ -42,21 +43,29 @@ def mostrar():
         st.markdown(f"""
         <div class="product-card" style="border-left: 4px solid #667eea; background: #f8f9ff;">
             <h3>🆔 {venta['ID']}</h3>
-            <p><strong>📅 Fecha:</strong> {venta['Fecha']}</p>
+            <p><strong>📅 Fecha:</strong> {formatear_fecha(venta['Fecha'], '%Y-%m-%d %H:%M')}</p>
             <p><strong>💳 Método de Pago:</strong> {venta['Metodo_Pago'].upper()}</p>
         </div>
         """, unsafe_allow_html=True)
         
         st.markdown("### 🛒 Productos Vendidos")
         
-        # Parsear items (simplificado, en producción usar json.loads)
-        try:
-            items_str = venta['Items']
-            # Nota: En una implementación real, guardaríamos como JSON y haríamos json.loads
-            st.info("💡 Los items se muestran en formato simplificado")
-            st.code(items_str)
-        except:
-            st.warning("⚠️ No se pudieron cargar los items de la venta")
+        if not items.empty:
+            st.dataframe(
+                items[["Producto_ID", "Nombre", "Cantidad", "Precio_Unitario", "Descuento", "Subtotal"]],
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "Producto_ID": st.column_config.TextColumn("ID"),
+                    "Nombre": st.column_config.TextColumn("Producto"),
+                    "Cantidad": st.column_config.NumberColumn("Cantidad"),
+                    "Precio_Unitario": st.column_config.NumberColumn("Precio", format="S/%.2f"),
+                    "Descuento": st.column_config.NumberColumn("Descuento", format="S/%.2f"),
+                    "Subtotal": st.column_config.NumberColumn("Subtotal", format="S/%.2f")
+                }
+            )
+        else:
+            st.warning("⚠️ La venta no tiene productos registrados")
         
         st.markdown("### 💰 Totales")
         
@@ -84,15 +93,19 @@ def mostrar():
         
         st.markdown("### 🧾 Ticket")
         if st.button("🖨️ Generar Ticket", use_container_width=True):
+            lineas = "\n".join(
+                f"{item['Nombre'][:22]:<22} x{item['Cantidad']:<3} S/{item['Subtotal']:.2f}"
+                for _, item in items.iterrows()
+            )
             st.code(f"""
 {'='*40}
           Q'BODEGA
 {'='*40}
 Venta: {venta['ID']}
-Fecha: {venta['Fecha']}
+Fecha: {formatear_fecha(venta['Fecha'], '%Y-%m-%d %H:%M')}
 {'='*40}
 
-[Ver items en la sección principal]
+{lineas}
 
 {'='*40}
 Subtotal:    S/{venta['Total_Bruto']:.2f}
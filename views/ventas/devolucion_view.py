@@ -2,10 +2,11 @@
 Vista de Devoluciones
 """
 import streamlit as st
-import ast
-from ventas_crud import obtener_venta_por_id, procesar_devolucion, obtener_devoluciones
+from ventas_crud import (
+    obtener_venta_por_id, obtener_items_venta, procesar_devolucion, obtener_devoluciones
+)
 from data_manager import get_ventas
-from inventario_crud import obtener_producto
+from utils import formatear_fecha
 
 def mostrar():
     """Muestra la interfaz de devoluciones"""
@@ -30,7 +31,7 @@ def mostrar():
             venta_sel = st.selectbox(
                 "🆔 ID de Venta",
                 ventas_ids,
-                format_func=lambda x: f"{x} - {ventas[ventas['ID']==x]['Fecha'].iloc[0]} (S/{ventas[ventas['ID']==x]['Total_Final'].iloc[0]:.2f})"
+                format_func=lambda x: f"{x} - {formatear_fecha(ventas[ventas['ID']==x]['Fecha'].iloc[0], '%Y-%m-%d %H:%M')} (S/{ventas[ventas['ID']==x]['Total_Final'].iloc[0]:.2f})"
             )
             
             if venta_sel:
@@ -41,7 +42,7 @@ def mostrar():
                 
                 col_v1, col_v2, col_v3 = st.columns(3)
                 with col_v1:
-                    st.metric("Fecha", venta['Fecha'])
+                    st.metric("Fecha", formatear_fecha(venta['Fecha'], '%Y-%m-%d %H:%M'))
                 with col_v2:
                     st.metric("Total", f"S/{venta['Total_Final']:.2f}")
                 with col_v3:
@@ -50,15 +51,13 @@ def mostrar():
                 st.markdown("---")
                 st.markdown("### 🔄 Items a Devolver")
                 
-                # Parsear items de la venta (simplificado)
+                # Productos vendidos en la venta seleccionada
                 try:
-                    items_str = venta['Items']
-                    # En producción, usar json.loads
+                    items_venta = obtener_items_venta(venta_sel).set_index("Producto_ID")
+                    items_venta["Disponible"] = items_venta["Cantidad"] - items_venta["Devuelto"]
+                    items_venta = items_venta[items_venta["Disponible"] > 0]
                     st.info("💡 Selecciona los productos a devolver")
                     
-                    # Simulación de items (en producción, parsear correctamente)
-                    # Por ahora, permitir selección manual
-                    
                     st.markdown("#### Seleccionar productos")
                     
                     # Inicializar carrito de devolución
@@ -69,32 +68,36 @@ def mostrar():
                     col_prod, col_cant, col_btn = st.columns([3, 1, 1])
                     
                     with col_prod:
-                        # Nota: En producción, obtener productos de la venta original
-                        from data_manager import get_inventario
-                        inventario = get_inventario()
-                        productos_disp = inventario["ID"].tolist()
-                        
                         producto_dev = st.selectbox(
                             "Producto",
-                            productos_disp,
-                            format_func=lambda x: f"{x} - {inventario[inventario['ID']==x]['Nombre'].iloc[0]}"
+                            items_venta.index.tolist(),
+                            format_func=lambda x: f"{x} - {items_venta.at[x, 'Nombre']} (por devolver: {items_venta.at[x, 'Disponible']})"
                         )
                     
                     with col_cant:
-                        cantidad_dev = st.number_input("Cantidad", min_value=1, value=1, step=1)
+                        # Lo que ya está en el carrito también cuenta contra lo disponible
+                        en_carrito = sum(
+                            item["cantidad"] for item in st.session_state.carrito_devolucion
+                            if item["producto_id"] == producto_dev
+                        )
+                        cantidad_max = int(items_venta.at[producto_dev, "Disponible"]) - en_carrito if producto_dev else 0
+                        cantidad_dev = st.number_input(
+                            "Cantidad", min_value=1, max_value=max(cantidad_max, 1), value=1, step=1,
+                            disabled=cantidad_max <= 0
+                        )
                     
                     with col_btn:
                         st.markdown("<br>", unsafe_allow_html=True)
-                        if st.button("➕ Agregar"):
-                            producto_info = obtener_producto(producto_dev)
+                        if st.button("➕ Agregar", disabled=cantidad_max <= 0) and producto_dev:
+                            nombre = items_venta.at[producto_dev, "Nombre"]
                             
                             st.session_state.carrito_devolucion.append({
                                 "producto_id": producto_dev,
-                                "nombre": producto_info["Nombre"],
+                                "nombre": nombre,
                                 "cantidad": cantidad_dev,
                                 "motivo": ""
                             })
-                            st.success(f"✅ {producto_info['Nombre']} agregado a devolución")
+                            st.success(f"✅ {nombre} agregado a devolución")
                             st.rerun()
                     
                     # Mostrar carrito de devolución
@@ -1,6 +1,7 @@
 """
 Vista de Registro de Ventas
 """
+import uuid
 import streamlit as st
 from datetime import datetime
 from data_manager import get_inventario
@@ -22,6 +23,10 @@ def mostrar():
     if "carrito" not in st.session_state:
         st.session_state.carrito = []
     
+    # Token de idempotencia del checkout actual (cambia al cerrar o cancelar la venta)
+    if "token_venta" not in st.session_state:
+        st.session_state.token_venta = uuid.uuid4().hex
+    
     # Generar ID de venta
     id_venta = generar_id_venta()
     
@@ -153,16 +158,19 @@ def mostrar():
                         "total_descuento": totales["descuento"],
                         "total_final": totales["total"],
                         "metodo_pago": metodo_pago,
-                        "promociones_aplicadas": [p["nombre"] for p in totales["promociones"]]
+                        "promociones_aplicadas": [p["nombre"] for p in totales["promociones"]],
+                        "token": st.session_state.token_venta
                     }
                     
                     # Registrar venta
                     if registrar_venta(venta):
+                        id_venta = venta["id"]
                         st.success(f"✅ Venta {id_venta} registrada exitosamente!")
                         st.balloons()
                         
-                        # Limpiar carrito
+                        # Limpiar carrito y preparar un token para el siguiente checkout
                         st.session_state.carrito = []
+                        st.session_state.token_venta = uuid.uuid4().hex
                         
                         # Mostrar ticket
                         st.markdown("---")
@@ -195,6 +203,7 @@ Método: {metodo_pago.upper()}
             with col_canc:
                 if st.button("❌ Cancelar y Limpiar", use_container_width=True):
                     st.session_state.carrito = []
+                    st.session_state.token_venta = uuid.uuid4().hex
                     st.rerun()
         
         else:
@@ -2,8 +2,13 @@
 Vista del Dashboard de Ventas
 """
 import streamlit as st
+from datetime import datetime, timedelta
 from data_manager import get_ventas
-from ventas_crud import obtener_estadisticas_ventas
+from ventas_crud import (
+    obtener_estadisticas_ventas, obtener_productos_mas_vendidos,
+    obtener_resumen_ventas, reconstruir_resumen_ventas
+)
+from utils import formatear_fecha
 
 def mostrar():
     """Muestra el dashboard de ventas con estadísticas"""
@@ -68,6 +73,68 @@ def mostrar():
     
     st.markdown("---")
     
+    # Resumen diario por método de pago (rollup, sin recorrer las ventas)
+    st.markdown("### 📈 Ventas de los Últimos 30 Días")
+    
+    hoy = datetime.now().date()
+    resumen = obtener_resumen_ventas(hoy - timedelta(days=29), hoy)
+    
+    if not resumen.empty:
+        por_dia = resumen.pivot_table(
+            index="Fecha", columns="Metodo_Pago", values="Neto_Final",
+            aggfunc="sum", observed=True
+        )
+        st.bar_chart(por_dia)
+        
+        por_metodo = resumen.groupby("Metodo_Pago", observed=True)[
+            ["Ventas", "Bruto", "Descuento", "Devuelto", "Neto_Final"]
+        ].sum().reset_index()
+        st.dataframe(
+            por_metodo,
+            use_container_width=True,
+            hide_index=True,
+            column_config={
+                "Metodo_Pago": st.column_config.TextColumn("Método de Pago"),
+                "Bruto": st.column_config.NumberColumn("Bruto", format="S/%.2f"),
+                "Descuento": st.column_config.NumberColumn("Descuento", format="S/%.2f"),
+                "Devuelto": st.column_config.NumberColumn("Devuelto", format="S/%.2f"),
+                "Neto_Final": st.column_config.NumberColumn("Neto", format="S/%.2f")
+            }
+        )
+    else:
+        st.info("📭 Sin ventas en los últimos 30 días.")
+    
+    if st.button("🔄 Reconstruir resumen desde el historial"):
+        reconstruir_resumen_ventas()
+        st.rerun()
+    
+    st.markdown("---")
+    
+    # Productos más vendidos (contadores incrementales, sin recorrer el historial)
+    st.markdown("### 🏆 Productos Más Vendidos")
+    
+    tab_hoy, tab_mes, tab_total = st.tabs(["📅 Hoy", "📆 Este Mes", "📊 Histórico"])
+    
+    for tab, periodo in ((tab_hoy, "dia"), (tab_mes, "mes"), (tab_total, "total")):
+        with tab:
+            top = obtener_productos_mas_vendidos(limite=5, periodo=periodo)
+            if top:
+                st.dataframe(
+                    top,
+                    use_container_width=True,
+                    hide_index=True,
+                    column_config={
+                        "producto_id": st.column_config.TextColumn("ID"),
+                        "nombre": st.column_config.TextColumn("Producto"),
+                        "cantidad": st.column_config.NumberColumn("Unidades"),
+                        "ingresos": st.column_config.NumberColumn("Ingresos", format="S/%.2f")
+                    }
+                )
+            else:
+                st.info("📭 Sin ventas en este periodo.")
+    
+    st.markdown("---")
+    
     # Botón para nueva venta
     if st.button("➕ Registrar Nueva Venta", use_container_width=True, type="primary"):
         st.session_state.menu_principal = "registrar_venta"
@@ -81,8 +148,8 @@ def mostrar():
     if not ventas.empty:
         st.markdown("### 📋 Últimas Ventas")
         
-        # Ordenar por fecha descendente
-        ventas_ordenadas = ventas.sort_values('Fecha', ascending=False).head(10)
+        # Las 10 más recientes (selección parcial, sin ordenar toda la tabla)
+        ventas_ordenadas = ventas.nlargest(10, 'Fecha')
         
         for _, venta in ventas_ordenadas.iterrows():
             col1, col2, col3, col4 = st.columns([2, 2, 2, 1])
@@ -90,7 +157,7 @@ def mostrar():
             with col1:
                 st.markdown(f"**🆔 {venta['ID']}**")
             with col2:
-                st.markdown(f"📅 {venta['Fecha']}")
+                st.markdown(f"📅 {formatear_fecha(venta['Fecha'], '%Y-%m-%d %H:%M')}")
             with col3:
                 st.markdown(f"💵 S/{venta['Total_Final']:.2f}")
             with col4: